@@ -4,10 +4,20 @@ from math_verify import parse, verify
 import pandas
 from datasets import load_dataset
 import random
+
+from verl.utils.reward_score import get_grade_cache, get_grader_pool, grade_pairs, make_key
 ANSWER_PATTERN_MULTICHOICE = r"(?:\$\$\s*)?\\boxed\{[^}]*?([A-Z])[^}]*\}(?:\s*\$\$)?|(?:\*{0,2}\s*)?(?:Final|Correct)\s*Answer:\s*([A-Z])\."
 ANSWER_PATTERN = r"(?i)Answer\s*:\s*([^\n]+)"
 ANSWER_PATTERN_BOXED = r"(?i)\\boxed\s*{([^\n]+)}"
 
+def _math_verify_equal(answer: str, response_answer: str) -> bool:
+    return verify(parse(answer), parse(response_answer))
+
+
+def _math_verify_key(answer: str, response_answer: str) -> str:
+    return make_key("math_verify", answer, response_answer)
+
+
 class DatasetHandler(ABC):
     def __init__(self, answer_pattern: str = ANSWER_PATTERN_BOXED, num_examples: int = None):
         self.answer_pattern = answer_pattern
@@ -39,15 +49,24 @@ class DatasetHandler(ABC):
             return False
         if self.answer_pattern == ANSWER_PATTERN_MULTICHOICE:
             return response_answer == answer
-        return verify(parse(answer), parse(response_answer))
+        # math_verify verdicts are cached across runs, keyed on the raw (gold, prediction) strings
+        return get_grade_cache().cached_call(
+            _math_verify_key(answer, response_answer),
+            lambda: _math_verify_equal(answer, response_answer),
+        )
 
     def get_score(self, responses: str, answers: str) -> float:
-        scores = []
-        for r,a in zip(responses, answers):
-            if self.compare_answer(r,a):
-                scores.append(1)
-            else:
-                scores.append(0)
+        if self.answer_pattern == ANSWER_PATTERN_MULTICHOICE:
+            scores = [1 if self.compare_answer(r, a) else 0 for r, a in zip(responses, answers)]
+        else:
+            # math_verify runs on the process-isolated pool: a stuck parse/verify is killed after 10s
+            pairs = [(str(a), str(self.extract_answer(r))) for r, a in zip(responses, answers)]
+            verdicts = grade_pairs(
+                pairs, _math_verify_equal, _math_verify_key,
+                pool=get_grader_pool(), cache=get_grade_cache(), timeout=10
+            )
+            scores = [1 if verdict else 0 for verdict in verdicts]
+        print(f"[grade_cache] {get_grade_cache().metrics()}, [grader_pool] {get_grader_pool().stats()}")
         return scores, sum(scores)/len(scores)
 
 class MathDatasetHandler(DatasetHandler):
@@ -18,46 +18,21 @@ import json
 from mathruler.grader import extract_boxed_content, grade_answer
 import os
 import time
-import random
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
 
-STORAGE_PATH = os.getenv("STORAGE_PATH")
-
-def generate_temp_filename(prefix="temp", suffix=".json"):
-    timestamp = int(time.time() * 1000) 
-    rand_part = random.randint(0, 99999)
-    return f"{STORAGE_PATH}/temp_results/{prefix}_{timestamp}_{rand_part}{suffix}"
-def split_list(lst, n=4):
-    k, m = divmod(len(lst), n)
-    return [lst[i*k + min(i, m):(i+1)*k + min(i+1, m)] for i in range(n)]
-
-os.environ["NO_PROXY"] = "0.0.0.0,127.0.0.1"
-
-def fetch(index,i):
-    response = requests.get(f"http://0.0.0.0:{5000+index}/hello?name={i}")
-    print(response)
-    return True
+# 添加项目根目录到Python路径，以便导入 vllm_service_init.client
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from vllm_service_init.client import dispatch_graded, get_solver_servers
 
-def generate_results(data):
-    datas = split_list(data,4)
-    random_names = [generate_temp_filename(prefix=f"temp_{i}", suffix=".json") for i in range(4)]
-    for i in range(4):
-        with open(random_names[i],'w') as f:
-            json.dump(datas[i],f,indent=4)
-
-    final_results = []
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        futures = [executor.submit(fetch, i,random_names[i]) for i in range(4)]
-
-        for future in as_completed(futures):
-            print(future.result())
-
-    for future in as_completed(futures):
-        with open(random_names[i].replace('.json','_results.json'),'r') as f:
-            final_results.extend(json.load(f))
+STORAGE_PATH = os.getenv("STORAGE_PATH")
 
-    return final_results
+def generate_results(data, solver_servers=None):
+    # 结果通过 /generate 的 NDJSON 流返回，失败时回退到 STORAGE_PATH 临时文件
+    # 服务器列表来自 solver_servers 参数 / SOLVER_SERVERS 环境变量，默认端口 5000, 5001, 5002, 5003
+    # 小块动态分发（work stealing），慢的服务器自动少拿，失败的块会换服务器重试
+    # 所有服务器都没能判分的题目不能当作格式错误（-1）处理：等待后整体重发，仍失败则报错终止该步
+    servers = get_solver_servers(solver_servers, default_ports=(5000, 5001, 5002, 5003))
+    return dispatch_graded(data, servers, storage_path=STORAGE_PATH)
 
 def format_reward(predict: str) -> float:
     pattern = re.compile(r"<think>.*</think>.*\\boxed\{.*\}.*", re.DOTALL)
@@ -70,7 +45,7 @@ def accuracy_reward(predict: str, ground_truth: str) -> float:
     return 1.0 if grade_answer(answer, ground_truth) else 0.0
 
 
-def compute_score(predicts: List[str], ground_truths: List[str], format_weight: float = 0.1, file_path: str = "") -> List[Dict[str, float]]:
+def compute_score(predicts: List[str], ground_truths: List[str], format_weight: float = 0.1, file_path: str = "", solver_servers: str = None) -> List[Dict[str, float]]:
     results = []
     with open('test.json','w') as f:
         json.dump(predicts,f,indent=4)
@@ -87,7 +62,7 @@ def compute_score(predicts: List[str], ground_truths: List[str], format_weight:
         else:
             results.append({"question": "", "answer": ""})
 
-    final_results = generate_results(results)
+    final_results = generate_results(results, solver_servers)
     scores = [{"overall": min(item["score"],1-item["score"]) if item['question'] else -1,"format": 1 if item['question'] else 0,"accuracy": 1 if item['answer'] else 0} for item in final_results]
     return scores
 
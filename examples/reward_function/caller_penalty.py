@@ -18,16 +18,25 @@ import json
 from mathruler.grader import extract_boxed_content, grade_answer
 import os
 import time
-import random
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
 
 from collections import Counter
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
 from sklearn.cluster import AgglomerativeClustering
 import numpy as np
+# 添加项目根目录到Python路径，以便导入 vllm_service_init.client
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from vllm_service_init.client import dispatch_graded, get_solver_servers
+from verl.utils.reward_score.similarity import (
+    bleu_distance_matrix,
+    bleu_pair_scores,
+    connected_components,
+    lsh_candidate_pairs,
+    minhash_signatures,
+)
 STORAGE_PATH = os.getenv("STORAGE_PATH","/apdcephfs_sh2/share_300000800/user/chengchuang")
 def _bleu_distance_matrix(sentences):
+    # 原始 nltk 逐对实现，仅作为 method="nltk" 的参考实现（benchmark 对照用）
     n = len(sentences)
     dist = np.zeros((n, n))
     smoother = SmoothingFunction().method1
@@ -42,23 +51,71 @@ def _bleu_distance_matrix(sentences):
             dist[i, j] = dist[j, i] = 1 - score
     return dist
 
-def cluster_share_per_problem(
-        problems,
-        distance_threshold: float = 0.5,
-        linkage: str = "average"):
-    if not problems:
-        return []
-    print('start clustering')
-    start_time = time.time()
-    dist_mat = _bleu_distance_matrix(problems)
-
+def _cluster_labels(dist_mat, distance_threshold, linkage):
+    if len(dist_mat) == 1:
+        return np.zeros(1, dtype=np.int64)
     clustering = AgglomerativeClustering(
         n_clusters=None,
         distance_threshold=distance_threshold,
         metric="precomputed",
         linkage=linkage
     )
-    labels = clustering.fit_predict(dist_mat)
+    return clustering.fit_predict(dist_mat)
+
+def _approx_cluster_labels(problems, distance_threshold, linkage, bands=32, max_component=4096):
+    # MinHash/LSH 只挑出可能相似的候选对，只对候选对精确计算 BLEU；
+    # 距离 < 阈值的候选对构成的连通分量之间不会被合并，逐分量聚类即可。
+    # 分量内部按精确 BLEU 距离矩阵聚类，只有超大分量才用候选对距离（非候选对视为 1）
+    n = len(problems)
+    pairs = lsh_candidate_pairs(minhash_signatures(problems), bands=bands)
+    dist = 1 - bleu_pair_scores(problems, pairs)  # i < j: i 为 hypothesis, j 为 reference，与原实现一致
+    close = dist < distance_threshold
+    pairs, dist = pairs[close], dist[close]
+    components = connected_components(n, pairs)
+    labels = np.zeros(n, dtype=np.int64)
+    next_label = 0
+    for component in components:
+        if len(component) == 1:
+            labels[component[0]] = next_label
+            next_label += 1
+            continue
+        if len(component) <= max_component:
+            sub = bleu_distance_matrix([problems[i] for i in component])
+        else:
+            local = {node: k for k, node in enumerate(component)}
+            sub = np.ones((len(component), len(component)))
+            np.fill_diagonal(sub, 0.0)
+            for (i, j), d in zip(pairs, dist):
+                if i in local and j in local:
+                    sub[local[i], local[j]] = sub[local[j], local[i]] = d
+        sub_labels = _cluster_labels(sub, distance_threshold, linkage)
+        labels[component] = sub_labels + next_label
+        next_label += sub_labels.max() + 1
+    return labels
+
+def cluster_share_per_problem(
+        problems,
+        distance_threshold: float = 0.5,
+        linkage: str = "average",
+        method: str = "auto",
+        approx_above: int = 8192):
+    '''
+    method: "exact"  向量化稀疏 n-gram BLEU 距离矩阵（与 nltk 逐对结果一致）
+            "approx" MinHash/LSH 候选对 + 分量内聚类，适合超大 batch
+            "nltk"   原始逐对 sentence_bleu 实现
+            "auto"   batch 不超过 approx_above 时用 exact，否则用 approx
+    '''
+    if not problems:
+        return []
+    if method == "auto":
+        method = "exact" if len(problems) <= approx_above else "approx"
+    print(f'start clustering ({method})')
+    start_time = time.time()
+    if method == "approx":
+        labels = _approx_cluster_labels(problems, distance_threshold, linkage)
+    else:
+        dist_mat = _bleu_distance_matrix(problems) if method == "nltk" else bleu_distance_matrix(problems)
+        labels = _cluster_labels(dist_mat, distance_threshold, linkage)
     print(f'end clustering, time: {time.time() - start_time}')
     total = len(problems)
     cluster_size = Counter(labels)
@@ -67,44 +124,13 @@ def cluster_share_per_problem(
     proportions = [cluster_ratio[lab] for lab in labels]
     return proportions
 
-def generate_temp_filename(prefix="temp", suffix=".json"):
-    timestamp = int(time.time() * 1000) 
-    rand_part = random.randint(0, 99999)
-    return f"{STORAGE_PATH}/temp_results/{prefix}_{timestamp}_{rand_part}{suffix}"
-def split_list(lst, n=4):
-    k, m = divmod(len(lst), n)
-    return [lst[i*k + min(i, m):(i+1)*k + min(i+1, m)] for i in range(n)]
-
-os.environ["NO_PROXY"] = "0.0.0.0,127.0.0.1"
-
-def fetch(index,i):
-    # 使用端口 5000 和 5001（两个 vLLM 服务）
-    response = requests.get(f"http://0.0.0.0:{5000+index}/hello?name={i}")
-    print(response)
-    return True
-
-def generate_results(data):
-    # 使用 2 个 vLLM 服务并行处理
-    num_workers = 2
-    datas = split_list(data, num_workers)
-    random_names = [generate_temp_filename(prefix=f"temp_{i}", suffix=".json") for i in range(num_workers)]
-    for i in range(num_workers):
-        with open(random_names[i],'w') as f:
-            json.dump(datas[i],f,indent=4)
-
-    final_results = []
-    # 并行执行，充分利用 2 个 vLLM 服务
-    with ThreadPoolExecutor(max_workers=num_workers) as executor:
-        futures = [executor.submit(fetch, i, random_names[i]) for i in range(num_workers)]
-        for future in as_completed(futures):
-            print(future.result())
-
-    for i in range(num_workers):
-        with open(random_names[i].replace('.json','_results.json'),'r') as f:
-            final_results.extend(json.load(f))
-    for i in range(num_workers):
-        os.remove(random_names[i].replace('.json','_results.json'))
-    return final_results
+def generate_results(data, solver_servers=None):
+    # 结果通过 /generate 的 NDJSON 流返回，失败时回退到 STORAGE_PATH 临时文件
+    # 服务器列表来自 solver_servers 参数 / SOLVER_SERVERS 环境变量，默认端口 5000, 5001
+    # 小块动态分发（work stealing），慢的服务器自动少拿，失败的块会换服务器重试
+    # 所有服务器都没能判分的题目不能当作 0 分奖励：等待后整体重发，仍失败则报错终止该步
+    servers = get_solver_servers(solver_servers, default_ports=(5000, 5001))
+    return dispatch_graded(data, servers, storage_path=STORAGE_PATH)
 
 def format_reward(predict: str) -> float:
     pattern = re.compile(r"<think>.*</think>.*\\boxed\{.*\}.*", re.DOTALL)
@@ -117,7 +143,7 @@ def accuracy_reward(predict: str, ground_truth: str) -> float:
     return 1.0 if grade_answer(answer, ground_truth) else 0.0
 
 
-def compute_score(predicts: List[str], ground_truths: List[str], format_weight: float = 0.1, file_path: str = "") -> List[Dict[str, float]]:
+def compute_score(predicts: List[str], ground_truths: List[str], format_weight: float = 0.1, file_path: str = "", solver_servers: str = None) -> List[Dict[str, float]]:
     results = []
     with open('test.json','w') as f:
         json.dump(predicts,f,indent=4)
@@ -134,7 +160,7 @@ def compute_score(predicts: List[str], ground_truths: List[str], format_weight:
         else:
             results.append({"question": "", "answer": ""})
 
-    final_results = generate_results(results)
+    final_results = generate_results(results, solver_servers)
     penalty = cluster_share_per_problem([result['question'] for result in final_results], distance_threshold=0.5)
     # print(penalty)
     assert len(penalty) == len(final_results)
@@ -17,6 +17,8 @@ from typing import Dict, List
 
 from mathruler.grader import extract_boxed_content, grade_answer
 
+from verl.utils.reward_score import cached_grade_answer, get_grade_cache, get_grader_pool, grade_answer_key, grade_pairs
+
 
 def format_reward(predict: str) -> float:
     pattern = re.compile(r"<think>.*</think>.*\\boxed\{.*\}.*", re.DOTALL)
@@ -27,17 +29,22 @@ def format_reward(predict: str) -> float:
 def accuracy_reward(predict: str, ground_truth: str) -> float:
     answer = extract_boxed_content(predict)
     try:
-        return 1.0 if grade_answer(answer, ground_truth) else 0.0
+        return 1.0 if cached_grade_answer(answer, ground_truth) else 0.0
     except:
         return 0.0
 
 
 def compute_score(predicts: List[str], ground_truths: List[str], format_weight: float = 0.0) -> List[Dict[str, float]]:
+    predicts = [re.sub(r"\s*(<|>|/)\s*", r"\1", predict) for predict in predicts]  # handle qwen2.5vl-32b format
+    # grade the whole batch at once on the process-isolated pool, a stuck sympy call is killed after 10s
+    pairs = [(extract_boxed_content(predict), ground_truth) for predict, ground_truth in zip(predicts, ground_truths)]
+    verdicts = grade_pairs(
+        pairs, grade_answer, grade_answer_key, pool=get_grader_pool(), cache=get_grade_cache(), timeout=10
+    )
     scores = []
-    for predict, ground_truth in zip(predicts, ground_truths):
-        predict = re.sub(r"\s*(<|>|/)\s*", r"\1", predict)  # handle qwen2.5vl-32b format
+    for predict, verdict in zip(predicts, verdicts):
         format_score = format_reward(predict)
-        accuracy_score = accuracy_reward(predict, ground_truth)
+        accuracy_score = 1.0 if verdict else 0.0
         scores.append(
             {
                 "overall": (1 - format_weight) * accuracy_score + format_weight * format_score,
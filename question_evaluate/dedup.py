@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Description:
+    Deduplication stage between question generation and evaluation. Reads every
+    `{save_name}_{i}.json` written by `question_generate.bash`, and marks the exact and near
+    duplicates among the parsed questions (score 0) across all files, keeping the first
+    occurrence (see `verl.utils.reward_score.dedup`). Marked items get `"duplicate": true` and
+    score -2, so evaluate.py skips them and reports the solver GPU-hours they would have cost.
+
+    `question_evaluate/pipeline.py` runs the same deduplicator on the chunks it streams.
+
+Example Usage:
+    python question_evaluate/dedup.py --save_name my_experiment --method minhash --threshold 0.9
+'''
+
+import argparse
+import json
+import os
+import sys
+
+# 添加项目根目录到Python路径，以便导入 verl.utils.reward_score
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from verl.utils.reward_score import QuestionDeduplicator
+
+STORAGE_PATH = os.getenv("STORAGE_PATH")
+
+
+def add_dedup_arguments(parser):
+    parser.add_argument("--dedup", type=str, default="minhash", choices=["off", "exact", "minhash", "simhash"],
+                        help="exact: normalized text only; minhash/simhash: also near duplicates.")
+    parser.add_argument("--dedup_threshold", type=float, default=0.9,
+                        help="Similarity (MinHash Jaccard or 1 - SimHash hamming / 64) from which questions are near duplicates.")
+
+
+def build_deduplicator(args):
+    return None if args.dedup == "off" else QuestionDeduplicator(args.dedup, args.dedup_threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mark duplicate generated questions before evaluation.")
+    parser.add_argument("--save_name", type=str, required=True)
+    parser.add_argument("--num_files", type=int, default=8, help="Files {save_name}_{i}.json to read, missing ones are skipped.")
+    add_dedup_arguments(parser)
+    args = parser.parse_args()
+
+    deduplicator = build_deduplicator(args)
+    if deduplicator is None:
+        return
+
+    for i in range(args.num_files):
+        path = f"{STORAGE_PATH}/generated_question/{args.save_name}_{i}.json"
+        if not os.path.exists(path):
+            continue
+
+        with open(path) as f:
+            data = json.load(f)
+        candidates = [item for item in data if item.get("score") == 0]
+        kept = set(deduplicator.filter([item["question"] for item in candidates]))
+        for k, item in enumerate(candidates):
+            if k not in kept:
+                item["duplicate"] = True
+                item["score"] = -2
+        with open(path, "w") as f:
+            json.dump(data, f, indent=4)
+        print(f"[dedup] {path}: {len(candidates) - len(kept)}/{len(candidates)} questions marked as duplicates")
+
+    print(f"[dedup] {deduplicator.metrics()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,14 +7,24 @@ Description:
     The script is designed to run as a batch job, often in parallel across multiple GPUs.
 
 Refactoring Notes:
-    - Replaced 'timeout-decorator' with the thread-safe 'stopit' library to provide robust
-      timeout protection for the grading function without causing errors.
-    - Optimized the answer comparison logic to perform cheap checks first, only calling the
-      expensive grading function when necessary.
+    - Majority voting uses the shared `verl.utils.reward_score.AnswerVoter`: answers are
+      canonicalized and bucketed once, and only bucket representatives are compared with
+      `grade_answer`, in a pre-forked `GraderPool` (`--grader_workers`) that hard-kills and
+      respawns a grader stuck for more than 10s. Verdicts are reused across runs through the SQLite-backed grade cache.
+    - vLLM automatic prefix caching is on by default (`--prefix_caching`): every prompt starts with
+      the same system message and the n samples share their prompt. The prefill tokens it saved
+      are printed after generation, see `scripts/benchmark_prefix_caching.py` for on/off throughput.
+    - `--sampling waves` draws the n samples in waves (`--waves 4,2,2,2`) and stops a question
+      as soon as its final majority share is outside the band kept by upload.py with probability
+      `--stop_confidence` (see `verl.utils.reward_score.adaptive_sampling`). Questions that may
+      land in the band still get all n samples. `scripts/benchmark_adaptive_sampling.py` replays
+      the rule on full-n results to measure the agreement.
+    - Questions that `question_evaluate/dedup.py` marked as duplicates are skipped, and the
+      solver GPU-hours they would have cost are estimated from the measured generation time.
     - Improved error handling and code structure for better readability and stability.
 
 Setup:
-    pip install stopit transformers torch vllm
+    pip install transformers torch vllm
 
 Example Usage (in a shell script):
     # This would run the script for GPU 0, with a specific model and save name.
@@ -27,165 +37,239 @@ from transformers import AutoTokenizer
 import argparse
 import re
 import os
-import stopit  # Use the robust, thread-safe stopit library for timeouts
-from mathruler.grader import extract_boxed_content, grade_answer
+import sys
+import time
+from mathruler.grader import extract_boxed_content
+
+# 添加项目根目录到Python路径，以便导入 verl.utils.reward_score
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from verl.utils.reward_score import AnswerVoter, GraderPool, WaveSampler, get_grade_cache
 
 # --- Argument Parsing ---
-parser = argparse.ArgumentParser(description="Evaluate generated questions using vLLM.")
-parser.add_argument("--model", type=str, default="Qwen/Qwen3-4B-Base", help="Path to the model in Hugging Face format.")
-parser.add_argument("--num_samples", type=int, default=10, help="Number of candidate answers to generate per question (n).")
-parser.add_argument("--suffix", type=str, default="0", help="A unique suffix for file naming, often the GPU index.")
-parser.add_argument("--save_name", type=str, required=True, help="A base name for input and output files.")
-args = parser.parse_args()
+def build_parser():
+    parser = argparse.ArgumentParser(description="Evaluate generated questions using vLLM.")
+    parser.add_argument("--model", type=str, default="Qwen/Qwen3-4B-Base", help="Path to the model in Hugging Face format.")
+    parser.add_argument("--num_samples", type=int, default=10, help="Number of candidate answers to generate per question (n).")
+    parser.add_argument("--suffix", type=str, default="0", help="A unique suffix for file naming, often the GPU index.")
+    parser.add_argument("--save_name", type=str, required=True, help="A base name for input and output files.")
+    parser.add_argument("--grader_workers", type=int, default=8, help="Number of processes for the answer-equivalence comparisons.")
+    parser.add_argument("--gpu_mem_util", type=float, default=0.85, help="The maximum GPU memory utilization fraction for vLLM.")
+    parser.add_argument("--sampling", type=str, default="full", choices=["full", "waves"], help="full: draw all n samples at once; waves: draw them in waves and stop questions that are confidently outside the kept score band.")
+    parser.add_argument("--waves", type=str, default="4,2,2,2", help="Wave sizes for --sampling waves, must add up to --num_samples.")
+    parser.add_argument("--keep_min_score", type=float, default=0.25, help="Lower end of the score band kept by upload.py.")
+    parser.add_argument("--keep_max_score", type=float, default=0.75, help="Upper end of the score band kept by upload.py.")
+    parser.add_argument("--stop_confidence", type=float, default=0.95, help="Stop a question once its final score is outside the band with this probability.")
+    parser.add_argument("--prefix_caching", type=str, default="on", choices=["on", "off"], help="vLLM automatic prefix caching of the shared system prompt and of the prompt across the n samples.")
+    parser.add_argument("--daemon_socket", type=str, default=None, help="Unix socket of a running generation daemon (vllm_service_init/generation_daemon.py); the local vLLM engine is skipped.")
+    return parser
 
 # --- Constants and Paths ---
 STORAGE_PATH = os.getenv("STORAGE_PATH", "/apdcephfs_sh2/share_300000800/user/chengchuang")
-INPUT_FILE = f"{STORAGE_PATH}/generated_question/{args.save_name}_{args.suffix}.json"
-OUTPUT_FILE = f"{STORAGE_PATH}/generated_question/{args.save_name}_{args.suffix}_results.json"
-
-# --- Timeout-Protected Grading Function ---
-@stopit.threading_timeoutable(default='TIMED_OUT')
-def grade_answer_with_timeout(res1, res2):
-    """
-    Wraps the mathruler 'grade_answer' function with a timeout.
-    If the function takes too long, it returns 'TIMED_OUT' instead of hanging.
-    """
-    # The actual timeout value is passed as a keyword argument on each call.
-    return grade_answer(res1, res2)
+
+def io_files(args, storage_path=STORAGE_PATH):
+    input_file = f"{storage_path}/generated_question/{args.save_name}_{args.suffix}.json"
+    output_file = f"{storage_path}/generated_question/{args.save_name}_{args.suffix}_results.json"
+    return input_file, output_file
 
 # --- Main Script Logic ---
 
 # 1. Load and Prepare Data
-print(f"[{args.suffix}] Loading data from: {INPUT_FILE}")
-try:
-    with open(INPUT_FILE, "r") as f:
-        data = json.load(f)
-    # Clean up the input file immediately after loading to save space
-    os.remove(INPUT_FILE)
-except FileNotFoundError:
-    print(f"[{args.suffix}] ERROR: Input file not found. Exiting.")
-    exit()
-
-# Filter data into questions that need processing
-correct_data = [item for item in data if item.get('score') == 0]
-if not correct_data:
-    print(f"[{args.suffix}] No new questions to process (score=0). Exiting.")
-    # Create an empty results file to signal completion
-    with open(OUTPUT_FILE, "w") as f:
-        json.dump([], f)
-    exit()
-
-questions = [item["question"] for item in correct_data]
-answers = [item["answer"] for item in correct_data]
-print(f"[{args.suffix}] Found {len(questions)} questions to process.")
-
-# 2. Initialize Model and Tokenizer
-print(f"[{args.suffix}] Initializing vLLM for model: {args.model}")
-# 检查是否为本地路径
-is_local_path = os.path.exists(args.model) and os.path.isdir(args.model)
-tokenizer = AutoTokenizer.from_pretrained(args.model, local_files_only=is_local_path, trust_remote_code=True)
-model = vllm.LLM(
-    model=args.model,
-    tokenizer=args.model,
-    gpu_memory_utilization=0.85,
-    seed=int(args.suffix),
-    trust_remote_code=True
-)
-sample_params = vllm.SamplingParams(
-    max_tokens=4096,
-    temperature=1.0,
-    top_p=1.0,
-    top_k=40,
-    stop_token_ids=[tokenizer.eos_token_id],
-    n=args.num_samples,
-)
+def load_questions(args, storage_path=STORAGE_PATH):
+    """Returns the (questions, answers, num_duplicates) to evaluate, or None after writing the empty results file."""
+    input_file, output_file = io_files(args, storage_path)
+    print(f"[{args.suffix}] Loading data from: {input_file}")
+    try:
+        with open(input_file, "r") as f:
+            data = json.load(f)
+        # Clean up the input file immediately after loading to save space
+        os.remove(input_file)
+    except FileNotFoundError:
+        print(f"[{args.suffix}] ERROR: Input file not found. Exiting.")
+        return None
+
+    # Filter data into questions that need processing
+    correct_data = [item for item in data if item.get('score') == 0]
+    if not correct_data:
+        print(f"[{args.suffix}] No new questions to process (score=0). Exiting.")
+        # Create an empty results file to signal completion
+        with open(output_file, "w") as f:
+            json.dump([], f)
+        return None
+
+    questions = [item["question"] for item in correct_data]
+    answers = [item["answer"] for item in correct_data]
+    # Questions marked by question_evaluate/dedup.py are not evaluated.
+    num_duplicates = sum(1 for item in data if item.get("duplicate"))
+    print(f"[{args.suffix}] Found {len(questions)} questions to process ({num_duplicates} duplicates skipped).")
+    return questions, answers, num_duplicates
+
+# 2. Model and Tokenizer
+def load_tokenizer(model_path):
+    # 检查是否为本地路径
+    is_local_path = os.path.exists(model_path) and os.path.isdir(model_path)
+    return AutoTokenizer.from_pretrained(model_path, local_files_only=is_local_path, trust_remote_code=True)
+
+def build_model(args):
+    return vllm.LLM(
+        model=args.model,
+        tokenizer=args.model,
+        gpu_memory_utilization=args.gpu_mem_util,
+        seed=int(args.suffix),
+        trust_remote_code=True,
+        enable_prefix_caching=args.prefix_caching == "on",
+    )
 
 # 3. Generate Responses
-print(f"[{args.suffix}] Generating {args.num_samples} samples for each question...")
-chats = [[{"role": "system", "content": "Please reason step by step, and put your final answer within \\boxed{}."},{"role": "user", "content": q}] for q in questions]
+def build_prompts(tokenizer, questions):
+    chats = [[{"role": "system", "content": "Please reason step by step, and put your final answer within \\boxed{}."},{"role": "user", "content": q}] for q in questions]
+
+    if tokenizer.chat_template:
+        return [tokenizer.apply_chat_template(chat, tokenize=False, add_generation_prompt=True, add_special_tokens=True) for chat in chats]
+    return ["system: " + chat[0]["content"] + '\n' + "user: " + chat[1]["content"] for chat in chats]
+
+def extract_answers(outputs):
+    # Extract the boxed content from the generated samples, filtering out None/empty results
+    return [res for res in (extract_boxed_content(output.text) for output in outputs) if res]
+
+def generate_samples(args, model, tokenizer, voter, prompts):
+    """Returns the completion outputs of every prompt, drawn at once or in waves (`--sampling`)."""
+    sample_params = vllm.SamplingParams(
+        max_tokens=4096,
+        temperature=1.0,
+        top_p=1.0,
+        top_k=40,
+        stop_token_ids=[tokenizer.eos_token_id],
+        n=args.num_samples,
+    )
+
+    gen_seconds = 0.0  # GPU time spent in vLLM, without the grading between waves
+    if args.sampling == "waves":
+        wave_sampler = WaveSampler(args.waves, args.num_samples, args.keep_min_score, args.keep_max_score, args.stop_confidence)
+        all_outputs = [[] for _ in prompts]
+        responses = []
+        active = list(range(len(prompts)))
+        for wave_index, wave in enumerate(wave_sampler.waves):
+            wave_params = sample_params.clone()
+            wave_params.n = wave
+            wave_start = time.time()
+            wave_responses = model.generate([prompts[k] for k in active], sampling_params=wave_params, use_tqdm=True)
+            wave_seconds = time.time() - wave_start
+            gen_seconds += wave_seconds
+            print(f"[{args.suffix}] Wave {wave_index + 1}/{len(wave_sampler.waves)}: {wave} samples for {len(active)} questions in {wave_seconds:.1f}s.")
+            responses.extend(wave_responses)
+            for k, response in zip(active, wave_responses):
+                all_outputs[k].extend(response.outputs)
 
-if tokenizer.chat_template:
-    prompts = [tokenizer.apply_chat_template(chat, tokenize=False, add_generation_prompt=True, add_special_tokens=True) for chat in chats]
-else:
-    prompts = ["system: " + chat[0]["content"] + '\n' + "user: " + chat[1]["content"] for chat in chats]
+            # Questions whose final score is confidently outside the kept band skip the remaining waves.
+            num_drawn = sum(wave_sampler.waves[: wave_index + 1])
+            wave_counts = voter.cluster_many([extract_answers(all_outputs[k]) for k in active])
+            still_active = []
+            for k, answer_counts in zip(active, wave_counts):
+                if wave_sampler.should_stop(answer_counts, num_drawn):
+                    wave_sampler.record(num_drawn)
+                else:
+                    still_active.append(k)
 
-responses = model.generate(prompts, sampling_params=sample_params, use_tqdm=True)
-print(f"[{args.suffix}] Generation complete.")
+            active = still_active
+            if not active:
+                break
+    else:
+        gen_start = time.time()
+        responses = model.generate(prompts, sampling_params=sample_params, use_tqdm=True)
+        gen_seconds = time.time() - gen_start
+        all_outputs = [response.outputs for response in responses]
+
+    print(f"[{args.suffix}] Generation complete in {gen_seconds:.1f}s.")
+    if args.sampling == "waves":
+        print(f"[{args.suffix}] Wave sampling: {wave_sampler.metrics(seconds_per_sample=gen_seconds / max(wave_sampler.samples_drawn, 1))}")
+    prompt_tokens = sum(len(response.prompt_token_ids or []) for response in responses)
+    cached_tokens = sum(response.num_cached_tokens or 0 for response in responses)
+    print(f"[{args.suffix}] Prefix cache ({args.prefix_caching}): {cached_tokens}/{prompt_tokens} prompt tokens served from the cache.")
+    return all_outputs, gen_seconds
 
 # 4. Process and Grade Responses
-results_all = []
-print(f"[{args.suffix}] Grading responses...")
-for response, golden_answer, question in zip(responses, answers, questions):
-    try:
-        # Extract the boxed content from all generated samples
-        results = [extract_boxed_content(output.text) for output in response.outputs]
-        results = [res for res in results if res] # Filter out None/empty results
+def grade(args, voter, questions, answers, all_outputs):
+    results_all = []
+    print(f"[{args.suffix}] Grading responses...")
+    all_results = [extract_answers(outputs) for outputs in all_outputs]
+    # All questions are clustered together so their comparisons share the grader pool.
+    all_answer_counts = voter.cluster_many(all_results)
+    voter.cache.flush()
+    print(f"[{args.suffix}] Grade cache: {voter.cache.metrics()}, grader pool: {voter.pool.stats()}")
 
-        if not results:
-            print(f"[{args.suffix}] WARNING: No valid boxed answers found for question: '{question[:50]}...'")
-            continue
+    for results, answer_counts, golden_answer, question in zip(all_results, all_answer_counts, answers, questions):
+        try:
+            if not results:
+                print(f"[{args.suffix}] WARNING: No valid boxed answers found for question: '{question[:50]}...'")
+                continue
 
-        answer_counts = {}
-        for result in results:
-            matched = False
-            for existing_answer in answer_counts:
-                # OPTIMIZATION: Perform cheap string comparisons first.
-                if result == existing_answer or ('no ' in result.lower() and 'no ' in existing_answer.lower()):
-                    answer_counts[existing_answer] += 1
-                    matched = True
-                    break
-                
-                # If cheap checks fail, use the expensive, timed grader.
-                # Check both directions (A vs B and B vs A).
-                match_1 = grade_answer_with_timeout(result, existing_answer, timeout=10)
-                if match_1 == 'TIMED_OUT':
-                    print(f"[{args.suffix}] GRADER TIMEOUT on: '{result[:30]}...' vs '{existing_answer[:30]}...'")
-                    continue # Skip to the next existing_answer
-                
-                if match_1:
-                    answer_counts[existing_answer] += 1
-                    matched = True
-                    break
-
-                match_2 = grade_answer_with_timeout(existing_answer, result, timeout=10)
-                if match_2 == 'TIMED_OUT':
-                    print(f"[{args.suffix}] GRADER TIMEOUT on: '{existing_answer[:30]}...' vs '{result[:30]}...'")
-                    continue
-
-                if match_2:
-                    answer_counts[existing_answer] += 1
-                    matched = True
-                    break
-
-            if not matched:
-                answer_counts[result] = 1
-
-        if not answer_counts:
-            continue
+            if not answer_counts:
+                continue
+
+            # Determine the majority answer and its score
+            majority_answer = max(answer_counts, key=answer_counts.get)
+            max_count = answer_counts[majority_answer]
+            score = max_count / len(results)
+
+            # Skip certain question types that are hard to grade automatically
+            if "证明" in question or 'box' in question.lower() or 'text' in majority_answer.lower():
+                continue
 
-        # Determine the majority answer and its score
-        majority_answer = max(answer_counts, key=answer_counts.get)
-        max_count = answer_counts[majority_answer]
-        score = max_count / len(results)
+            results_all.append({
+                "question": question,
+                "answer": majority_answer,
+                "score": score,
+                'results': results
+            })
 
-        # Skip certain question types that are hard to grade automatically
-        if "证明" in question or 'box' in question.lower() or 'text' in majority_answer.lower():
+        except Exception as e:
+            print(f"[{args.suffix}] CRITICAL ERROR processing question '{question[:50]}...': {e}")
             continue
 
-        results_all.append({
-            "question": question,
-            "answer": majority_answer,
-            "score": score,
-            'results': results
-        })
+    return results_all
 
-    except Exception as e:
-        print(f"[{args.suffix}] CRITICAL ERROR processing question '{question[:50]}...': {e}")
-        continue
+def evaluate_questions(args, model, tokenizer, voter, questions, answers, num_duplicates=0):
+    """Samples, grades and scores `questions` with a loaded `vllm.LLM`; shared with the generation daemon."""
+    print(f"[{args.suffix}] Generating {args.num_samples} samples for each question...")
+    prompts = build_prompts(tokenizer, questions)
+    all_outputs, gen_seconds = generate_samples(args, model, tokenizer, voter, prompts)
+    if num_duplicates:
+        saved_hours = num_duplicates * gen_seconds / len(questions) / 3600
+        print(f"[{args.suffix}] Dedup: {num_duplicates} duplicates not evaluated, ~{saved_hours:.3f} solver GPU-hours saved.")
+    return grade(args, voter, questions, answers, all_outputs)
 
 # 5. Save Final Results
-print(f"[{args.suffix}] Processed {len(results_all)} questions. Saving results to: {OUTPUT_FILE}")
-with open(OUTPUT_FILE, "w") as f:
-    json.dump(results_all, f, indent=4)
+def save_results(args, results_all, storage_path=STORAGE_PATH):
+    _, output_file = io_files(args, storage_path)
+    print(f"[{args.suffix}] Processed {len(results_all)} questions. Saving results to: {output_file}")
+    with open(output_file, "w") as f:
+        json.dump(results_all, f, indent=4)
+
+def main(args):
+    if args.daemon_socket:
+        # 交给常驻生成服务，省去每次加载模型和捕获 CUDA graph
+        from vllm_service_init.client import send_job
+        reply = send_job(args.daemon_socket, {"op": "evaluate", "args": vars(args), "storage_path": STORAGE_PATH})
+        print(f"[{args.suffix}] Generation daemon: {reply}")
+        return
+
+    loaded = load_questions(args)
+    if loaded is None:
+        return
+    questions, answers, num_duplicates = loaded
+
+    # The grader pool is forked before vLLM initializes CUDA.
+    grader_pool = GraderPool(args.grader_workers, timeout=10)
+    voter = AnswerVoter(pool=grader_pool, timeout=10, cache=get_grade_cache())
+
+    print(f"[{args.suffix}] Initializing vLLM for model: {args.model}")
+    tokenizer = load_tokenizer(args.model)
+    model = build_model(args)
+
+    results_all = evaluate_questions(args, model, tokenizer, voter, questions, answers, num_duplicates)
+    grader_pool.close()
+    save_results(args, results_all)
+    print(f"[{args.suffix}] Script finished.")
 
-print(f"[{args.suffix}] Script finished.")
\ No newline at end of file
+if __name__ == "__main__":
+    main(build_parser().parse_args())
@@ -5,17 +5,22 @@ save_name=$2
 
 pids=()
 
+# 设置了 GEN_DAEMON_DIR 时交给常驻生成服务（vllm_service_init/generation_daemons.sh），不再每次加载模型
+daemon_arg() {
+    [ -n "$GEN_DAEMON_DIR" ] && echo "--daemon_socket $GEN_DAEMON_DIR/gpu$1.sock"
+}
+
 # 使用GPU 4,5,6,7 并行评估（4倍速度）
 # 使用物理GPU 4,5,6,7（父脚本设置了CUDA_VISIBLE_DEVICES=4,5,6,7，这里直接用物理编号）
 # 论文参数: m = 10 个答案采样
 echo "启动4GPU并行评估 - 使用 GPU 4, 5, 6, 7"
-CUDA_VISIBLE_DEVICES=4 python question_evaluate/evaluate.py --model $model_name --suffix 0 --save_name $save_name --num_samples 10 &
+CUDA_VISIBLE_DEVICES=4 python question_evaluate/evaluate.py --model $model_name --suffix 0 --save_name $save_name --num_samples 10 $(daemon_arg 4) &
 pids[0]=$!
-CUDA_VISIBLE_DEVICES=5 python question_evaluate/evaluate.py --model $model_name --suffix 1 --save_name $save_name --num_samples 10 &
+CUDA_VISIBLE_DEVICES=5 python question_evaluate/evaluate.py --model $model_name --suffix 1 --save_name $save_name --num_samples 10 $(daemon_arg 5) &
 pids[1]=$!
-CUDA_VISIBLE_DEVICES=6 python question_evaluate/evaluate.py --model $model_name --suffix 2 --save_name $save_name --num_samples 10 &
+CUDA_VISIBLE_DEVICES=6 python question_evaluate/evaluate.py --model $model_name --suffix 2 --save_name $save_name --num_samples 10 $(daemon_arg 6) &
 pids[2]=$!
-CUDA_VISIBLE_DEVICES=7 python question_evaluate/evaluate.py --model $model_name --suffix 3 --save_name $save_name --num_samples 10 &
+CUDA_VISIBLE_DEVICES=7 python question_evaluate/evaluate.py --model $model_name --suffix 3 --save_name $save_name --num_samples 10 $(daemon_arg 7) &
 pids[3]=$!
 
 wait ${pids[0]}
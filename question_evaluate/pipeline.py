@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Description:
+    Streaming replacement for `question_generate.bash` followed by `evaluate.sh`. Instead of
+    generating every question into per-GPU files and only then evaluating them, questions are
+    generated in chunks (`--chunk_size`) on the generation GPUs and pushed through a bounded
+    queue to the evaluation GPUs as soon as they are parsed, so generation and evaluation overlap.
+    A generation GPU that has produced its share of the questions becomes an evaluation GPU
+    (`--switch_to_eval`), and evaluation workers take whatever chunks are queued, so no GPU waits
+    on a barrier.
+
+    Exact and near-duplicate questions (`--dedup`, `--dedup_threshold`) are dropped before they
+    are queued, see question_evaluate/dedup.py.
+
+    The scored questions are written to `{save_name}_{i}_results.json` (one file per evaluation
+    worker, the format upload.py reads). Every file is rewritten atomically after each chunk, so
+    it always holds a valid, growing list of the results so far.
+
+Workers:
+    With `--daemon_dir`, the GPUs are the resident generation daemons started by
+    `vllm_service_init/generation_daemons.sh` (`gpu{N}.sock`), which keep their engines between
+    iterations. Otherwise one process per GPU is spawned, running the same daemon code in-process.
+
+    Options of evaluate.py that this script does not define (e.g. `--sampling waves`,
+    `--gpu_mem_util`) are passed through to the evaluation jobs.
+
+Example Usage:
+    python question_evaluate/pipeline.py --questioner_model $questioner --solver_model $solver \
+        --save_name my_experiment --num_questions 8000 --gen_gpus 4 --eval_gpus 5,6,7
+'''
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+
+# 添加项目根目录到Python路径，以便导入 vllm_service_init 和 question_evaluate
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from question_evaluate import evaluate as evaluate_stage
+from question_evaluate.dedup import add_dedup_arguments, build_deduplicator
+from vllm_service_init.client import send_job
+
+STORAGE_PATH = os.getenv("STORAGE_PATH")
+
+
+# --- Workers ---
+class DaemonWorker:
+    '''A GPU served by a running generation daemon.'''
+
+    def __init__(self, gpu, daemon_dir):
+        self.gpu = gpu
+        self.socket_path = os.path.join(daemon_dir, f"gpu{gpu}.sock")
+
+    def call(self, job):
+        return send_job(self.socket_path, job)
+
+    def close(self):
+        send_job(self.socket_path, {"op": "sleep"})
+
+
+def _local_worker_main(seed, grader_workers, conn):
+    from vllm_service_init.generation_daemon import GenerationDaemon
+
+    daemon = GenerationDaemon(argparse.Namespace(seed=seed, gpu_mem_util=0.85, grader_workers=grader_workers, sleep_when_idle=False))
+    for job in iter(conn.recv, None):
+        try:
+            reply = daemon.run(job)
+        except Exception as e:
+            reply = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        conn.send(reply)
+    daemon.grader_pool.close()
+
+
+class LocalWorker:
+    '''A GPU served by a spawned process that runs the daemon's job handler in-process.'''
+
+    def __init__(self, gpu, seed, grader_workers):
+        self.gpu = gpu
+        ctx = mp.get_context("spawn")
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_local_worker_main, args=(seed, grader_workers, child_conn))
+        # 子进程继承启动时的环境变量，在它导入 torch / vLLM 之前就只看到自己的 GPU
+        parent_devices = os.environ.get("CUDA_VISIBLE_DEVICES")
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(gpu)
+        try:
+            self.process.start()
+        finally:
+            if parent_devices is None:
+                del os.environ["CUDA_VISIBLE_DEVICES"]
+            else:
+                os.environ["CUDA_VISIBLE_DEVICES"] = parent_devices
+
+    def call(self, job):
+        self.conn.send(job)
+        reply = self.conn.recv()
+        if reply.get("status") != "ok":
+            raise RuntimeError(f"Worker on GPU {self.gpu}: job {job.get('op')} failed: {reply.get('error')}")
+        return reply
+
+    def close(self):
+        if self.process.is_alive():
+            self.conn.send(None)
+        self.process.join()
+
+
+# --- Results ---
+class ResultsWriter:
+    '''Collects the results of one evaluation worker and rewrites its results file after every chunk.'''
+
+    def __init__(self, save_name, index, storage_path=STORAGE_PATH):
+        self.index = index
+        self.output_file = f"{storage_path}/generated_question/{save_name}_{index}_results.json"
+        self.results = []
+        self.write()
+
+    def add(self, results):
+        self.results.extend(results)
+        self.write()
+
+    def write(self):
+        tmp_file = self.output_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.results, f, indent=4)
+        os.replace(tmp_file, self.output_file)
+
+
+class PipelineStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generated = 0
+        self.valid = 0
+        self.evaluated = 0
+        self.kept = 0
+        self.gen_seconds = 0.0
+        self.eval_seconds = 0.0
+        self.eval_wait_seconds = 0.0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+
+# --- Pipeline ---
+def run_pipeline(args, eval_argv, gen_workers, eval_workers, storage_path=STORAGE_PATH):
+    chunks = queue.Queue(maxsize=args.max_pending_chunks)
+    stats = PipelineStats()
+    deduplicator = build_deduplicator(args)
+    remaining = [args.num_questions]
+    producers_left = [len(gen_workers)]
+    lock = threading.Lock()
+    consumers = list(eval_workers) + (list(gen_workers) if args.switch_to_eval else [])
+    writers = [ResultsWriter(args.save_name, index, storage_path) for index in range(len(consumers))]
+    errors = []
+    stop = threading.Event()  # set when a worker fails, so nobody blocks on the queue
+
+    def take_chunk():
+        with lock:
+            size = min(args.chunk_size, remaining[0])
+            remaining[0] -= size
+            return size
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def produce(worker):
+        while not stop.is_set():
+            size = take_chunk()
+            if size == 0:
+                break
+            start = time.time()
+            reply = worker.call({
+                "op": "generate_chunk",
+                "args": {"model": args.questioner_model, "num_samples": size},
+                "keep_awake": True,
+            })
+            # 只有解析成功的问题（score == 0）需要评估，与 evaluate.py 的过滤一致
+            valid = [item for item in reply["items"] if item.get("score") == 0]
+            stats.add(generated=size, valid=len(valid), gen_seconds=time.time() - start)
+            if deduplicator is not None:
+                valid = [valid[k] for k in deduplicator.filter([item["question"] for item in valid])]
+            if valid:
+                put(valid)
+
+    def consume(worker, writer):
+        eval_args = vars(evaluate_stage.build_parser().parse_args(
+            eval_argv + ["--model", args.solver_model, "--save_name", args.save_name, "--suffix", str(writer.index)]
+        ))
+        finished = False
+        while not finished and not stop.is_set():
+            wait_start = time.time()
+            try:
+                batch = chunks.get(timeout=1)
+            except queue.Empty:
+                continue
+            finally:
+                stats.add(eval_wait_seconds=time.time() - wait_start)
+            if batch is None:
+                break
+            # 把已经排队的 chunk 一起取走，保持评估 batch 足够大
+            while len(batch) < args.max_eval_batch:
+                try:
+                    more = chunks.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    finished = True
+                    break
+                batch = batch + more
+
+            start = time.time()
+            reply = worker.call({
+                "op": "evaluate_chunk",
+                "args": eval_args,
+                "questions": [item["question"] for item in batch],
+                "answers": [item["answer"] for item in batch],
+                "keep_awake": True,
+            })
+            results = reply["items"]
+            writer.add(results)
+            kept = sum(
+                args.keep_min_score <= item["score"] <= args.keep_max_score and item["answer"] not in ("", "None")
+                for item in results
+            )
+            stats.add(evaluated=len(batch), kept=kept, eval_seconds=time.time() - start)
+            print(f"[pipeline] GPU {worker.gpu}: evaluated {len(batch)} questions, {kept} kept "
+                  f"(total {stats.evaluated}/{stats.valid} evaluated, {stats.kept} kept)")
+
+    def guarded(fn, *fn_args):
+        try:
+            fn(*fn_args)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+            print(f"[pipeline] ERROR in {fn.__name__}: {type(e).__name__}: {e}")
+
+    def producer_then_consumer(worker, writer):
+        guarded(produce, worker)
+        with lock:
+            producers_left[0] -= 1
+            last = producers_left[0] == 0
+        if last:
+            for _ in consumers:
+                put(None)
+        if writer is not None:
+            guarded(consume, worker, writer)
+
+    start = time.time()
+    threads = []
+    for index, worker in enumerate(gen_workers):
+        writer = writers[len(eval_workers) + index] if args.switch_to_eval else None
+        threads.append(threading.Thread(target=producer_then_consumer, args=(worker, writer)))
+    for worker, writer in zip(eval_workers, writers):
+        threads.append(threading.Thread(target=guarded, args=(consume, worker, writer)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.time() - start
+
+    print("=" * 60)
+    print(f"[pipeline] {stats.generated} generated, {stats.valid} parsed, {stats.evaluated} evaluated, {stats.kept} kept "
+          f"in [{args.keep_min_score}, {args.keep_max_score}]")
+    if deduplicator is not None:
+        print(f"[pipeline] Dedup: {deduplicator.metrics(seconds_per_question=stats.eval_seconds / max(stats.evaluated, 1))}")
+    print(f"[pipeline] Wall time {wall_seconds:.1f}s; GPU busy time: generation {stats.gen_seconds:.1f}s, "
+          f"evaluation {stats.eval_seconds:.1f}s, evaluation workers waiting for questions {stats.eval_wait_seconds:.1f}s")
+    print("=" * 60)
+    if errors:
+        raise RuntimeError(f"{len(errors)} pipeline workers failed, first error: {errors[0]}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipelined question generation and evaluation.")
+    parser.add_argument("--questioner_model", type=str, required=True)
+    parser.add_argument("--solver_model", type=str, required=True)
+    parser.add_argument("--save_name", type=str, required=True)
+    parser.add_argument("--num_questions", type=int, default=8000, help="Questions to generate over all generation GPUs.")
+    parser.add_argument("--chunk_size", type=int, default=250, help="Questions generated per job before they are queued.")
+    parser.add_argument("--max_eval_batch", type=int, default=1000, help="Queued questions an evaluation job takes at most.")
+    parser.add_argument("--max_pending_chunks", type=int, default=64, help="Bound of the queue between generation and evaluation.")
+    parser.add_argument("--gen_gpus", type=str, default="4")
+    parser.add_argument("--eval_gpus", type=str, default="5,6,7")
+    parser.add_argument("--switch_to_eval", type=lambda value: value.lower() == "true", default=True,
+                        help="Generation GPUs evaluate queued questions once their generation is done.")
+    parser.add_argument("--daemon_dir", type=str, default=None, help="Directory of the generation daemon sockets (GEN_DAEMON_DIR).")
+    parser.add_argument("--grader_workers", type=int, default=8)
+    parser.add_argument("--keep_min_score", type=float, default=0.25, help="Lower end of the score band kept by upload.py.")
+    parser.add_argument("--keep_max_score", type=float, default=0.75, help="Upper end of the score band kept by upload.py.")
+    add_dedup_arguments(parser)
+    args, eval_argv = parser.parse_known_args()
+    # upload.py 的保留区间同时传给评估（--sampling waves 会用到）
+    eval_argv += ["--keep_min_score", str(args.keep_min_score), "--keep_max_score", str(args.keep_max_score),
+                  "--grader_workers", str(args.grader_workers)]
+
+    gen_gpus = [int(gpu) for gpu in args.gen_gpus.split(",") if gpu]
+    eval_gpus = [int(gpu) for gpu in args.eval_gpus.split(",") if gpu]
+    if args.daemon_dir:
+        workers = [DaemonWorker(gpu, args.daemon_dir) for gpu in gen_gpus + eval_gpus]
+    else:
+        # seed 与原来每个 GPU 的 --suffix 一致
+        workers = [LocalWorker(gpu, seed, args.grader_workers) for seed, gpu in enumerate(gen_gpus + eval_gpus)]
+
+    try:
+        run_pipeline(args, eval_argv, workers[:len(gen_gpus)], workers[len(gen_gpus):])
+    finally:
+        for worker in workers:
+            worker.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,49 @@
 import json
-import huggingface_hub
-from datasets import Dataset, DatasetDict
-from huggingface_hub import login
+from datasets import Dataset, DatasetDict, load_from_disk
 import argparse
-import json
 import os
+import shutil
+import subprocess
+import sys
 STORAGE_PATH = os.getenv("STORAGE_PATH")
 HUGGINGFACENAME = os.getenv("HUGGINGFACENAME")
-print(STORAGE_PATH)
-with open('tokens.json', 'r') as f:
-    token = json.load(f)['huggingface']
-login(token=token)
+
+
+def push_to_hub(local_dir, output_format, repo_name, config_name):
+    """Pushes a dataset written by this script to the Hub; runs as a detached side job."""
+    from huggingface_hub import login
+    with open('tokens.json', 'r') as f:
+        token = json.load(f)['huggingface']
+    login(token=token)
+    if output_format == "arrow":
+        train_dataset = load_from_disk(local_dir)
+    else:
+        train_dataset = Dataset.from_parquet(os.path.join(local_dir, "train.parquet"))
+    dataset = DatasetDict({"train": train_dataset})
+    dataset.push_to_hub(f"{HUGGINGFACENAME}/{repo_name}", private=True, config_name=config_name)
+    print(f"Pushed {local_dir} to {HUGGINGFACENAME}/{repo_name} ({config_name})")
+
+
 parser = argparse.ArgumentParser()
 parser.add_argument("--repo_name", type=str, default="")
 parser.add_argument("--max_score", type=float, default=0.7)
 parser.add_argument("--min_score", type=float, default=0.3)
 parser.add_argument("--experiment_name", type=str, default="Qwen_Qwen3-4B-Base_all")
+parser.add_argument("--local_dir", type=str, default=None,
+                    help="Directory of the training dataset, data.train_files of the solver (default: $STORAGE_PATH/datasets/<experiment_name>)")
+parser.add_argument("--output_format", type=str, default="parquet", choices=["parquet", "arrow"],
+                    help="parquet: train.parquet; arrow: Dataset.save_to_disk, memory-mapped by RLHFDataset without a cache copy")
+parser.add_argument("--push_to_hub", action="store_true",
+                    help="Also push to the Hub as <HUGGINGFACENAME>/<repo_name> in a background process; training does not wait for it")
+parser.add_argument("--push_only", action="store_true", help=argparse.SUPPRESS)
 args = parser.parse_args()
+local_dir = args.local_dir or f"{STORAGE_PATH}/datasets/{args.experiment_name}"
+
+if args.push_only:
+    push_to_hub(local_dir, args.output_format, args.repo_name, args.experiment_name)
+    sys.exit(0)
 
+print(STORAGE_PATH)
 datas= []
 for i in range(8):
     try:
@@ -50,19 +76,31 @@ import matplotlib.pyplot as plt
 plt.hist(scores, bins=11)
 plt.savefig('scores_distribution.png')
 
-#count the number  of score between 0.2 and 0.8 
-if not args.repo_name == "":
-    filtered_datas = [{'problem':data['question'],'answer':data['answer'],'score':data['score']} for data in datas if data['score'] >= args.min_score and data['score'] <= args.max_score and data['answer'] != '' and data['answer']!= 'None']
-    print(len(filtered_datas))
-    train_dataset = Dataset.from_list(filtered_datas)
-    dataset_dict = {"train": train_dataset}
-    config_name = f"{args.experiment_name}"
-    dataset = DatasetDict(dataset_dict)
-    dataset.push_to_hub(f"{HUGGINGFACENAME}/{args.repo_name}",private=True,config_name=config_name)
-
-
-
-
-
+#count the number  of score between 0.2 and 0.8
+filtered_datas = [{'problem':data['question'],'answer':data['answer'],'score':data['score']} for data in datas if data['score'] >= args.min_score and data['score'] <= args.max_score and data['answer'] != '' and data['answer']!= 'None']
+print(len(filtered_datas))
+train_dataset = Dataset.from_list(filtered_datas)
 
+# 训练数据直接写到本地磁盘，solver 训练用 data.train_files=<local_dir> 读取，不再经过 Hub
+if args.output_format == "arrow":
+    # 先写到临时目录再替换，正在读取旧数据集的进程不会看到写了一半的文件
+    shutil.rmtree(local_dir + ".tmp", ignore_errors=True)
+    train_dataset.save_to_disk(local_dir + ".tmp")
+    shutil.rmtree(local_dir, ignore_errors=True)
+    os.replace(local_dir + ".tmp", local_dir)
+else:
+    os.makedirs(local_dir, exist_ok=True)
+    train_dataset.to_parquet(os.path.join(local_dir, "train.parquet.tmp"))
+    os.replace(os.path.join(local_dir, "train.parquet.tmp"), os.path.join(local_dir, "train.parquet"))
+print(f"Saved {len(train_dataset)} training questions to {local_dir} ({args.output_format})")
 
+# Hub 上传改为可选的后台任务，不阻塞训练；离线节点不需要 tokens.json
+if args.push_to_hub and args.repo_name != "":
+    log_file = os.path.join(os.path.dirname(local_dir), f"{args.experiment_name}_push_to_hub.log")
+    with open(log_file, "w") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--push_only", "--local_dir", local_dir,
+             "--output_format", args.output_format, "--repo_name", args.repo_name, "--experiment_name", args.experiment_name],
+            stdout=log, stderr=subprocess.STDOUT, start_new_session=True,
+        )
+    print(f"Pushing to {HUGGINGFACENAME}/{args.repo_name} in the background, log: {log_file}")
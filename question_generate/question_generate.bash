@@ -10,14 +10,19 @@ quarter_samples=$((num_samples / 4))
 echo "启动4GPU并行问题生成 - 每个GPU: $quarter_samples 个问题"
 echo "GPU 4: $quarter_samples, GPU 5: $quarter_samples, GPU 6: $quarter_samples, GPU 7: $quarter_samples"
 
+# 设置了 GEN_DAEMON_DIR 时交给常驻生成服务（vllm_service_init/generation_daemons.sh），不再每次加载模型
+daemon_arg() {
+    [ -n "$GEN_DAEMON_DIR" ] && echo "--daemon_socket $GEN_DAEMON_DIR/gpu$1.sock"
+}
+
 pids=()
-CUDA_VISIBLE_DEVICES=4 python question_generate/question_generate.py --model $model_name --suffix 0 --num_samples $quarter_samples --save_name $save_name &
+CUDA_VISIBLE_DEVICES=4 python question_generate/question_generate.py --model $model_name --suffix 0 --num_samples $quarter_samples --save_name $save_name $(daemon_arg 4) &
 pids[0]=$!
-CUDA_VISIBLE_DEVICES=5 python question_generate/question_generate.py --model $model_name --suffix 1 --num_samples $quarter_samples --save_name $save_name &
+CUDA_VISIBLE_DEVICES=5 python question_generate/question_generate.py --model $model_name --suffix 1 --num_samples $quarter_samples --save_name $save_name $(daemon_arg 5) &
 pids[1]=$!
-CUDA_VISIBLE_DEVICES=6 python question_generate/question_generate.py --model $model_name --suffix 2 --num_samples $quarter_samples --save_name $save_name &
+CUDA_VISIBLE_DEVICES=6 python question_generate/question_generate.py --model $model_name --suffix 2 --num_samples $quarter_samples --save_name $save_name $(daemon_arg 6) &
 pids[2]=$!
-CUDA_VISIBLE_DEVICES=7 python question_generate/question_generate.py --model $model_name --suffix 3 --num_samples $quarter_samples --save_name $save_name &
+CUDA_VISIBLE_DEVICES=7 python question_generate/question_generate.py --model $model_name --suffix 3 --num_samples $quarter_samples --save_name $save_name $(daemon_arg 7) &
 pids[3]=$!
 
 wait ${pids[0]}
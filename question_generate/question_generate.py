@@ -8,6 +8,7 @@ from evaluation.datasets_loader import get_dataset_handler
 import json
 import regex as re
 import os
+import sys
 STORAGE_PATH = os.getenv("STORAGE_PATH")
 
 def extract_boxed(text):
@@ -44,26 +45,17 @@ def get_response_mask(response_ids, eos_token_id, dtype):
                 break
     return mask
 
-def main(args):
+def load_tokenizer(model_path):
     # 检查是否为本地路径
-    import os
-    is_local_path = os.path.exists(args.model) and os.path.isdir(args.model)
-    tokenizer = AutoTokenizer.from_pretrained(args.model, local_files_only=is_local_path, trust_remote_code=True)
+    is_local_path = os.path.exists(model_path) and os.path.isdir(model_path)
+    tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=is_local_path, trust_remote_code=True)
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
     if tokenizer.pad_token_id is None:
         tokenizer.pad_token_id = tokenizer.eos_token_id
-    model = vllm.LLM(
-        model=args.model,
-        tokenizer=args.model,
-        # gpu_memory_utilization=0.8,
-        seed=int(args.suffix),
-        trust_remote_code=True
-    )
-    dataset_handler = get_dataset_handler("math")
-    questions, answers = dataset_handler.load_data()
-    question = questions[0]
-    answer = answers[0]
+    return tokenizer
+
+def build_prompt(tokenizer):
     chat = [
         {
             "role": "system",
@@ -100,6 +92,11 @@ def main(args):
         )
     else:
         prompt = "system: " + chat[0]["content"] + '\n' + "user: " + chat[1]["content"]
+    return prompt
+
+def generate_questions(model, tokenizer, num_samples):
+    '''Samples `num_samples` questions from a loaded `vllm.LLM` and parses them into {question, answer, score} items.'''
+    prompt = build_prompt(tokenizer)
     sample_params = vllm.SamplingParams(
         max_tokens=4096,
         temperature=1.0,
@@ -108,7 +105,7 @@ def main(args):
         stop_token_ids=[tokenizer.eos_token_id],
     )
 
-    completions: List[RequestOutput] = model.generate([prompt]*args.num_samples, sampling_params=sample_params)
+    completions: List[RequestOutput] = model.generate([prompt]*num_samples, sampling_params=sample_params)
     results=[]
     for completion in completions:
         response = completion.outputs[0].text
@@ -124,15 +121,43 @@ def main(args):
                 results.append({"question": response, "answer": "", "score": -1})
         except:
             results.append({"question": response, "answer": "", "score": -1})
-    with open(f"{STORAGE_PATH}/generated_question/{args.save_name}_{args.suffix}.json", "w") as f:
+    return results
+
+def save_questions(results, args, storage_path=STORAGE_PATH):
+    with open(f"{storage_path}/generated_question/{args.save_name}_{args.suffix}.json", "w") as f:
         json.dump(results, f, indent=4)
 
+def main(args):
+    if args.daemon_socket:
+        # 交给常驻生成服务（vllm_service_init/generation_daemon.py），省去每次加载模型和捕获 CUDA graph
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from vllm_service_init.client import send_job
+        reply = send_job(args.daemon_socket, {"op": "generate_questions", "args": vars(args), "storage_path": STORAGE_PATH})
+        print(f"[{args.suffix}] Generation daemon: {reply}")
+        return
+
+    tokenizer = load_tokenizer(args.model)
+    model = vllm.LLM(
+        model=args.model,
+        tokenizer=args.model,
+        # gpu_memory_utilization=0.8,
+        seed=int(args.suffix),
+        trust_remote_code=True
+    )
+    dataset_handler = get_dataset_handler("math")
+    questions, answers = dataset_handler.load_data()
+    question = questions[0]
+    answer = answers[0]
+    results = generate_questions(model, tokenizer, args.num_samples)
+    save_questions(results, args)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--model", type=str, default="Qwen/Qwen3-4B")
     parser.add_argument("--num_samples", type=int, default=1250, help="Number of samples to generate")
     parser.add_argument("--suffix", type=str, default="", help="Suffix to add to the output file")
     parser.add_argument("--save_name", type=str, default="", help="")
+    parser.add_argument("--daemon_socket", type=str, default=None, help="Unix socket of a running generation daemon; the local vLLM engine is skipped")
     args = parser.parse_args()
 
     main(args) 
\ No newline at end of file
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Replays the early-stopping wave sampling of `question_evaluate/evaluate.py --sampling waves` on
+full-n results, to measure how often it agrees with scoring every question on all n samples.
+
+The input is the `*_results.json` output of a normal (`--sampling full`) evaluate.py run: the
+`results` list of every question holds its boxed answers in sample order. Each question is
+replayed wave by wave on a prefix of that list, exactly as evaluate.py would have seen it, and
+stopped with the same rule. Reported per setting:
+    skipped       samples the waves would not have drawn (and GPU-seconds, given --seconds_per_sample)
+    agreement     questions whose keep/drop decision in upload.py is the same as with full n
+    lost          questions full n keeps but the waves drop (the costly disagreement)
+    score_diff    mean |score - full-n score| over all questions
+
+Without --input, questions with a random majority probability are simulated.
+
+Usage:
+    python scripts/benchmark_adaptive_sampling.py --input $STORAGE_PATH/generated_question/xxx_0_results.json
+    python scripts/benchmark_adaptive_sampling.py --num_questions 2000 --confidences 0.9,0.95,0.99
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from verl.utils.reward_score import AnswerVoter, WaveSampler  # noqa: E402
+
+
+def load_results(paths):
+    answer_lists = []
+    for path in paths:
+        with open(path) as f:
+            answer_lists.extend(item["results"] for item in json.load(f) if item.get("results"))
+    return answer_lists
+
+
+def synthetic_results(num_questions, num_samples, seed):
+    rng = random.Random(seed)
+    answer_lists = []
+    for i in range(num_questions):
+        majority = rng.random()  # probability of the most common answer
+        answers = [
+            "42" if rng.random() < majority else str(rng.randint(0, 2 if rng.random() < 0.5 else 100))
+            for _ in range(num_samples)
+        ]
+        answer_lists.append(answers)
+    return answer_lists
+
+
+def score_of(voter, answers):
+    answer_counts = voter.cluster(answers)
+    if not answer_counts:
+        return "", 0.0
+    majority = max(answer_counts, key=answer_counts.get)
+    return majority, answer_counts[majority] / len(answers)
+
+
+def replay(voter, answer_lists, sampler):
+    '''Returns the (answer, score, samples drawn) of every question under the wave rule.'''
+    replayed = []
+    for answers in answer_lists:
+        num_drawn = 0
+        for wave in sampler.waves:
+            num_drawn += wave
+            # evaluate.py drops empty answers, so a short list means empty samples somewhere; they
+            # are placed at the end, where they do not change the score of any prefix
+            prefix = answers[:num_drawn]
+            if sampler.should_stop(voter.cluster(prefix), num_drawn):
+                break
+        replayed.append((*score_of(voter, prefix), num_drawn))
+    return replayed
+
+
+def kept(answer, score, min_score, max_score):
+    '''The filter of upload.py.'''
+    return min_score <= score <= max_score and answer not in ("", "None")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay wave sampling on full-n evaluate.py results.")
+    parser.add_argument("--input", type=str, nargs="*", default=None, help="evaluate.py *_results.json files.")
+    parser.add_argument("--num_questions", type=int, default=1000, help="Simulated questions without --input.")
+    parser.add_argument("--num_samples", type=int, default=10)
+    parser.add_argument("--waves", type=str, default="4,2,2,2")
+    parser.add_argument("--keep_min_score", type=float, default=0.25)
+    parser.add_argument("--keep_max_score", type=float, default=0.75)
+    parser.add_argument("--confidences", type=str, default="0.9,0.95,0.99")
+    parser.add_argument("--concentrations", type=str, default="0.5,1.0,2.0", help="Weight of an unseen answer in the urn.")
+    parser.add_argument("--seconds_per_sample", type=float, default=None, help="Measured GPU-seconds per sample.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.input:
+        answer_lists = load_results(args.input)
+    else:
+        answer_lists = synthetic_results(args.num_questions, args.num_samples, args.seed)
+
+    voter = AnswerVoter()
+    full = [score_of(voter, answers) for answers in answer_lists]
+    full_kept = [kept(answer, score, args.keep_min_score, args.keep_max_score) for answer, score in full]
+    print(f"{len(answer_lists)} questions, {sum(full_kept)} kept with full n={args.num_samples}")
+    print(f"{'confidence':>10} {'conc':>5} {'skipped':>14} {'gpu_s_saved':>11} {'agreement':>9} {'lost':>5} {'score_diff':>10}")
+    for confidence in [float(value) for value in args.confidences.split(",")]:
+        for concentration in [float(value) for value in args.concentrations.split(",")]:
+            sampler = WaveSampler(
+                args.waves, args.num_samples, args.keep_min_score, args.keep_max_score,
+                confidence=confidence, concentration=concentration,
+            )
+            replayed = replay(voter, answer_lists, sampler)
+            skipped = sum(args.num_samples - num_drawn for _, _, num_drawn in replayed)
+            wave_kept = [kept(answer, score, args.keep_min_score, args.keep_max_score) for answer, score, _ in replayed]
+            agreement = sum(a == b for a, b in zip(full_kept, wave_kept)) / len(full_kept)
+            lost = sum(a and not b for a, b in zip(full_kept, wave_kept))
+            score_diff = sum(abs(score - full_score) for (_, score, _), (_, full_score) in zip(replayed, full)) / len(full)
+            gpu_seconds = f"{skipped * args.seconds_per_sample:.0f}" if args.seconds_per_sample else "-"
+            print(
+                f"{confidence:>10.2f} {concentration:>5.1f} {skipped:>7} ({skipped / (len(full) * args.num_samples):>4.0%})"
+                f" {gpu_seconds:>11} {agreement:>9.2%} {lost:>5} {score_diff:>10.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the questioner repetition penalty (`cluster_share_per_problem` in
+examples/reward_function/caller_penalty.py): the original nltk pairwise BLEU loop against the
+vectorized sparse n-gram implementation (must give identical penalties) and the MinHash/LSH
+approximation (reports how many penalties change).
+
+Usage:
+    # synthetic questions (templated, with near-duplicates)
+    python scripts/benchmark_bleu_penalty.py --num_questions 1000
+    # real questions, e.g. a generated_question file or a list of strings
+    python scripts/benchmark_bleu_penalty.py --input $STORAGE_PATH/generated_question/xxx_0.json
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples", "reward_function"))
+from caller_penalty import _bleu_distance_matrix, cluster_share_per_problem  # noqa: E402
+from verl.utils.reward_score.similarity import bleu_distance_matrix  # noqa: E402
+
+TEMPLATES = [
+    "Let $f(x) = x^{a} + {b}x + {c}$. Find the sum of all real roots of $f(x) = 0$.",
+    "A triangle has sides {a}, {b} and {c}. What is the area of the triangle?",
+    "How many positive integers less than {a}{b} are divisible by {c} but not by {a}?",
+    "Find the remainder when ${a}^{{b}}$ is divided by {c}.",
+    "Let $S$ be the set of integers $n$ with $1 \\le n \\le {a}{c}$ such that $n^2 + {b}$ is prime. Find $|S|$.",
+    "A bag contains {a} red balls and {b} blue balls. If {c} balls are drawn, what is the probability that all are red?",
+]
+
+
+def synthetic_questions(num_questions, seed):
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(num_questions):
+        template = rng.choice(TEMPLATES)
+        question = template.format(a=rng.randint(2, 9), b=rng.randint(2, 9), c=rng.randint(2, 9))
+        if rng.random() < 0.3:  # some free-form variation, like the questioner's rewrites
+            words = question.split()
+            del words[rng.randrange(len(words))]
+            question = " ".join(words)
+        questions.append(question)
+    return questions
+
+
+def load_questions(path):
+    with open(path) as f:
+        data = json.load(f)
+    return [item["question"] if isinstance(item, dict) else str(item) for item in data]
+
+
+def timed(fn, *args, **kwargs):
+    start = time.time()
+    out = fn(*args, **kwargs)
+    return out, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default=None, help="JSON list of questions or of {question: ...} records.")
+    parser.add_argument("--num_questions", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip_nltk", action="store_true", help="Skip the (slow) original implementation.")
+    args = parser.parse_args()
+
+    questions = load_questions(args.input) if args.input else synthetic_questions(args.num_questions, args.seed)
+    print(f"{len(questions)} questions")
+
+    fast_dist, fast_time = timed(bleu_distance_matrix, questions)
+    exact, exact_time = timed(cluster_share_per_problem, questions, method="exact")
+    approx, approx_time = timed(cluster_share_per_problem, questions, method="approx")
+    print(f"vectorized distance matrix: {fast_time:.2f}s, exact penalty end-to-end: {exact_time:.2f}s")
+    print(f"approx (MinHash/LSH) penalty end-to-end: {approx_time:.2f}s")
+
+    if not args.skip_nltk:
+        old_dist, old_dist_time = timed(_bleu_distance_matrix, questions)
+        old, old_time = timed(cluster_share_per_problem, questions, method="nltk")
+        print(f"nltk distance matrix: {old_dist_time:.2f}s, nltk penalty end-to-end: {old_time:.2f}s "
+              f"(speedup {old_time / exact_time:.1f}x)")
+        print(f"max |distance difference|: {np.abs(old_dist - fast_dist).max():.3e}")
+        print(f"exact penalties identical to nltk: {exact == old}")
+        reference = old
+    else:
+        reference = exact
+
+    changed = sum(abs(x - y) > 1e-12 for x, y in zip(approx, reference))
+    print(f"approx penalties changed: {changed}/{len(reference)}, "
+          f"max |penalty difference|: {max(abs(x - y) for x, y in zip(approx, reference)):.4f}")
+
+
+if __name__ == "__main__":
+    main()
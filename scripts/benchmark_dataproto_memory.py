@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Peak driver memory of the DataProto operations of one trainer step, with the lazy batch of
+`DataProto.reorder` (`LazyBatch`) against an eager copy of every column, as before.
+
+The step follows `RayPPOTrainer._rollout` and `fit` on synthetic data: pop the generation inputs,
+collect the rollout output of `--num_workers` workers (`--batch_size` prompts x `--n` samples x
+`--prompt_len` + `--response_len` tokens), repeat the prompt batch, union, balance (reorder),
+serialize the chunks of the worker calls (old log probs, ref log probs, update), union their outputs
+and read the columns the driver reads for the advantages and the data metrics. Each mode runs in a
+fresh process; reported is the peak resident memory above the memory held before the step.
+
+Usage:
+    python scripts/benchmark_dataproto_memory.py
+    python scripts/benchmark_dataproto_memory.py --batch_size 512 --n 16 --prompt_len 2048 --response_len 4096
+'''
+
+import argparse
+import multiprocessing as mp
+import pickle
+
+import numpy as np
+import torch
+
+from verl.protocol import DataProto
+from verl.trainer.metrics import compute_data_metrics
+from verl.utils.py_functional import peak_memory_gb
+
+
+def chunk_bytes(data, num_workers):
+    '''Serializes the chunks of a worker call like Ray does, returns the bytes sent.'''
+    total = 0
+    for chunk in data.chunk(chunks=num_workers):
+        buffers = []
+        blob = pickle.dumps(chunk, protocol=5, buffer_callback=buffers.append)
+        total += len(blob) + sum(buffer.raw().nbytes for buffer in buffers)
+        del blob, buffers
+
+    return total
+
+
+def run_step(args, eager, queue):
+    rows = args.batch_size * args.n
+    seq_len = args.prompt_len + args.response_len
+    prompts = DataProto.from_dict(
+        tensors={
+            "input_ids": torch.randint(0, 150000, (args.batch_size, args.prompt_len)),
+            "attention_mask": torch.ones(args.batch_size, args.prompt_len, dtype=torch.int64),
+            "position_ids": torch.arange(args.prompt_len).expand(args.batch_size, -1).contiguous(),
+        },
+        non_tensors={"ground_truth": np.array([str(i) for i in range(args.batch_size)], dtype=object)},
+    )
+    # rollout output as collected from the workers
+    gen_output = DataProto.concat([
+        DataProto.from_dict(tensors={
+            "prompts": torch.randint(0, 150000, (rows // args.num_workers, args.prompt_len)),
+            "responses": torch.randint(0, 150000, (rows // args.num_workers, args.response_len)),
+            "input_ids": torch.randint(0, 150000, (rows // args.num_workers, seq_len)),
+            "attention_mask": torch.randint(0, 2, (rows // args.num_workers, seq_len)),
+            "position_ids": torch.arange(seq_len).expand(rows // args.num_workers, -1).contiguous(),
+            "response_mask": torch.randint(0, 2, (rows // args.num_workers, args.response_len)),
+        })
+        for _ in range(args.num_workers)
+    ])
+    peak_memory_gb(reset=True)
+    start_gb = peak_memory_gb()  # the peak restarts from the current usage
+
+    batch = prompts
+    batch.pop(batch_keys=["input_ids", "attention_mask", "position_ids"])
+    batch.batch["uid"] = torch.arange(args.batch_size)
+    batch = batch.repeat(repeat_times=args.n, interleave=True)
+    batch = batch.union(gen_output)
+    del gen_output
+    indices = torch.randperm(rows)
+    if eager:  # the previous reorder: one indexing of the whole TensorDict
+        batch.batch = batch.batch[indices]
+        batch.non_tensor_batch = {key: value[indices.numpy()] for key, value in batch.non_tensor_batch.items()}
+    else:
+        batch.reorder(indices)
+
+    batch.meta_info["global_token_num"] = torch.sum(batch.batch["attention_mask"], dim=-1).tolist()
+    sent = chunk_bytes(batch, args.num_workers)  # compute_log_probs
+    batch = batch.union(DataProto.from_dict(tensors={"old_log_probs": torch.randn(rows, args.response_len)}))
+    sent += chunk_bytes(batch, args.num_workers)  # compute_ref_log_probs
+    batch = batch.union(DataProto.from_dict(tensors={"ref_log_probs": torch.randn(rows, args.response_len)}))
+    scores = torch.randn(rows, args.response_len)
+    batch.batch["token_level_scores"] = scores
+    batch.batch["token_level_rewards"] = scores
+    batch.batch["advantages"] = scores * batch.batch["response_mask"]
+    batch.batch["returns"] = batch.batch["advantages"]
+    sent += chunk_bytes(batch, args.num_workers)  # update_actor
+    compute_data_metrics(batch)
+    queue.put((peak_memory_gb() - start_gb, sent / 1024**3))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_size", type=int, default=512)
+    parser.add_argument("--n", type=int, default=16)
+    parser.add_argument("--prompt_len", type=int, default=2048)
+    parser.add_argument("--response_len", type=int, default=4096)
+    parser.add_argument("--num_workers", type=int, default=8)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    for name, eager in (("eager", True), ("lazy", False)):
+        queue = ctx.Queue()
+        process = ctx.Process(target=run_step, args=(args, eager, queue))
+        process.start()
+        peak_gb, sent_gb = queue.get()
+        process.join()
+        print(f"{name:>6}: driver peak memory during the step +{peak_gb:.2f} GB, {sent_gb:.2f} GB serialized")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Benchmark of DataProto serialization on a rollout batch of `--batch_size` prompts x `--n`
+responses x `--seq_len` tokens (prompt + response), with the tensors the trainer ships to the
+workers after generation (input_ids, attention_mask, position_ids, responses, response_mask,
+old_log_probs, ref_log_probs, advantages, uid).
+
+Compared: the previous `DataProto.__getstate__` (TensorDict consolidated, torch.save into a
+BytesIO, getvalue, torch.load on the other side) against the current one (tensor storages passed
+as out-of-band pickle-5 buffers). Reported per path:
+    pickle    in-process pickle.dumps + pickle.loads with protocol 5 and a buffer callback
+    dispatch  the batch chunked over `--num_workers` Ray actors as dispatch_dp_compute_data_proto
+              does, until every actor has received its chunk and touched its tensors
+
+Usage:
+    python scripts/benchmark_dataproto_serialization.py
+    # smaller batch for a workstation
+    python scripts/benchmark_dataproto_serialization.py --batch_size 64 --num_workers 2
+'''
+
+import argparse
+import io
+import pickle
+import time
+
+import numpy as np
+import ray
+import torch
+
+from verl.protocol import DataProto
+
+
+class LegacyDataProto(DataProto):
+    '''DataProto with the previous torch.save based serialization.'''
+
+    def __getstate__(self):
+        buffer = io.BytesIO()
+        if self.batch is not None:
+            self.batch = self.batch.contiguous()
+            self.batch = self.batch.consolidate()
+
+        torch.save(self.batch, buffer)
+        return buffer.getvalue(), self.non_tensor_batch, self.meta_info
+
+    def __setstate__(self, data):
+        batch_bytes, non_tensor_batch, meta_info = data
+        self.batch = torch.load(io.BytesIO(batch_bytes), weights_only=False, map_location="cpu")
+        self.non_tensor_batch = non_tensor_batch
+        self.meta_info = meta_info
+
+
+def build_batch(cls, batch_size, n, seq_len, response_len):
+    rows = batch_size * n
+    input_ids = torch.randint(0, 150000, (rows, seq_len))
+    attention_mask = torch.ones(rows, seq_len, dtype=torch.int64)
+    response_mask = torch.ones(rows, response_len, dtype=torch.int64)
+    tensors = {
+        "input_ids": input_ids,
+        "attention_mask": attention_mask,
+        "position_ids": torch.arange(seq_len).expand(rows, seq_len).contiguous(),
+        "responses": input_ids[:, -response_len:].contiguous(),
+        "response_mask": response_mask,
+        "old_log_probs": torch.randn(rows, response_len),
+        "ref_log_probs": torch.randn(rows, response_len),
+        "advantages": torch.randn(rows, response_len),
+        "uid": torch.arange(batch_size).repeat_interleave(n),
+    }
+    non_tensors = {"ground_truth": np.array([str(i % batch_size) for i in range(rows)], dtype=object)}
+    return cls.from_dict(tensors=tensors, non_tensors=non_tensors, meta_info={"temperature": 1.0})
+
+
+@ray.remote
+class Receiver:
+    def receive(self, data):
+        # touch every tensor like a worker moving its chunk to the device
+        return sum(int(tensor.view(-1)[-1].item() != 0) for tensor in data.batch.values())
+
+
+def time_pickle(data, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        buffers = []
+        blob = pickle.dumps(data, protocol=5, buffer_callback=buffers.append)
+        pickle.loads(blob, buffers=buffers)
+        best = min(best, time.perf_counter() - start)
+        del blob, buffers
+
+    return best
+
+
+def time_dispatch(data, receivers, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks = [
+            type(data)(batch=chunk.batch, non_tensor_batch=chunk.non_tensor_batch, meta_info=chunk.meta_info)
+            for chunk in data.chunk(chunks=len(receivers))
+        ]
+        ray.get([receiver.receive.remote(chunk) for receiver, chunk in zip(receivers, chunks)])
+        best = min(best, time.perf_counter() - start)
+        del chunks
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_size", type=int, default=512)
+    parser.add_argument("--n", type=int, default=16)
+    parser.add_argument("--seq_len", type=int, default=6144)
+    parser.add_argument("--response_len", type=int, default=4096)
+    parser.add_argument("--num_workers", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    ray.init(include_dashboard=False)
+    receivers = [Receiver.remote() for _ in range(args.num_workers)]
+    ray.get([receiver.__ray_ready__.remote() for receiver in receivers])
+    for name, cls in (("torch.save", LegacyDataProto), ("zero-copy", DataProto)):
+        data = build_batch(cls, args.batch_size, args.n, args.seq_len, args.response_len)
+        size_gb = sum(tensor.numel() * tensor.element_size() for tensor in data.batch.values()) / 1024**3
+        pickle_s = time_pickle(data, args.repeats)
+        dispatch_s = time_dispatch(data, receivers, args.repeats)
+        print(
+            f"{name:>10}: {size_gb:.2f} GB batch, pickle {pickle_s * 1000:.1f} ms, "
+            f"dispatch to {args.num_workers} workers {dispatch_s * 1000:.0f} ms"
+        )
+        del data
+
+    ray.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Checks the chunked log probs + entropy (`verl.utils.torch_functional.log_probs_and_entropy`) against
+`log_probs_from_logits` and `entropy_from_logits` on `--num_tokens` tokens of a `--vocab_size` vocab,
+and compares their peak memory, forward and backward of the log probs, on GPU if there is one.
+The gradients of all three in bf16 are also compared against fp64 on `--grad_num_tokens` tokens of a
+`--grad_vocab_size` vocab, where the lm_head gradient sums over many token chunks.
+
+Compared:
+    current         lm_head logits, then log_probs_from_logits and entropy_from_logits
+    chunked logits  lm_head logits, then log_probs_and_entropy on the logits
+    fused           log_probs_and_entropy on the hidden states and the lm_head weight
+
+Usage:
+    python scripts/benchmark_log_probs_entropy.py
+    python scripts/benchmark_log_probs_entropy.py --num_tokens 16384 --vocab_size 151936 --hidden_size 3584 --dtype bf16
+'''
+
+import argparse
+import multiprocessing as mp
+
+import torch
+
+from verl.utils import torch_functional as VF
+from verl.utils.py_functional import peak_memory_gb
+
+
+DTYPES = {"fp32": torch.float32, "bf16": torch.bfloat16}
+
+
+def make_inputs(args, device):
+    generator = torch.Generator(device=device).manual_seed(0)
+    dtype = DTYPES[args.dtype]
+    hidden_states = torch.randn(args.num_tokens, args.hidden_size, device=device, generator=generator).to(dtype)
+    weight = (torch.randn(args.vocab_size, args.hidden_size, device=device, generator=generator) * 0.02).to(dtype)
+    labels = torch.randint(0, args.vocab_size, (args.num_tokens,), device=device, generator=generator)
+    return hidden_states.requires_grad_(), weight.requires_grad_(), labels
+
+
+def run(args, mode, hidden_states, weight, labels):
+    if mode == "current":
+        logits = (hidden_states @ weight.t()).div(args.temperature)
+        log_probs, entropy = VF.log_probs_from_logits(logits, labels), VF.entropy_from_logits(logits)
+    elif mode == "chunked logits":
+        logits = hidden_states @ weight.t()
+        log_probs, entropy = VF.log_probs_and_entropy(
+            logits, labels, temperature=args.temperature, chunk_size=args.chunk_size
+        )
+    else:
+        log_probs, entropy = VF.log_probs_and_entropy(
+            hidden_states, labels, weight=weight, temperature=args.temperature, chunk_size=args.chunk_size
+        )
+
+    log_probs.sum().backward()
+    return log_probs.detach().float(), entropy.detach().float(), hidden_states.grad.float(), weight.grad.float()
+
+
+def bf16_grad_errors(args, device):
+    '''Relative errors of the bf16 gradients of every mode against the fp64 current one.'''
+    grad_args = argparse.Namespace(
+        **{**vars(args), "num_tokens": args.grad_num_tokens, "vocab_size": args.grad_vocab_size, "dtype": "bf16"}
+    )
+    hidden_states, weight, labels = make_inputs(grad_args, device)
+    hidden_states, weight = hidden_states.detach(), weight.detach()
+    reference = run(grad_args, "current", hidden_states.double().requires_grad_(), weight.double().requires_grad_(), labels)
+    for mode in ("current", "chunked logits", "fused"):
+        outputs = run(grad_args, mode, hidden_states.clone().requires_grad_(), weight.clone().requires_grad_(), labels)
+        errors = [((output.double() - ref).norm() / ref.norm()).item() for output, ref in zip(outputs[2:], reference[2:])]
+        print(
+            f"{mode:>14}: bf16 relative error vs fp64 current on {args.grad_num_tokens} tokens: "
+            f"grad hidden states {errors[0]:.1e}, grad lm_head {errors[1]:.1e}"
+        )
+
+
+def measure(args, mode, queue):
+    '''Peak memory above the inputs of one mode, in a fresh process.'''
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    inputs = make_inputs(args, device)
+    if device == "cuda":
+        torch.cuda.reset_peak_memory_stats()
+        start_gb = torch.cuda.memory_allocated() / 1024**3
+    else:
+        peak_memory_gb(reset=True)
+        start_gb = peak_memory_gb()
+
+    run(args, mode, *inputs)
+    end_gb = torch.cuda.max_memory_allocated() / 1024**3 if device == "cuda" else peak_memory_gb()
+    queue.put(end_gb - start_gb)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_tokens", type=int, default=1024)
+    parser.add_argument("--vocab_size", type=int, default=151936)
+    parser.add_argument("--hidden_size", type=int, default=256)
+    parser.add_argument("--dtype", type=str, default="fp32", choices=list(DTYPES.keys()))
+    parser.add_argument("--temperature", type=float, default=0.8)
+    parser.add_argument("--chunk_size", type=int, default=1024)
+    parser.add_argument("--grad_num_tokens", type=int, default=8192)
+    parser.add_argument("--grad_vocab_size", type=int, default=1000)
+    args = parser.parse_args()
+
+    # numerics on a slice of the tokens, in fp64 for the reference
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    hidden_states, weight, labels = make_inputs(args, device)
+    small = argparse.Namespace(**{**vars(args), "num_tokens": min(args.num_tokens, 256)})
+    hidden_states, labels = hidden_states[: small.num_tokens].detach(), labels[: small.num_tokens]
+    reference = run(
+        small, "current", hidden_states.double().requires_grad_(), weight.detach().double().requires_grad_(), labels
+    )
+    for mode in ("chunked logits", "fused"):
+        outputs = run(small, mode, hidden_states.clone().requires_grad_(), weight.detach().clone().requires_grad_(), labels)
+        errors = [(output.double() - ref).abs().max().item() for output, ref in zip(outputs, reference)]
+        print(
+            f"{mode:>14}: max abs error vs fp64 current: log probs {errors[0]:.1e}, entropy {errors[1]:.1e}, "
+            f"grad hidden states {errors[2]:.1e}, grad lm_head {errors[3]:.1e}"
+        )
+
+    bf16_grad_errors(args, device)
+
+    ctx = mp.get_context("spawn")
+    for mode in ("current", "chunked logits", "fused"):
+        queue = ctx.Queue()
+        process = ctx.Process(target=measure, args=(args, mode, queue))
+        process.start()
+        peak_gb = queue.get()
+        process.join()
+        print(f"{mode:>14}: peak {'GPU' if device == 'cuda' else 'resident'} memory +{peak_gb:.2f} GB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Benchmark of vLLM automatic prefix caching on the solver workload of
+`vllm_service_init/start_vllm_server.py` and `question_evaluate/evaluate.py`: every prompt starts
+with the same system message and each question is sampled n times.
+
+For every `--gpu_mem_utils` value the same prompts are generated with prefix caching on and off,
+each run in a fresh process (vLLM does not hand GPU memory back inside one process). Reported per
+run: KV cache blocks, generation time, output tokens/s, and the prompt tokens vLLM served from the
+prefix cache (`RequestOutput.num_cached_tokens`, reported once per question, against the prompt
+length of the question). The "reusable" line is the upper bound over all n samples from the
+prompt structure: the shared system prefix of every prompt but the first, plus the whole prompt
+for the n - 1 extra samples of each question.
+
+Usage:
+    CUDA_VISIBLE_DEVICES=0 python scripts/benchmark_prefix_caching.py --model Qwen/Qwen3-4B-Base
+    # real questions, e.g. a generated_question file, and a few memory fractions
+    CUDA_VISIBLE_DEVICES=0 python scripts/benchmark_prefix_caching.py --model Qwen/Qwen3-4B-Base \
+        --input $STORAGE_PATH/generated_question/xxx_0.json --gpu_mem_utils 0.5,0.7,0.9
+'''
+
+import argparse
+import json
+import multiprocessing as mp
+import random
+import time
+
+SYSTEM_PROMPT = "Please reason step by step, and put your final answer within \\boxed{}."
+
+
+def synthetic_questions(num_questions, seed):
+    rng = random.Random(seed)
+    return [
+        f"Let $f(x) = {rng.randint(2, 9)}x^2 + {rng.randint(2, 99)}x + {rng.randint(2, 99)}$. "
+        f"Find the remainder when $f({rng.randint(10, 999)})$ is divided by {rng.randint(3, 97)}."
+        for _ in range(num_questions)
+    ]
+
+
+def load_questions(path):
+    with open(path) as f:
+        data = json.load(f)
+    return [item["question"] if isinstance(item, dict) else str(item) for item in data]
+
+
+def build_prompts(tokenizer, questions):
+    '''Same prompts as the solver server and evaluate.py.'''
+    chats = [[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": q}] for q in questions]
+    if tokenizer.chat_template:
+        return [tokenizer.apply_chat_template(chat, tokenize=False, add_generation_prompt=True, add_special_tokens=True) for chat in chats]
+    return ["system: " + chat[0]["content"] + "\n" + "user: " + chat[1]["content"] for chat in chats]
+
+
+def reusable_prompt_tokens(tokenizer, prompts, num_samples):
+    '''Upper bound of the prompt tokens a prefix cache can serve for this batch.'''
+    token_ids = tokenizer(prompts)["input_ids"]
+    shared = token_ids[0]
+    for ids in token_ids[1:]:
+        common = 0
+        for a, b in zip(shared, ids):
+            if a != b:
+                break
+            common += 1
+        shared = shared[:common]
+
+    total = sum(len(ids) for ids in token_ids) * num_samples
+    reusable = len(shared) * (len(token_ids) - 1) + sum(len(ids) for ids in token_ids) * (num_samples - 1)
+    return total, reusable, len(shared)
+
+
+def run_once(args, questions, prefix_caching, gpu_mem_util, results):
+    import vllm
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model, trust_remote_code=True)
+    start = time.time()
+    model = vllm.LLM(
+        model=args.model,
+        tokenizer=args.model,
+        gpu_memory_utilization=gpu_mem_util,
+        seed=args.seed,
+        trust_remote_code=True,
+        enable_prefix_caching=prefix_caching,
+    )
+    load_s = time.time() - start
+    sample_params = vllm.SamplingParams(
+        max_tokens=args.max_tokens,
+        temperature=1.0,
+        top_p=1.0,
+        top_k=40,
+        stop_token_ids=[tokenizer.eos_token_id],
+        n=args.num_samples,
+    )
+
+    prompts = build_prompts(tokenizer, questions)
+    start = time.time()
+    responses = model.generate(prompts, sampling_params=sample_params, use_tqdm=False)
+    gen_s = time.time() - start
+
+    results.put({
+        "prefix_caching": prefix_caching,
+        "gpu_mem_util": gpu_mem_util,
+        "num_gpu_blocks": model.llm_engine.cache_config.num_gpu_blocks,
+        "load_s": load_s,
+        "gen_s": gen_s,
+        "prompt_tokens": sum(len(response.prompt_token_ids) for response in responses),
+        "cached_tokens": sum(response.num_cached_tokens or 0 for response in responses),
+        "output_tokens": sum(len(output.token_ids) for response in responses for output in response.outputs),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vLLM prefix caching on the solver prompts.")
+    parser.add_argument("--model", type=str, default="Qwen/Qwen3-4B-Base")
+    parser.add_argument("--input", type=str, default=None, help="JSON list of questions (or of {question: ...}).")
+    parser.add_argument("--num_questions", type=int, default=256)
+    parser.add_argument("--num_samples", type=int, default=10, help="Samples per question (n), as in the solver.")
+    parser.add_argument("--max_tokens", type=int, default=1024, help="Lower than the solver's 4096 to keep runs short.")
+    parser.add_argument("--gpu_mem_utils", type=str, default="0.9", help="Comma-separated memory fractions to try.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    questions = load_questions(args.input) if args.input else synthetic_questions(args.num_questions, args.seed)
+    questions = questions[: args.num_questions]
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model, trust_remote_code=True)
+    total, reusable, shared = reusable_prompt_tokens(tokenizer, build_prompts(tokenizer, questions), args.num_samples)
+    print(f"{len(questions)} questions x {args.num_samples} samples, shared system prefix: {shared} tokens")
+    print(f"reusable: {reusable}/{total} prefill tokens ({reusable / total:.1%})")
+
+    ctx = mp.get_context("spawn")
+    runs = []
+    for gpu_mem_util in [float(value) for value in args.gpu_mem_utils.split(",")]:
+        for prefix_caching in (False, True):
+            results = ctx.Queue()
+            process = ctx.Process(target=run_once, args=(args, questions, prefix_caching, gpu_mem_util, results))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(f"gpu_mem_util={gpu_mem_util} prefix_caching={prefix_caching}: failed (exit code {process.exitcode})")
+                continue
+            runs.append(results.get())
+
+    print()
+    print(f"{'mem':>5} {'prefix':>6} {'blocks':>7} {'gen_s':>8} {'out_tok/s':>10} {'saved':>18} {'speedup':>8}")
+    baseline = {run["gpu_mem_util"]: run["gen_s"] for run in runs if not run["prefix_caching"]}
+    for run in runs:
+        saved = f"{run['cached_tokens']}/{run['prompt_tokens']}"
+        speedup = baseline.get(run["gpu_mem_util"], float("nan")) / run["gen_s"]
+        print(
+            f"{run['gpu_mem_util']:>5.2f} {'on' if run['prefix_caching'] else 'off':>6} {run['num_gpu_blocks']:>7} "
+            f"{run['gen_s']:>8.2f} {run['output_tokens'] / run['gen_s']:>10.1f} {saved:>18} {speedup:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Checks that the vectorized GRPO and RLOO outcome advantages (`group_rows` / `_group_std` in
+`verl.trainer.core_algos`) are bit-for-bit equal (`torch.equal`) to the previous per-uid loops,
+which are kept below as the reference.
+
+Cases: uniform and uneven group sizes, unsorted non-contiguous uids (strings and integer ids),
+groups whose scores are all equal (std 0), binary and continuous rewards, several `eps` for the
+std normalization, and rewards spread over several tokens. Singleton groups must make both
+implementations raise. Exits with status 1 on the first mismatch.
+
+Usage:
+    python scripts/check_group_advantages.py
+    python scripts/check_group_advantages.py --trials 200 --dtype fp64
+'''
+
+import argparse
+import os
+import sys
+from collections import defaultdict
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from verl.trainer import core_algos  # noqa: E402
+
+
+DTYPES = {"fp32": torch.float32, "fp64": torch.float64}
+
+
+def loop_grpo(token_level_rewards, response_mask, index, eps=1e-6):
+    '''The per-uid GRPO loop that `compute_grpo_outcome_advantage` replaced.'''
+    scores = token_level_rewards.sum(dim=-1)
+    id2score = defaultdict(list)
+    id2mean, id2std = {}, {}
+
+    bsz = scores.shape[0]
+    for i in range(bsz):
+        id2score[index[i]].append(scores[i])
+
+    for idx in id2score:
+        assert len(id2score[idx]) > 1, "GRPO needs rollout.n > 1."
+        id2mean[idx] = torch.mean(torch.tensor(id2score[idx]))
+        id2std[idx] = torch.std(torch.tensor(id2score[idx]))
+
+    for i in range(bsz):
+        scores[i] = (scores[i] - id2mean[index[i]]) / (id2std[index[i]] + eps)
+
+    returns = scores.unsqueeze(-1) * response_mask
+    return returns, returns
+
+
+def loop_rloo(token_level_rewards, response_mask, index):
+    '''The per-uid RLOO loop that `compute_rloo_outcome_advantage` replaced.'''
+    scores = token_level_rewards.sum(dim=-1)
+
+    id2score = defaultdict(list)
+    id2sum = {}
+    bsz = scores.shape[0]
+    for i in range(bsz):
+        id2score[index[i]].append(scores[i])
+
+    for idx in id2score:
+        id2sum[idx] = torch.sum(torch.tensor(id2score[idx]))
+
+    for i in range(bsz):
+        sample_num = len(id2score[index[i]])
+        assert sample_num > 1, "RLOO needs rollout.n > 1."
+        baseline = (id2sum[index[i]] - scores[i]) / (sample_num - 1)
+        scores[i] = scores[i] - baseline
+
+    returns = scores.unsqueeze(-1) * response_mask
+    return returns, returns
+
+
+def make_batch(rng, group_sizes, dtype, binary, equal_groups, spread, response_length=8):
+    '''Rewards and shuffled uids for groups of `group_sizes`; returns string uids and integer ids.'''
+    group_ids = np.repeat(rng.permutation(10**6)[: len(group_sizes)], group_sizes)
+    perm = rng.permutation(len(group_ids))  # unsorted, non-contiguous groups
+    group_ids = group_ids[perm]
+    bsz = len(group_ids)
+
+    if binary:
+        scores = rng.integers(0, 2, size=bsz).astype(np.float64)
+    else:
+        scores = rng.standard_normal(bsz) * rng.choice([1e-3, 1.0, 1e3])
+
+    for group in rng.permutation(np.unique(group_ids))[:equal_groups]:
+        scores[group_ids == group] = scores[group_ids == group][0]
+
+    response_mask = torch.ones(bsz, response_length, dtype=dtype)
+    lengths = rng.integers(1, response_length + 1, size=bsz)
+    for i, length in enumerate(lengths):
+        response_mask[i, length:] = 0
+
+    token_level_rewards = torch.zeros(bsz, response_length, dtype=dtype)
+    if spread:  # the score split over the response tokens, the sum done in `dtype`
+        weights = rng.dirichlet(np.ones(response_length), size=bsz)
+        token_level_rewards += torch.from_numpy(scores[:, None] * weights).to(dtype) * response_mask
+    else:
+        token_level_rewards[torch.arange(bsz), torch.from_numpy(lengths - 1)] = torch.from_numpy(scores).to(dtype)
+
+    uids = np.array([f"uid-{group}" for group in group_ids], dtype=object)
+    return token_level_rewards, response_mask, uids, group_ids
+
+
+def compare(name, reference_fn, vectorized_fn, token_level_rewards, response_mask, uids, group_ids, **kwargs):
+    expected, _ = reference_fn(token_level_rewards.clone(), response_mask, uids, **kwargs)
+    for index in (uids, group_ids, torch.from_numpy(group_ids)):
+        actual, _ = vectorized_fn(token_level_rewards.clone(), response_mask, index, **kwargs)
+        if not torch.equal(actual, expected):
+            diff = (actual - expected).abs().max().item()
+            print(f"MISMATCH {name} {kwargs} index={type(index).__name__}: max abs diff {diff:.3e}")
+            return False
+
+    return True
+
+
+def check_singletons(dtype):
+    '''A group with a single sample must fail in both implementations.'''
+    rng = np.random.default_rng(0)
+    token_level_rewards, response_mask, uids, group_ids = make_batch(rng, [3, 1, 4], dtype, False, 0, False)
+    ok = True
+    for name, reference_fn, vectorized_fn in (
+        ("grpo", loop_grpo, core_algos.compute_grpo_outcome_advantage),
+        ("rloo", loop_rloo, core_algos.compute_rloo_outcome_advantage),
+    ):
+        for fn in (reference_fn, vectorized_fn):
+            try:
+                fn(token_level_rewards.clone(), response_mask, uids)
+            except AssertionError:
+                continue
+
+            print(f"MISMATCH {name}: {fn.__name__} accepted a singleton group")
+            ok = False
+
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=50)
+    parser.add_argument("--dtype", type=str, default="fp32", choices=list(DTYPES.keys()))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    dtype = DTYPES[args.dtype]
+    rng = np.random.default_rng(args.seed)
+    ok = check_singletons(dtype)
+    cases = 0
+    for trial in range(args.trials):
+        num_groups = int(rng.integers(1, 65))
+        if trial % 2 == 0:
+            group_sizes = [int(rng.choice([2, 4, 5, 8, 16]))] * num_groups
+        else:
+            group_sizes = rng.integers(2, 33, size=num_groups).tolist()
+
+        batch = make_batch(
+            rng,
+            group_sizes,
+            dtype,
+            binary=trial % 3 == 0,
+            equal_groups=int(rng.integers(0, num_groups + 1)),
+            spread=trial % 4 == 1,
+        )
+        for eps in (1e-6, 1e-3, 1.0):
+            ok &= compare("grpo", loop_grpo, core_algos.compute_grpo_outcome_advantage, *batch, eps=eps)
+
+        ok &= compare("rloo", loop_rloo, core_algos.compute_rloo_outcome_advantage, *batch)
+        cases += 1
+
+    print(f"{cases} batches ({args.dtype}): {'all equal' if ok else 'MISMATCHES FOUND'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
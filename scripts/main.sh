@@ -1,6 +1,12 @@
 Base_model=$1
 Model_abbr=$2
 echo "Model_abbr: $Model_abbr"
+
+# 常驻生成服务：问题生成和评估复用已加载的 vLLM 引擎，每次迭代只换权重，不再重新启动
+export GEN_DAEMON_DIR=${GEN_DAEMON_DIR:-/tmp/rzero_gen_$$}
+bash vllm_service_init/generation_daemons.sh start || exit 1
+trap "bash vllm_service_init/generation_daemons.sh stop" EXIT
+
 # Initialize first iteration with base model
 bash scripts/questioner_train_penalty.sh $Base_model $Base_model ${Model_abbr}_questioner_v1
 bash scripts/solver_train.sh $Base_model ${STORAGE_PATH}/models/${Model_abbr}_questioner_v1/global_step_5/actor/huggingface ${Model_abbr}_solver_v1
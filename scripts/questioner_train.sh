@@ -7,6 +7,8 @@ echo $STORAGE_PATH
 echo "start train questioner $questioner_model_path $save_path" 
 
 bash vllm_service_init/start.sh $solver_model_path &
+# 奖励函数从 SOLVER_SERVERS 发现 vLLM 服务（与 start.sh 启动的端口一致）
+export SOLVER_SERVERS=5000,5001
 
 
 CUDA_VISIBLE_DEVICES=0,1,2,3 python3 -m verl.trainer.main \
@@ -45,6 +45,8 @@ fi
 
 # 启动 vllm 服务（记录 PID）
 bash vllm_service_init/start.sh $solver_model_path $RUN_ID
+# 奖励函数从 SOLVER_SERVERS 发现 vLLM 服务（与 start.sh 启动的端口一致）
+export SOLVER_SERVERS=5000,5001
 echo "vLLM services started with RUN_ID=$RUN_ID"
 
 # 开始训练 Questioner
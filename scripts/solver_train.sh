@@ -16,13 +16,38 @@ echo $STORAGE_PATH
 echo "start train solver $experiment_name $solver_model_path $questioner_model_path" 
 
 export VLLM_DISABLE_COMPILE_CACHE=1
-echo 'start generate question'
-bash question_generate/question_generate.bash $questioner_model_path 8000 $experiment_name
-echo 'start evaluate generated question'
-bash question_evaluate/evaluate.sh $solver_model_path $experiment_name
+if [ "${SOLVER_DATA_PIPELINE:-stream}" == "barrier" ]; then
+    echo 'start generate question'
+    bash question_generate/question_generate.bash $questioner_model_path 8000 $experiment_name
+    echo 'start dedup generated question'
+    python question_evaluate/dedup.py --save_name $experiment_name --dedup minhash --dedup_threshold 0.9
+    echo 'start evaluate generated question'
+    bash question_evaluate/evaluate.sh $solver_model_path $experiment_name
+else
+    # 流水线：GPU 4 生成问题，解析出的问题立即送到 GPU 5,6,7 评估；GPU 4 生成完后也转去评估
+    echo 'start generate and evaluate question (pipelined)'
+    daemon_arg=""
+    [ -n "$GEN_DAEMON_DIR" ] && daemon_arg="--daemon_dir $GEN_DAEMON_DIR"
+    python question_evaluate/pipeline.py \
+        --questioner_model $questioner_model_path \
+        --solver_model $solver_model_path \
+        --save_name $experiment_name \
+        --num_questions 8000 \
+        --gen_gpus 4 \
+        --eval_gpus 5,6,7 \
+        --num_samples 10 \
+        --dedup minhash \
+        --dedup_threshold 0.9 \
+        $daemon_arg
+fi
 echo 'start upload'
 # 论文参数: 保留 score 在 0.25-0.75 之间的问题 (δ=0.25, 对应 3-7 个答案匹配多数投票)
-python question_evaluate/upload.py --repo_name ${experiment_name} --max_score 0.75 --min_score 0.25 --experiment_name ${experiment_name}
+# 训练数据写到本地 ${STORAGE_PATH}/datasets/${experiment_name}，不再经过 HuggingFace Hub
+# 需要同时上传到 Hub 时设置 PUSH_TO_HUB=1（后台进行，不阻塞训练）
+push_arg=""
+[ "${PUSH_TO_HUB:-0}" == "1" ] && push_arg="--push_to_hub"
+python question_evaluate/upload.py --repo_name ${experiment_name} --max_score 0.75 --min_score 0.25 --experiment_name ${experiment_name} \
+    --local_dir ${STORAGE_PATH}/datasets/${experiment_name} $push_arg
 echo 'start train'
 
 python3 -m verl.trainer.main \
@@ -31,7 +56,7 @@ python3 -m verl.trainer.main \
     worker.actor.model.model_path=$solver_model_path \
     trainer.experiment_name=${experiment_name} \
     trainer.save_checkpoint_path=${STORAGE_PATH}/models/${experiment_name}/ \
-    data.train_files=${HUGGINGFACENAME}/${experiment_name}@train \
+    data.train_files=${STORAGE_PATH}/datasets/${experiment_name} \
     trainer.total_epochs=15 \
     trainer.max_steps=15 \
     data.format_prompt=./examples/format_prompt/solver.jinja \
@@ -17,8 +17,9 @@ We can subclass Protocol to define more detailed batch info with specific keys
 """
 
 import copy
-import io
+import hashlib
 import pickle
+import weakref
 from collections import defaultdict
 from dataclasses import dataclass, field
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
@@ -155,6 +156,125 @@ def collate_fn(data_items: list["DataProtoItem"]):
     return DataProto(batch=batch, non_tensor_batch=non_tensor_batch)
 
 
+def _tensor_to_buffer(tensor: torch.Tensor) -> Tuple[torch.dtype, Tuple[int, ...], NDArray]:
+    """Flat uint8 view of the tensor storage (copied only if the tensor is on GPU or not contiguous)."""
+    tensor = tensor.detach().cpu().contiguous()
+    return tensor.dtype, tuple(tensor.shape), tensor.view(-1).view(torch.uint8).numpy()
+
+
+def _buffer_to_tensor(dtype: torch.dtype, shape: Tuple[int, ...], buffer: NDArray) -> torch.Tensor:
+    # A read-only buffer (Ray object store) keeps torch's non-writable warning on purpose.
+    return torch.from_numpy(buffer).view(dtype).view(shape)
+
+
+class LazyBatch:
+    """
+    Column-level lazy TensorDict used as `DataProto.batch`. A column is either materialized or a
+    (source, index) pair standing for `source[index]`: `DataProto.reorder` (the dp balancing of the
+    whole rollout batch) only composes row indices, `select` and `chunk` are projections and
+    slices, and a column is gathered the first time the driver reads it. Serialization gathers the
+    rows of the sent chunk and `ColumnStore` ships the sources with row indices, so a column nobody
+    reads on the driver is never copied there. `to` and `rename_key_` gather every column; any
+    other TensorDict API raises, call `materialize` for the TensorDict instead.
+    """
+
+    def __init__(self, tensors: TensorDict, lazy: Dict[str, Tuple[torch.Tensor, torch.Tensor]]):
+        self._tensors = tensors  # materialized columns, holds the batch size
+        self._lazy = lazy
+
+    @classmethod
+    def from_index(cls, batch: Union[TensorDict, "LazyBatch"], index: torch.Tensor) -> "LazyBatch":
+        """`batch[index]` without gathering any column."""
+        tensors, lazy = (batch._tensors, batch._lazy) if isinstance(batch, LazyBatch) else (batch, {})
+        columns = {key: (tensor, index) for key, tensor in tensors.items()}
+        columns.update({key: (source, source_index[index]) for key, (source, source_index) in lazy.items()})
+        return cls(TensorDict({}, batch_size=(len(index),)), columns)
+
+    @property
+    def batch_size(self) -> torch.Size:
+        return self._tensors.batch_size
+
+    def __len__(self) -> int:
+        return self.batch_size[0]
+
+    def keys(self) -> List[str]:
+        return list(self._tensors.keys()) + list(self._lazy.keys())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._lazy or key in self._tensors.keys()
+
+    def gather(self, key: str) -> torch.Tensor:
+        """The column without keeping the gathered copy."""
+        if key in self._lazy:
+            source, index = self._lazy[key]
+            return source[index]
+
+        return self._tensors[key]
+
+    def __getitem__(self, item: Union[str, slice, int]) -> Union[torch.Tensor, "LazyBatch", TensorDict]:
+        if isinstance(item, str):
+            if item in self._lazy:
+                self._tensors[item] = self.gather(item)
+                del self._lazy[item]
+
+            return self._tensors[item]
+
+        if isinstance(item, slice):
+            return LazyBatch(
+                self._tensors[item], {key: (source, index[item]) for key, (source, index) in self._lazy.items()}
+            )
+
+        return self.materialize()[item]
+
+    def __setitem__(self, key: str, value: torch.Tensor) -> None:
+        self._lazy.pop(key, None)
+        self._tensors[key] = value
+
+    def pop(self, key: str) -> torch.Tensor:
+        if key in self._lazy:
+            source, index = self._lazy.pop(key)
+            return source[index]
+
+        return self._tensors.pop(key)
+
+    def items(self) -> List[Tuple[str, torch.Tensor]]:
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self) -> List[torch.Tensor]:
+        return [self[key] for key in self.keys()]
+
+    def select(self, *keys: str) -> "LazyBatch":
+        tensors = self._tensors.select(*[key for key in keys if key not in self._lazy])
+        return LazyBatch(tensors, {key: self._lazy[key] for key in keys if key in self._lazy})
+
+    def chunk(self, chunks: int, dim: int = 0) -> List["LazyBatch"]:
+        assert dim == 0, "LazyBatch only chunks along the batch dim."
+        chunk_size = len(self) // chunks
+        return [self[i * chunk_size : (i + 1) * chunk_size] for i in range(chunks)]
+
+    def materialize(self) -> TensorDict:
+        for key in list(self._lazy.keys()):
+            self[key]
+
+        return self._tensors
+
+    def to(self, *args, **kwargs) -> TensorDict:
+        return self.materialize().to(*args, **kwargs)
+
+    def rename_key_(self, old_keys: Tuple[str, ...], new_keys: Tuple[str, ...]) -> "LazyBatch":
+        self.materialize().rename_key_(old_keys, new_keys)
+        return self
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):  # not set yet, e.g. during copy
+            raise AttributeError(name)
+
+        # no silent fallback to the TensorDict: it would gather every column behind the caller's back
+        raise AttributeError(
+            f"LazyBatch has no attribute {name!r}, call `materialize()` to get the TensorDict first."
+        )
+
+
 @dataclass
 class DataProtoItem:
     batch: Optional[TensorDict] = None
@@ -193,20 +313,42 @@ class DataProto:
         return_type = DataProto if isinstance(item, slice) else DataProtoItem
         return return_type(batch=tensor_data, non_tensor_batch=non_tensor_data, meta_info=self.meta_info)
 
-    def __getstate__(self) -> Tuple[bytes, Dict[str, NDArray], Dict[str, Any]]:
-        buffer = io.BytesIO()
+    def __getstate__(self) -> Tuple[Optional[Tuple], Dict[str, NDArray], Dict[str, Any]]:
+        """
+        Every tensor is pickled as a flat uint8 numpy view of its storage plus its dtype and shape,
+        so pickle protocol 5 and Ray pass the storages as out-of-band buffers without copying them.
+        Numeric arrays of `non_tensor_batch` take the same path, object arrays are pickled in-band.
+        """
+        batch_state = None
         if self.batch is not None:
-            self.batch: TensorDict = self.batch.contiguous()
-            self.batch: TensorDict = self.batch.consolidate()
+            if isinstance(self.batch, LazyBatch):
+                tensors = {key: _tensor_to_buffer(self.batch.gather(key)) for key in self.batch.keys()}
+            else:
+                tensors = {key: _tensor_to_buffer(tensor) for key, tensor in self.batch.items()}
+
+            batch_state = (tuple(self.batch.batch_size), tensors)
 
-        torch.save(self.batch, buffer)
-        buffer_bytes = buffer.getvalue()
-        return buffer_bytes, self.non_tensor_batch, self.meta_info
+        return batch_state, self.non_tensor_batch, self.meta_info
+
+    def __setstate__(self, data: Tuple[Optional[Tuple], Dict[str, NDArray], Dict[str, Any]]) -> None:
+        """
+        Tensors are rebuilt as views of the received buffers, without copying. Ray hands out
+        read-only views of its object store and torch cannot mark a tensor read-only, so writing such
+        a tensor in place is undefined behaviour; torch warns about it ("The given NumPy array is not
+        writable") the first time. Zero-copy is safe for callers that only read the received tensors
+        or replace whole columns (`data.batch[key] = ...`): the workers, which move the batch to the
+        GPU with `DataProto.to`, and the driver, which reads and concatenates worker outputs. A caller
+        that writes a received tensor in place must `clone()` it first. Pickles from `load_from_disk`
+        or in-band pickling own their buffers and are writable.
+        """
+        batch_state, non_tensor_batch, meta_info = data
+        batch = None
+        if batch_state is not None:
+            batch_size, tensors = batch_state
+            batch = TensorDict(
+                {key: _buffer_to_tensor(*tensor) for key, tensor in tensors.items()}, batch_size=batch_size
+            )
 
-    def __setstate__(self, data: Tuple[bytes, Dict[str, NDArray], Dict[str, Any]]) -> None:
-        batch_deserialized_bytes, non_tensor_batch, meta_info = data
-        batch_deserialized = io.BytesIO(batch_deserialized_bytes)
-        batch = torch.load(batch_deserialized, weights_only=False, map_location="cpu")
         self.batch = batch
         self.non_tensor_batch = non_tensor_batch
         self.meta_info = meta_info
@@ -533,7 +675,7 @@ class DataProto:
         Returns:
             DataProto: concatenated DataProto
         """
-        batch_lst = [batch.batch for batch in data]
+        batch_lst = [batch.batch.materialize() if isinstance(batch.batch, LazyBatch) else batch.batch for batch in data]
         if batch_lst[0] is not None:
             new_batch = torch.cat(batch_lst, dim=0)
         else:
@@ -550,7 +692,7 @@ class DataProto:
         Note that this operation is in-place
         """
         indices_np = indices.detach().numpy()
-        self.batch = self.batch[indices]
+        self.batch = LazyBatch.from_index(self.batch, indices) if self.batch is not None else None
         self.non_tensor_batch = {key: value[indices_np] for key, value in self.non_tensor_batch.items()}
 
     def repeat(self, repeat_times: int = 2, interleave: bool = True) -> "DataProto":
@@ -648,6 +790,129 @@ class DataProtoFuture:
         return outputs
 
 
+@dataclass
+class DataProtoRef:
+    """
+    Rows [start, end) of a DataProto whose columns were put into the Ray object store by a
+    `ColumnStore`. Workers resolve it with `get`, which maps the columns from the object store
+    (zero-copy on the same node) and slices them without copying. The source of a lazy column
+    comes with the row indices of this chunk, which the worker gathers.
+    """
+
+    columns: Dict[str, Tuple[torch.dtype, Tuple[int, ...], ray.ObjectRef, Optional[torch.Tensor]]]
+    non_tensor_columns: Dict[str, ray.ObjectRef]
+    meta_info: Dict[str, Any]
+    start: int
+    end: int
+
+    def get(self) -> DataProto:
+        tensor_keys, non_tensor_keys = list(self.columns.keys()), list(self.non_tensor_columns.keys())
+        refs = [self.columns[key][2] for key in tensor_keys] + [self.non_tensor_columns[key] for key in non_tensor_keys]
+        values = dict(zip(tensor_keys + non_tensor_keys, ray.get(refs)))
+        batch = None
+        if len(tensor_keys) > 0:
+            tensors = {}
+            for key in tensor_keys:
+                dtype, shape, _, index = self.columns[key]
+                column = _buffer_to_tensor(dtype, shape, values[key])
+                tensors[key] = column[index] if index is not None else column[self.start : self.end]
+
+            batch = TensorDict(tensors, batch_size=(self.end - self.start,))
+
+        non_tensor_batch = {}
+        for key in non_tensor_keys:
+            value = values[key]
+            if isinstance(value, bytes):  # object arrays are put pickled
+                value = pickle.loads(value)
+
+            non_tensor_batch[key] = value[self.start : self.end]
+
+        return DataProto(batch=batch, non_tensor_batch=non_tensor_batch, meta_info=self.meta_info)
+
+
+class ColumnStore:
+    """
+    Driver-side cache of DataProto columns in the Ray object store. `share` puts every column of a
+    batch once and hands each worker a `DataProtoRef` to its rows, so the calls of one step
+    (generate, log probs, ref log probs, values, updates) only put the columns added since the
+    previous call. A column is reused while the driver holds the same array and it was not written
+    in place: tensors are compared by their version counter, numpy arrays, which have none, by a
+    digest of their content. The object is released when the array is freed.
+    """
+
+    def __init__(self):
+        self._objects: Dict[int, Tuple[Union[int, bytes], ray.ObjectRef, int]] = {}  # id(column) -> (version, ref, nbytes)
+        self._method = ""
+        self._metrics: Dict[str, float] = defaultdict(float)
+
+    def begin_call(self, method_name: str) -> None:
+        """Names the worker group call whose transfers are recorded next."""
+        self._method = method_name
+
+    def _put(self, column: Union[torch.Tensor, NDArray]) -> Tuple[ray.ObjectRef, int, bool]:
+        key = id(column)
+        if isinstance(column, torch.Tensor):
+            version, value = column._version, None
+        else:
+            value = pickle.dumps(column, protocol=pickle.HIGHEST_PROTOCOL) if column.dtype == object else column
+            version = hashlib.blake2b(value if isinstance(value, bytes) else np.ascontiguousarray(value)).digest()
+
+        cached = self._objects.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2], True
+
+        if isinstance(column, torch.Tensor):
+            value = _tensor_to_buffer(column)[2]
+
+        nbytes = len(value) if isinstance(value, bytes) else value.nbytes
+        if cached is None:
+            weakref.finalize(column, self._objects.pop, key, None)
+
+        ref = ray.put(value)
+        self._objects[key] = (version, ref, nbytes)
+        return ref, nbytes, False
+
+    def share(self, data: DataProto, chunks: int) -> List[DataProtoRef]:
+        """Same split as `data.chunk(chunks)`, as references to the shared columns."""
+        assert len(data) % chunks == 0, f"only support equal chunk. Got size of DataProto {len(data)} and chunk {chunks}."
+        put_bytes, reused_bytes = 0, 0
+        columns, lazy_indices, non_tensor_columns = {}, {}, {}
+        tensors, lazy = (data.batch._tensors, data.batch._lazy) if isinstance(data.batch, LazyBatch) else (data.batch, {})
+        columns_to_put = [(key, tensor, None) for key, tensor in (tensors.items() if tensors is not None else ())]
+        columns_to_put += [(key, source, index) for key, (source, index) in lazy.items()]
+        for key, tensor, index in columns_to_put:
+            ref, nbytes, reused = self._put(tensor)
+            columns[key] = (tensor.dtype, tuple(tensor.shape), ref)
+            if index is not None:
+                lazy_indices[key] = index
+
+            put_bytes, reused_bytes = put_bytes + (0 if reused else nbytes), reused_bytes + (nbytes if reused else 0)
+
+        for key, value in data.non_tensor_batch.items():
+            ref, nbytes, reused = self._put(value)
+            non_tensor_columns[key] = ref
+            put_bytes, reused_bytes = put_bytes + (0 if reused else nbytes), reused_bytes + (nbytes if reused else 0)
+
+        self._metrics[f"transfer/{self._method}_put_mb"] += put_bytes / 1024**2
+        self._metrics[f"transfer/{self._method}_reused_mb"] += reused_bytes / 1024**2
+        chunk_size = len(data) // chunks
+        refs = []
+        for i in range(chunks):
+            start, end = i * chunk_size, (i + 1) * chunk_size
+            chunk_columns = {
+                key: (*column, lazy_indices[key][start:end].clone() if key in lazy_indices else None)
+                for key, column in columns.items()
+            }
+            refs.append(DataProtoRef(chunk_columns, non_tensor_columns, data.meta_info, start=start, end=end))
+
+        return refs
+
+    def pop_metrics(self) -> Dict[str, float]:
+        """Megabytes put into and reused from the object store per worker group method since the last call."""
+        metrics, self._metrics = dict(self._metrics), defaultdict(float)
+        return metrics
+
+
 def allgather_dict_tensors(
     tensors: Union[Dict[str, torch.Tensor], TensorDict], size: int, group: ProcessGroup, dim: int = 0
 ) -> Union[Dict[str, torch.Tensor], TensorDict]:
@@ -15,11 +15,11 @@
 from enum import Enum, auto
 from functools import wraps
 from types import FunctionType
-from typing import TYPE_CHECKING, Dict, List, Literal, Union
+from typing import TYPE_CHECKING, Dict, List, Literal, Optional, Union
 
 import ray
 
-from ...protocol import DataProto, DataProtoFuture
+from ...protocol import ColumnStore, DataProto, DataProtoFuture, DataProtoRef
 
 
 if TYPE_CHECKING:
@@ -45,16 +45,22 @@ class Execute(Enum):
     RANK_ZERO = 1
 
 
-def _split_args_kwargs_data_proto(chunks: int, *args, **kwargs):
+def _split_data_proto(data: Union[DataProto, DataProtoFuture], chunks: int, column_store: Optional[ColumnStore]):
+    assert isinstance(data, (DataProto, DataProtoFuture))
+    if column_store is not None and isinstance(data, DataProto):
+        return column_store.share(data, chunks=chunks)
+
+    return data.chunk(chunks=chunks)
+
+
+def _split_args_kwargs_data_proto(chunks: int, *args, column_store: Optional[ColumnStore] = None, **kwargs):
     splitted_args = []
     for arg in args:
-        assert isinstance(arg, (DataProto, DataProtoFuture))
-        splitted_args.append(arg.chunk(chunks=chunks))
+        splitted_args.append(_split_data_proto(arg, chunks, column_store))
 
     splitted_kwargs = {}
     for key, value in kwargs.items():
-        assert isinstance(value, (DataProto, DataProtoFuture))
-        splitted_kwargs[key] = value.chunk(chunks=chunks)
+        splitted_kwargs[key] = _split_data_proto(value, chunks, column_store)
 
     return splitted_args, splitted_kwargs
 
@@ -104,13 +110,18 @@ def collect_dp_compute(worker_group: "WorkerGroup", outputs: List[DataProto]) ->
 
 
 def dispatch_dp_compute_data_proto(worker_group: "WorkerGroup", *args, **kwargs):
-    splitted_args, splitted_kwargs = _split_args_kwargs_data_proto(worker_group.world_size, *args, **kwargs)
+    # with a column store, workers receive references to the shared columns and their row range
+    splitted_args, splitted_kwargs = _split_args_kwargs_data_proto(
+        worker_group.world_size, *args, column_store=worker_group.column_store, **kwargs
+    )
     return splitted_args, splitted_kwargs
 
 
 def dispatch_dp_compute_data_proto_with_func(worker_group: "WorkerGroup", *args, **kwargs):
     assert type(args[0]) is FunctionType  # NOTE: The first one args is a function!
-    splitted_args, splitted_kwargs = _split_args_kwargs_data_proto(worker_group.world_size, *args[1:], **kwargs)
+    splitted_args, splitted_kwargs = _split_args_kwargs_data_proto(
+        worker_group.world_size, *args[1:], column_store=worker_group.column_store, **kwargs
+    )
     splitted_args_with_func = [[args[0]] * worker_group.world_size] + splitted_args
     return splitted_args_with_func, splitted_kwargs
 
@@ -182,13 +193,13 @@ def _check_execute_mode(execute_mode: Execute):
 def _materialize_futures(*args, **kwargs):
     new_args = []
     for arg in args:
-        if isinstance(arg, DataProtoFuture):
+        if isinstance(arg, (DataProtoFuture, DataProtoRef)):
             arg = arg.get()
         # add more type to materialize
         new_args.append(arg)
 
     for key, value in kwargs.items():
-        if isinstance(value, DataProtoFuture):
+        if isinstance(value, (DataProtoFuture, DataProtoRef)):
             kwargs[key] = value.get()
 
     new_args = tuple(new_args)
@@ -106,6 +106,8 @@ class WorkerGroup:
         self._master_port = None
 
         self._checker_thread: threading.Thread = None
+        # set to share the dispatched DataProtos through the Ray object store, see `ColumnStore`
+        self.column_store = None
 
     def _is_worker_alive(self, worker):
         raise NotImplementedError("WorkerGroup._is_worker_alive called, should be implemented in derived class.")
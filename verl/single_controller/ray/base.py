@@ -41,6 +41,9 @@ def get_random_string(length: int) -> str:
 
 def func_generator(self, method_name, dispatch_fn, collect_fn, execute_fn, blocking):
     def func(*args, **kwargs):
+        if self.column_store is not None:
+            self.column_store.begin_call(method_name)
+
         args, kwargs = dispatch_fn(self, *args, **kwargs)
         output = execute_fn(method_name, *args, **kwargs)
         if blocking:
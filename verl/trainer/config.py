@@ -82,6 +82,8 @@ class TrainerConfig:
     nnodes: int = 1
     n_gpus_per_node: int = 8
     critic_warmup: int = 0
+    one_step_off_policy: bool = False
+    object_store_dispatch: bool = False
     val_freq: int = -1
     val_before_train: bool = True
     val_only: bool = False
@@ -19,8 +19,7 @@ implement PPO
 """
 
 from abc import ABC, abstractmethod
-from collections import defaultdict
-from typing import TYPE_CHECKING, Tuple
+from typing import TYPE_CHECKING, List, Tuple, Union
 
 import numpy as np
 import torch
@@ -133,10 +132,56 @@ def compute_gae_advantage_return(
     return advantages, returns
 
 
+def group_rows(index: Union[np.ndarray, torch.Tensor]) -> List[torch.Tensor]:
+    """
+    Groups samples by their `index` (uid strings or integer group ids). Returns one
+    (num_groups, group_size) matrix of sample positions per distinct group size, with the
+    samples of a group in batch order, so reducing a row matches reducing the group's list.
+    """
+    if isinstance(index, torch.Tensor):
+        _, group_ids = torch.unique(index.cpu(), return_inverse=True)
+    else:
+        _, group_ids = np.unique(np.asarray(index), return_inverse=True)
+        group_ids = torch.from_numpy(group_ids.reshape(-1))
+
+    counts = torch.bincount(group_ids)
+    order = torch.argsort(group_ids, stable=True)
+    starts = torch.cumsum(counts, dim=0) - counts
+    rows = []
+    for size in torch.unique(counts).tolist():
+        groups = torch.nonzero(counts == size).squeeze(-1)
+        rows.append(order[starts[groups].unsqueeze(-1) + torch.arange(size)])
+
+    return rows
+
+
+def _group_std(group_scores: torch.Tensor, mean: torch.Tensor) -> torch.Tensor:
+    """
+    Unbiased std of every row. For float32 and float64 CPU scores it is computed like `torch.std`
+    of a 1-D tensor, squared deviations from the mean accumulated in float64 one element after
+    the other and a correctly rounded square root (`np.sqrt`, `torch.sqrt` may be off by one ulp),
+    so it matches the per-group std bit for bit; `torch.std(dim=-1)` uses a different kernel for
+    many short rows.
+    """
+    if group_scores.dtype not in (torch.float32, torch.float64) or group_scores.is_cuda:
+        return torch.std(group_scores, dim=-1, keepdim=True)
+
+    deviations = group_scores.double() - mean.double()
+    sum_dx2 = torch.zeros(deviations.size(0), dtype=torch.float64)
+    for column in deviations.unbind(dim=-1):
+        sum_dx2 += column * column
+
+    std = torch.from_numpy(np.sqrt((sum_dx2 / (deviations.size(-1) - 1)).numpy()))
+    return std.to(group_scores.dtype).unsqueeze(-1)
+
+
 # NOTE(sgm): this implementation only consider outcome supervision, where the reward is a scalar.
 @torch.no_grad()
 def compute_grpo_outcome_advantage(
-    token_level_rewards: torch.Tensor, response_mask: torch.Tensor, index: torch.Tensor, eps: float = 1e-6
+    token_level_rewards: torch.Tensor,
+    response_mask: torch.Tensor,
+    index: Union[np.ndarray, torch.Tensor],
+    eps: float = 1e-6,
 ) -> Tuple[torch.Tensor, torch.Tensor]:
     """
     Compute advantage for GRPO, operating only on Outcome reward
@@ -147,6 +192,8 @@ def compute_grpo_outcome_advantage(
             shape: (bs, response_length)
         response_mask: `(torch.Tensor)`
             shape: (bs, response_length)
+        index: `(np.ndarray or torch.Tensor)`
+            shape: (bs,), the group (prompt uid or integer id) of every response
 
     Returns:
         advantages: `(torch.Tensor)`
@@ -156,20 +203,11 @@ def compute_grpo_outcome_advantage(
 
     """
     scores = token_level_rewards.sum(dim=-1)
-    id2score = defaultdict(list)
-    id2mean, id2std = {}, {}
-
-    bsz = scores.shape[0]
-    for i in range(bsz):
-        id2score[index[i]].append(scores[i])
-
-    for idx in id2score:
-        assert len(id2score[idx]) > 1, "GRPO needs rollout.n > 1."
-        id2mean[idx] = torch.mean(torch.tensor(id2score[idx]))
-        id2std[idx] = torch.std(torch.tensor(id2score[idx]))
-
-    for i in range(bsz):
-        scores[i] = (scores[i] - id2mean[index[i]]) / (id2std[index[i]] + eps)
+    for rows in group_rows(index):
+        assert rows.size(1) > 1, "GRPO needs rollout.n > 1."
+        group_scores = scores[rows]
+        mean = torch.mean(group_scores, dim=-1, keepdim=True)
+        scores[rows] = (group_scores - mean) / (_group_std(group_scores, mean) + eps)
 
     returns = scores.unsqueeze(-1) * response_mask
     return returns, returns
@@ -177,7 +215,7 @@ def compute_grpo_outcome_advantage(
 
 @torch.no_grad()
 def compute_rloo_outcome_advantage(
-    token_level_rewards: torch.Tensor, response_mask: torch.Tensor, index: torch.Tensor
+    token_level_rewards: torch.Tensor, response_mask: torch.Tensor, index: Union[np.ndarray, torch.Tensor]
 ) -> Tuple[torch.Tensor, torch.Tensor]:
     """
     Compute advantage for RLOO based on https://arxiv.org/abs/2402.14740
@@ -187,6 +225,8 @@ def compute_rloo_outcome_advantage(
             shape: (bs, response_length)
         response_mask: `(torch.Tensor)`
             shape: (bs, response_length)
+        index: `(np.ndarray or torch.Tensor)`
+            shape: (bs,), the group (prompt uid or integer id) of every response
 
     Returns:
         advantages: `(torch.Tensor)`
@@ -196,21 +236,12 @@ def compute_rloo_outcome_advantage(
 
     """
     scores = token_level_rewards.sum(dim=-1)
-
-    id2score = defaultdict(list)
-    id2sum = {}
-    bsz = scores.shape[0]
-    for i in range(bsz):
-        id2score[index[i]].append(scores[i])
-
-    for idx in id2score:
-        id2sum[idx] = torch.sum(torch.tensor(id2score[idx]))
-
-    for i in range(bsz):
-        sample_num = len(id2score[index[i]])
+    for rows in group_rows(index):
+        sample_num = rows.size(1)
         assert sample_num > 1, "RLOO needs rollout.n > 1."
-        baseline = (id2sum[index[i]] - scores[i]) / (sample_num - 1)
-        scores[i] = scores[i] - baseline
+        group_scores = scores[rows]
+        baseline = (torch.sum(group_scores, dim=-1, keepdim=True) - group_scores) / (sample_num - 1)
+        scores[rows] = group_scores - baseline
 
     returns = scores.unsqueeze(-1) * response_mask
     return returns, returns
@@ -101,13 +101,20 @@ def compute_timing_metrics(batch: DataProto, timing_raw: Dict[str, float]) -> Di
         **dict.fromkeys(["gen", "reward"], num_response_tokens),
         **dict.fromkeys(["ref", "old", "values", "adv", "update_critic", "update_actor"], num_overall_tokens),
     }
-    return {
+    metrics = {
         **{f"timing_s/{name}": value for name, value in timing_raw.items()},
         **{
             f"timing_per_token_ms/{name}": timing_raw[name] * 1000 / num_tokens_of_section[name]
             for name in set(num_tokens_of_section.keys()) & set(timing_raw.keys())
         },
     }
+    if "reward" in timing_raw and "reward_wait" in timing_raw:
+        # the reward runs in the background, only `reward_wait` of it is on the critical path
+        reward_hidden = max(timing_raw["reward"] - timing_raw["reward_wait"], 0.0)
+        metrics["timing_s/reward_hidden"] = reward_hidden
+        metrics["timing_ratio/reward_hidden"] = reward_hidden / timing_raw["reward"] if timing_raw["reward"] > 0 else 1.0
+
+    return metrics
 
 
 def compute_throughout_metrics(batch: DataProto, timing_raw: Dict[str, float], num_gpus: int) -> Dict[str, Any]:
@@ -17,12 +17,11 @@ This trainer supports model-agonistic model initialization with huggingface
 """
 
 import os
-import uuid
 from collections import defaultdict
 from copy import deepcopy
 from dataclasses import dataclass, field
 from enum import Enum, IntEnum, auto
-from typing import Any, Dict, List, Optional, Type
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
 
 import numpy as np
 import ray
@@ -31,14 +30,14 @@ from ray.experimental.tqdm_ray import tqdm
 from torchdata.stateful_dataloader import StatefulDataLoader
 from transformers import PreTrainedTokenizer, ProcessorMixin
 
-from ..protocol import DataProto, pad_dataproto_to_divisor, unpad_dataproto
+from ..protocol import ColumnStore, DataProto, pad_dataproto_to_divisor, unpad_dataproto
 from ..single_controller.base import Worker
 from ..single_controller.ray import RayClassWithInitArgs, RayResourcePool, RayWorkerGroup
 from ..single_controller.ray.base import create_colocated_worker_cls
 from ..utils import torch_functional as VF
 from ..utils.checkpoint import CHECKPOINT_TRACKER, remove_obsolete_ckpt
 from ..utils.logger import Tracker
-from ..utils.py_functional import convert_dict_to_str, timer
+from ..utils.py_functional import convert_dict_to_str, peak_memory_gb, timer
 from ..utils.seqlen_balancing import get_seqlen_balanced_partitions, log_seqlen_unbalance
 from ..workers.fsdp_workers import FSDPWorker
 from ..workers.reward import FunctionRewardManager
@@ -134,7 +133,7 @@ def apply_kl_penalty(data: DataProto, kl_ctrl: core_algos.KLController, kl_penal
 def compute_advantage(data: DataProto, adv_estimator: AdvantageEstimator, gamma: float = 1.0, lam: float = 1.0):
     token_level_rewards = data.batch["token_level_rewards"]
     response_mask = data.batch["response_mask"]
-    index = data.non_tensor_batch["uid"]
+    index = data.batch["uid"]
     if adv_estimator == AdvantageEstimator.GAE:
         values = data.batch["values"]
         advantages, returns = core_algos.compute_gae_advantage_return(
@@ -256,6 +255,9 @@ class RayPPOTrainer:
         # Initialize entropy history tracking
         self.entropy_history = []
 
+        # group id of the next prompt, see `_rollout`
+        self.next_group_id = 0
+
     def _maybe_log_val_generations(
         self, inputs: List[str], outputs: List[str], labels: List[str], scores: List[float]
     ) -> None:
@@ -279,6 +281,7 @@ class RayPPOTrainer:
         # Lists to collect samples for the table
         sample_inputs, sample_outputs, sample_labels, sample_scores = [], [], [], []
         reward_metrics_lst = defaultdict(list)
+        val_weight_sync_s, val_weight_sync_skipped = 0.0, []
         for batch_dict in self.val_dataloader:
             test_batch = DataProto.from_single_dict(batch_dict)
             # Store original inputs
@@ -304,6 +307,9 @@ class RayPPOTrainer:
             })
             test_gen_batch, pad_size = pad_dataproto_to_divisor(test_gen_batch, self.actor_rollout_wg.world_size)
             test_output_gen_batch = self.actor_rollout_wg.generate_sequences(test_gen_batch)
+            sync_s, _, sync_skipped = self._pop_weight_sync_metrics(test_output_gen_batch)
+            val_weight_sync_s += sync_s
+            val_weight_sync_skipped.append(sync_skipped)
             test_output_gen_batch = unpad_dataproto(test_output_gen_batch, pad_size=pad_size)
 
             # Store generated outputs
@@ -327,7 +333,12 @@ class RayPPOTrainer:
         self._maybe_log_val_generations(sample_inputs, sample_outputs, sample_labels, sample_scores)
         reward_score = torch.cat(reward_tensor_lst, dim=0).sum(-1).mean().item()
         val_reward_metrics = {f"val/{key}_reward": value for key, value in reduce_metrics(reward_metrics_lst).items()}
-        return {"val/reward_score": reward_score, **val_reward_metrics}
+        return {
+            "val/reward_score": reward_score,
+            **val_reward_metrics,
+            "timing_s/val_weight_sync": val_weight_sync_s,
+            "timing_ratio/val_weight_sync_skipped": np.mean(val_weight_sync_skipped),
+        }
 
     def init_workers(self) -> None:
         """Init resource pool and worker group"""
@@ -399,6 +410,11 @@ class RayPPOTrainer:
         self.actor_rollout_wg = all_wg["actor_rollout"]
         self.actor_rollout_wg.init_model()
 
+        # share the batch of a step through the object store instead of chunking it for every call
+        self.column_store = ColumnStore() if self.config.trainer.object_store_dispatch else None
+        for wg in all_wg.values():
+            wg.column_store = self.column_store
+
     def _save_checkpoint(self) -> None:
         # path: {save_checkpoint_path}/global_step_{global_step}/{actor,critic}
         remove_obsolete_ckpt(
@@ -472,6 +488,96 @@ class RayPPOTrainer:
         )
         metrics.update(global_balance_stats)
 
+    def _iter_train_batches(self) -> Iterator[Dict[str, Any]]:
+        """Yields the training batches of all epochs in order."""
+        for _ in tqdm(range(self.config.trainer.total_epochs), desc="Epoch", position=0):
+            for batch_dict in tqdm(self.train_dataloader, desc="Running step", position=1):
+                yield batch_dict
+
+    @staticmethod
+    def _pop_weight_sync_metrics(output: DataProto) -> Tuple[float, float, float]:
+        """
+        Time, peak memory and skip flag of the weight sync from the actor to vllm at the start of a
+        generation, measured on rank 0. The sync is skipped if vllm already holds the current weights.
+        """
+        return tuple(
+            output.meta_info.pop(key) for key in ("weight_sync_s", "weight_sync_peak_memory_gb", "weight_sync_skipped")
+        )
+
+    def _rollout(
+        self, batch_dict: Dict[str, Any], metrics: Dict[str, Any], timing_raw: Dict[str, float]
+    ) -> Tuple[DataProto, ray.ObjectRef]:
+        """Generates the responses of a batch and launches its reward computation without waiting for it."""
+        batch: DataProto = DataProto.from_single_dict(batch_dict)
+
+        # pop those keys for generation
+        if "multi_modal_data" in batch.non_tensor_batch.keys():
+            gen_batch = batch.pop(
+                batch_keys=["input_ids", "attention_mask", "position_ids"],
+                non_tensor_batch_keys=["raw_prompt_ids", "multi_modal_data"],
+            )
+            gen_batch.meta_info.update({
+                "min_pixels": self.config.data.min_pixels,
+                "max_pixels": self.config.data.max_pixels,
+            })
+        else:
+            gen_batch = batch.pop(
+                batch_keys=["input_ids", "attention_mask", "position_ids"],
+                non_tensor_batch_keys=["raw_prompt_ids"],
+            )
+
+        # generate a batch
+        with timer("gen", timing_raw):  # wg: worker group
+            gen_batch_output = self.actor_rollout_wg.generate_sequences(gen_batch)
+
+        timing_raw["weight_sync"], sync_peak_memory_gb, sync_skipped = self._pop_weight_sync_metrics(gen_batch_output)
+        metrics["perf/weight_sync_peak_memory_gb"] = sync_peak_memory_gb
+        metrics["timing_ratio/weight_sync_skipped"] = sync_skipped
+
+        if self.config.algorithm.adv_estimator == "remax":
+            with timer("gen_max", timing_raw):
+                gen_baseline_batch = deepcopy(gen_batch)
+                gen_baseline_batch.meta_info["temperature"] = 0
+                gen_baseline_batch.meta_info["n"] = 1
+                gen_baseline_output = self.actor_rollout_wg.generate_sequences(gen_baseline_batch)
+                sync_s, sync_peak_memory_gb, sync_skipped = self._pop_weight_sync_metrics(gen_baseline_output)
+                timing_raw["weight_sync"] += sync_s
+                metrics["perf/weight_sync_peak_memory_gb"] = max(
+                    metrics["perf/weight_sync_peak_memory_gb"], sync_peak_memory_gb
+                )
+                metrics["timing_ratio/weight_sync_skipped"] = (
+                    metrics["timing_ratio/weight_sync_skipped"] + sync_skipped
+                ) / 2
+
+                batch = batch.union(gen_baseline_output)
+                reward_baseline_tensor, _ = ray.get(self.reward_fn.compute_reward.remote(batch))
+                reward_baseline_tensor = reward_baseline_tensor.sum(dim=-1)
+
+                batch.pop(batch_keys=list(gen_baseline_output.batch.keys()))
+                batch.batch["reward_baselines"] = reward_baseline_tensor
+                del gen_baseline_batch, gen_baseline_output
+
+        # int64 group ids travel in `batch.batch` instead of an object array of uuid strings,
+        # they stay unique across steps so prefetched batches never share a group
+        batch_size = len(batch.batch)
+        batch.batch["uid"] = torch.arange(self.next_group_id, self.next_group_id + batch_size, dtype=torch.int64)
+        self.next_group_id += batch_size
+        # repeat to align with repeated responses in rollout
+        batch = batch.repeat(repeat_times=self.config.worker.rollout.n, interleave=True)
+        batch = batch.union(gen_batch_output)
+
+        # balance the number of valid tokens on each dp rank.
+        # Note that this breaks the order of data inside the batch.
+        # Please take care when you implement group based adv computation such as GRPO and rloo
+        self._balance_batch(batch, metrics=metrics)
+
+        # compute global_valid tokens
+        batch.meta_info["global_token_num"] = torch.sum(batch.batch["attention_mask"], dim=-1).tolist()
+
+        # compute reward in the background
+        reward_ref = self.reward_fn.compute_reward_with_timing.remote(batch)
+        return batch, reward_ref
+
     def fit(self):
         """
         The training loop of PPO.
@@ -493,160 +599,135 @@ class RayPPOTrainer:
             if self.config.trainer.val_only:
                 return
 
-        for _ in tqdm(range(self.config.trainer.total_epochs), desc="Epoch", position=0):
-            for batch_dict in tqdm(self.train_dataloader, desc="Running step", position=1):
-                self.global_step += 1
-                if self.global_step > self.training_steps:
+        batches = self._iter_train_batches()
+        prefetched = None  # one-step-off-policy: (batch, reward_ref, metrics, timing_raw) of the next step
+        while self.global_step < self.training_steps:
+            if prefetched is not None:
+                batch, reward_ref, metrics, timing_raw = prefetched
+                prefetched = None
+            else:
+                batch_dict = next(batches, None)
+                if batch_dict is None:
                     break
 
+                batch, reward_ref = None, None
                 metrics, timing_raw = {}, {}
-                batch: DataProto = DataProto.from_single_dict(batch_dict)
 
-                # pop those keys for generation
-                if "multi_modal_data" in batch.non_tensor_batch.keys():
-                    gen_batch = batch.pop(
-                        batch_keys=["input_ids", "attention_mask", "position_ids"],
-                        non_tensor_batch_keys=["raw_prompt_ids", "multi_modal_data"],
+            self.global_step += 1
+            peak_memory_gb(reset=True)
+            with timer("step", timing_raw):
+                if batch is None:
+                    # generate a batch and launch its reward, which is joined in the `adv` phase
+                    batch, reward_ref = self._rollout(batch_dict, metrics, timing_raw)
+
+                # recompute old_log_probs and compute entropy
+                with timer("old", timing_raw):
+                    old_log_probs = self.actor_rollout_wg.compute_log_probs(batch)
+                    batch = batch.union(old_log_probs)
+                    
+                    # compute and log entropy metrics
+                    if "entropy" in old_log_probs.batch:
+                        entropy_tensor = old_log_probs.batch["entropy"]
+                        response_mask = batch.batch["response_mask"]
+                        entropy_mean = VF.masked_mean(entropy_tensor, response_mask).item()
+                        metrics[f"policy/entropy"] = entropy_mean
+                        # Store entropy history for visualization
+                        self.entropy_history.append({
+                            "step": self.global_step,
+                            "entropy": entropy_mean
+                        })
+
+                # compute ref_log_probs
+                if self.use_reference_policy:
+                    with timer("ref", timing_raw):
+                        ref_log_probs = self.ref_policy_wg.compute_ref_log_probs(batch)
+                        batch = batch.union(ref_log_probs)
+
+                # compute values
+                if self.use_critic:
+                    with timer("values", timing_raw):
+                        values = self.critic_wg.compute_values(batch)
+                        batch = batch.union(values)
+
+                with timer("adv", timing_raw):
+                    # get token level scores, `reward` is the time spent in the reward function and
+                    # `reward_wait` the part of it that was not hidden behind the other phases
+                    with timer("reward_wait", timing_raw):
+                        reward_tensor, reward_metrics, timing_raw["reward"] = ray.get(reward_ref)
+
+                    batch.batch["token_level_scores"] = reward_tensor
+                    reward_metrics = {f"reward/{k}": v for k, v in reduce_metrics(reward_metrics).items()}
+                    metrics.update(reward_metrics)
+
+                    # apply kl penalty if available
+                    if not self.config.algorithm.use_kl_loss and self.use_reference_policy:
+                        # apply kl penalty to reward
+                        batch, kl_metrics = apply_kl_penalty(batch, self.kl_ctrl, self.config.algorithm.kl_penalty)
+                        metrics.update(kl_metrics)
+                    else:
+                        batch.batch["token_level_rewards"] = batch.batch["token_level_scores"]
+
+                    # compute advantages, executed on the driver process
+                    batch = compute_advantage(
+                        batch,
+                        adv_estimator=self.config.algorithm.adv_estimator,
+                        gamma=self.config.algorithm.gamma,
+                        lam=self.config.algorithm.lam,
                     )
-                    gen_batch.meta_info.update({
-                        "min_pixels": self.config.data.min_pixels,
-                        "max_pixels": self.config.data.max_pixels,
-                    })
-                else:
-                    gen_batch = batch.pop(
-                        batch_keys=["input_ids", "attention_mask", "position_ids"],
-                        non_tensor_batch_keys=["raw_prompt_ids"],
-                    )
-
-                with timer("step", timing_raw):
-                    # generate a batch
-                    with timer("gen", timing_raw):  # wg: worker group
-                        gen_batch_output = self.actor_rollout_wg.generate_sequences(gen_batch)
-
-                    if self.config.algorithm.adv_estimator == "remax":
-                        with timer("gen_max", timing_raw):
-                            gen_baseline_batch = deepcopy(gen_batch)
-                            gen_baseline_batch.meta_info["temperature"] = 0
-                            gen_baseline_batch.meta_info["n"] = 1
-                            gen_baseline_output = self.actor_rollout_wg.generate_sequences(gen_baseline_batch)
 
-                            batch = batch.union(gen_baseline_output)
-                            reward_baseline_tensor, _ = ray.get(self.reward_fn.compute_reward.remote(batch))
-                            reward_baseline_tensor = reward_baseline_tensor.sum(dim=-1)
-
-                            batch.pop(batch_keys=list(gen_baseline_output.batch.keys()))
-                            batch.batch["reward_baselines"] = reward_baseline_tensor
-                            del gen_baseline_batch, gen_baseline_output
-
-                    batch.non_tensor_batch["uid"] = np.array(
-                        [str(uuid.uuid4()) for _ in range(len(batch.batch))], dtype=object
-                    )
-                    # repeat to align with repeated responses in rollout
-                    batch = batch.repeat(repeat_times=self.config.worker.rollout.n, interleave=True)
-                    batch = batch.union(gen_batch_output)
-
-                    # balance the number of valid tokens on each dp rank.
-                    # Note that this breaks the order of data inside the batch.
-                    # Please take care when you implement group based adv computation such as GRPO and rloo
-                    self._balance_batch(batch, metrics=metrics)
-
-                    # compute global_valid tokens
-                    batch.meta_info["global_token_num"] = torch.sum(batch.batch["attention_mask"], dim=-1).tolist()
-
-                    # compute reward
-                    with timer("reward", timing_raw):
-                        reward_ref = self.reward_fn.compute_reward.remote(batch)
-
-                    # recompute old_log_probs and compute entropy
-                    with timer("old", timing_raw):
-                        old_log_probs = self.actor_rollout_wg.compute_log_probs(batch)
-                        batch = batch.union(old_log_probs)
-                        
-                        # compute and log entropy metrics
-                        if "entropy" in old_log_probs.batch:
-                            entropy_tensor = old_log_probs.batch["entropy"]
-                            response_mask = batch.batch["response_mask"]
-                            entropy_mean = VF.masked_mean(entropy_tensor, response_mask).item()
-                            metrics[f"policy/entropy"] = entropy_mean
-                            # Store entropy history for visualization
-                            self.entropy_history.append({
-                                "step": self.global_step,
-                                "entropy": entropy_mean
-                            })
-
-                    # compute ref_log_probs
-                    if self.use_reference_policy:
-                        with timer("ref", timing_raw):
-                            ref_log_probs = self.ref_policy_wg.compute_ref_log_probs(batch)
-                            batch = batch.union(ref_log_probs)
-
-                    # compute values
-                    if self.use_critic:
-                        with timer("values", timing_raw):
-                            values = self.critic_wg.compute_values(batch)
-                            batch = batch.union(values)
-
-                    with timer("adv", timing_raw):
-                        # get token level scores
-                        reward_tensor, reward_metrics = ray.get(reward_ref)
-                        batch.batch["token_level_scores"] = reward_tensor
-                        reward_metrics = {f"reward/{k}": v for k, v in reduce_metrics(reward_metrics).items()}
-                        metrics.update(reward_metrics)
-
-                        # apply kl penalty if available
-                        if not self.config.algorithm.use_kl_loss and self.use_reference_policy:
-                            # apply kl penalty to reward
-                            batch, kl_metrics = apply_kl_penalty(batch, self.kl_ctrl, self.config.algorithm.kl_penalty)
-                            metrics.update(kl_metrics)
-                        else:
-                            batch.batch["token_level_rewards"] = batch.batch["token_level_scores"]
-
-                        # compute advantages, executed on the driver process
-                        batch = compute_advantage(
-                            batch,
-                            adv_estimator=self.config.algorithm.adv_estimator,
-                            gamma=self.config.algorithm.gamma,
-                            lam=self.config.algorithm.lam,
-                        )
-
-                    # update critic
-                    if self.use_critic:
-                        with timer("update_critic", timing_raw):
-                            critic_output = self.critic_wg.update_critic(batch)
-
-                        critic_metrics = reduce_metrics(critic_output.non_tensor_batch)
-                        metrics.update(critic_metrics)
-
-                    # update actor
-                    if self.config.trainer.critic_warmup <= self.global_step:
-                        with timer("update_actor", timing_raw):
-                            actor_output = self.actor_rollout_wg.update_actor(batch)
-
-                        actor_metrics = reduce_metrics(actor_output.non_tensor_batch)
-                        metrics.update(actor_metrics)
-
-                    # validate
-                    if (
-                        self.val_reward_fn is not None
-                        and self.config.trainer.val_freq > 0
-                        and self.global_step % self.config.trainer.val_freq == 0
-                    ):
-                        with timer("validation", timing_raw):
-                            val_metrics = self._validate()
-
-                        metrics.update(val_metrics)
-
-                    if self.config.trainer.save_freq > 0 and self.global_step % self.config.trainer.save_freq == 0:
-                        with timer("save_checkpoint", timing_raw):
-                            self._save_checkpoint()
-
-                # collect metrics
-                num_gpus = self.resource_pool_manager.get_num_gpus()
-                metrics.update(compute_data_metrics(batch=batch, use_critic=self.use_critic))
-                metrics.update(compute_timing_metrics(batch=batch, timing_raw=timing_raw))
-                metrics.update(compute_throughout_metrics(batch=batch, timing_raw=timing_raw, num_gpus=num_gpus))
-
-                self.logger.log(data=metrics, step=self.global_step)
+                # update critic
+                if self.use_critic:
+                    with timer("update_critic", timing_raw):
+                        critic_output = self.critic_wg.update_critic(batch)
+
+                    critic_metrics = reduce_metrics(critic_output.non_tensor_batch)
+                    metrics.update(critic_metrics)
+
+                # one-step-off-policy: roll out the next batch with the current weights, so that its
+                # reward runs on the solver servers while this step updates the actor
+                if self.config.trainer.one_step_off_policy and self.global_step < self.training_steps:
+                    batch_dict = next(batches, None)
+                    if batch_dict is not None:
+                        next_metrics, next_timing_raw = {}, {}
+                        with timer("prefetch", timing_raw):
+                            next_batch, next_reward_ref = self._rollout(batch_dict, next_metrics, next_timing_raw)
+
+                        prefetched = (next_batch, next_reward_ref, next_metrics, next_timing_raw)
+
+                # update actor
+                if self.config.trainer.critic_warmup <= self.global_step:
+                    with timer("update_actor", timing_raw):
+                        actor_output = self.actor_rollout_wg.update_actor(batch)
+
+                    actor_metrics = reduce_metrics(actor_output.non_tensor_batch)
+                    metrics.update(actor_metrics)
+
+                # validate
+                if (
+                    self.val_reward_fn is not None
+                    and self.config.trainer.val_freq > 0
+                    and self.global_step % self.config.trainer.val_freq == 0
+                ):
+                    with timer("validation", timing_raw):
+                        val_metrics = self._validate()
+
+                    metrics.update(val_metrics)
+
+                if self.config.trainer.save_freq > 0 and self.global_step % self.config.trainer.save_freq == 0:
+                    with timer("save_checkpoint", timing_raw):
+                        self._save_checkpoint()
+
+            # collect metrics
+            num_gpus = self.resource_pool_manager.get_num_gpus()
+            metrics.update(compute_data_metrics(batch=batch, use_critic=self.use_critic))
+            metrics.update(compute_timing_metrics(batch=batch, timing_raw=timing_raw))
+            metrics.update(compute_throughout_metrics(batch=batch, timing_raw=timing_raw, num_gpus=num_gpus))
+            if self.column_store is not None:
+                metrics.update(self.column_store.pop_metrics())
+
+            metrics["perf/driver_peak_memory_gb"] = peak_memory_gb()
+
+            self.logger.log(data=metrics, step=self.global_step)
 
         # perform validation after training
         if self.val_reward_fn is not None:
@@ -20,7 +20,7 @@ from typing import Any, Dict, List, Optional, Union
 
 import numpy as np
 import torch
-from datasets import load_dataset
+from datasets import DatasetDict, load_dataset, load_from_disk
 from jinja2 import Template
 from PIL import Image
 from PIL.Image import Image as ImageObject
@@ -112,7 +112,12 @@ class RLHFDataset(Dataset):
         else:
             data_split = "train"
 
-        if os.path.isdir(data_path):
+        if os.path.isfile(os.path.join(data_path, "state.json")) or os.path.isfile(os.path.join(data_path, "dataset_dict.json")):
+            # saved by `save_to_disk` (e.g. question_evaluate/upload.py --output_format arrow), memory-mapped
+            self.dataset = load_from_disk(data_path)
+            if isinstance(self.dataset, DatasetDict):
+                self.dataset = self.dataset[data_split]
+        elif os.path.isdir(data_path):
             # when we use dataset builder, we should always refer to the train split
             self.dataset = load_dataset("parquet", data_dir=data_path, split="train")
         elif os.path.isfile(data_path):
@@ -111,3 +111,24 @@ def timer(name: str, timing_raw: Dict[str, float]):
         yield
 
     timing_raw[name] = timer.last
+
+
+def peak_memory_gb(reset: bool = False) -> float:
+    """
+    Peak resident memory of this process in GB. With `reset`, the peak restarts from the current
+    usage afterwards, so the next call returns the peak since this one (Linux only, elsewhere the
+    peak is the one since process start).
+    """
+    try:
+        with open("/proc/self/status") as f:
+            peak_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+
+        if reset:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+    except (OSError, StopIteration):
+        import resource
+
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak_kb / 1024**2
@@ -0,0 +1,38 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .adaptive_sampling import WaveSampler, band_probability, parse_waves
+from .dedup import QuestionDeduplicator, normalize_question
+from .grade_cache import GradeCache, cached_grade_answer, get_grade_cache, grade_answer_key, make_key
+from .grader_pool import GraderPool, get_grader_pool, grade_pairs
+from .voting import AnswerVoter, canonical_keys
+
+
+__all__ = [
+    "AnswerVoter",
+    "GradeCache",
+    "GraderPool",
+    "QuestionDeduplicator",
+    "WaveSampler",
+    "band_probability",
+    "cached_grade_answer",
+    "canonical_keys",
+    "get_grade_cache",
+    "get_grader_pool",
+    "grade_answer_key",
+    "grade_pairs",
+    "make_key",
+    "normalize_question",
+    "parse_waves",
+]
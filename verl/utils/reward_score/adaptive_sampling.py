@@ -0,0 +1,169 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Sequential (wave) sampling for self-consistency scores.
+
+Instead of drawing all n samples of a question at once, the samples are drawn in waves (e.g.
+4, 2, 2, 2). After every wave the majority share the question would end up with after all n
+samples is predicted from the answers seen so far, and the question stops early once that
+share is confidently outside the band of scores that is kept downstream (`upload.py` keeps
+[0.25, 0.75]). Questions that may still land inside the band always get their full n samples,
+so their scores are unchanged.
+
+The prediction is the posterior predictive of a Dirichlet process over answers: the remaining
+draws follow a Polya urn seeded with the observed answer clusters (plus the empty answers),
+where a new, unseen answer is drawn with weight `concentration`. The probability that the final
+share falls inside the band is estimated by simulating the urn.
+"""
+
+import threading
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+
+def parse_waves(waves: Union[str, Sequence[int]], num_samples: int) -> List[int]:
+    """Parses a wave schedule like "4,2,2,2", which must add up to `num_samples`."""
+    if isinstance(waves, str):
+        waves = [int(wave) for wave in waves.split(",") if wave.strip()]
+
+    waves = list(waves)
+    if not waves or any(wave <= 0 for wave in waves) or sum(waves) != num_samples:
+        raise ValueError(f"Waves {waves} must be positive and add up to the number of samples {num_samples}.")
+
+    return waves
+
+
+def band_probability(
+    answer_counts: Sequence[int],
+    num_empty: int,
+    remaining: int,
+    min_score: float,
+    max_score: float,
+    count_empty: bool = False,
+    concentration: float = 1.0,
+    num_simulations: int = 2048,
+    seed: int = 0,
+) -> float:
+    """
+    Probability that the final majority share falls in [min_score, max_score] after `remaining`
+    more samples, given the current cluster sizes `answer_counts` and `num_empty` samples without
+    an answer. The share is taken over all samples if `count_empty`, else over the non-empty ones
+    (a question without any answer gets no score and counts as outside the band).
+    """
+    counts = [count for count in answer_counts if count > 0]
+    num_answers = sum(counts)
+    if remaining <= 0:
+        denominator = num_answers + num_empty if count_empty else num_answers
+        if denominator == 0:
+            return 0.0
+
+        share = max(counts, default=0) / denominator
+        return float(min_score <= share <= max_score)
+
+    # urn columns: the observed clusters, the empty answers, and room for `remaining` new answers
+    num_clusters = len(counts)
+    empty_column = num_clusters
+    urn = np.zeros((num_simulations, num_clusters + 1 + remaining), dtype=np.float64)
+    urn[:, :num_clusters] = counts
+    urn[:, empty_column] = num_empty
+    num_new = np.zeros(num_simulations, dtype=np.int64)
+    rows = np.arange(num_simulations)
+    rng = np.random.default_rng(seed)
+    for _ in range(remaining):
+        weights = urn.copy()
+        weights[rows, empty_column + 1 + num_new] = concentration  # the next unseen answer
+        cumulative = np.cumsum(weights, axis=1)
+        draws = rng.random(num_simulations) * cumulative[:, -1]
+        picked = (cumulative <= draws[:, None]).sum(axis=1)
+        urn[rows, picked] += 1
+        num_new += picked == empty_column + 1 + num_new
+
+    answers = np.delete(urn, empty_column, axis=1)
+    denominator = urn.sum(axis=1) if count_empty else answers.sum(axis=1)
+    share = np.divide(answers.max(axis=1), denominator, out=np.zeros(num_simulations), where=denominator > 0)
+    in_band = (share >= min_score) & (share <= max_score) & (denominator > 0)
+    return float(in_band.mean())
+
+
+class WaveSampler:
+    """
+    Decides after every wave whether a question needs more samples, and keeps the counts of drawn
+    and skipped samples. Thread-safe, so one sampler can be shared by concurrent requests.
+    """
+
+    def __init__(
+        self,
+        waves: Union[str, Sequence[int]],
+        num_samples: int,
+        min_score: float = 0.25,
+        max_score: float = 0.75,
+        confidence: float = 0.95,
+        count_empty: bool = False,
+        concentration: float = 1.0,
+    ):
+        self.waves = parse_waves(waves, num_samples)
+        self.num_samples = num_samples
+        self.min_score = min_score
+        self.max_score = max_score
+        self.confidence = confidence
+        self.count_empty = count_empty
+        self.concentration = concentration
+        self.lock = threading.Lock()
+        self.questions = 0
+        self.stopped_early = 0
+        self.samples_drawn = 0
+
+    def should_stop(self, answer_counts: Dict[str, int], num_drawn: int) -> bool:
+        """Whether a question with `answer_counts` after `num_drawn` samples can skip its remaining waves."""
+        remaining = self.num_samples - num_drawn
+        if remaining <= 0:
+            return True
+
+        num_empty = num_drawn - sum(answer_counts.values())
+        probability = band_probability(
+            list(answer_counts.values()),
+            num_empty,
+            remaining,
+            self.min_score,
+            self.max_score,
+            count_empty=self.count_empty,
+            concentration=self.concentration,
+        )
+        return probability < 1.0 - self.confidence
+
+    def record(self, num_drawn: int) -> None:
+        """Records a finished question that drew `num_drawn` samples."""
+        with self.lock:
+            self.questions += 1
+            self.samples_drawn += num_drawn
+            self.stopped_early += num_drawn < self.num_samples
+
+    def metrics(self, seconds_per_sample: Optional[float] = None) -> Dict[str, float]:
+        """Sample counts, and the estimated GPU-seconds saved given the GPU-seconds spent per drawn sample."""
+        with self.lock:
+            samples_skipped = self.questions * self.num_samples - self.samples_drawn
+            metrics = {
+                "waves": ",".join(str(wave) for wave in self.waves),
+                "questions": self.questions,
+                "stopped_early": self.stopped_early,
+                "samples_drawn": self.samples_drawn,
+                "samples_skipped": samples_skipped,
+                "skipped_ratio": round(samples_skipped / (self.questions * self.num_samples), 4) if self.questions else 0.0,
+            }
+
+        if seconds_per_sample is not None:
+            metrics["gpu_seconds_saved"] = round(samples_skipped * seconds_per_sample, 2)
+
+        return metrics
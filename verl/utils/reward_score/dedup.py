@@ -0,0 +1,145 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Deduplication of generated questions before they are evaluated by the solver.
+
+A question is an exact duplicate if its normalized text (NFKC, lower case, no `$`, `\\left`,
+`\\right` or LaTeX spacing, collapsed whitespace) was seen before, and a near duplicate if its
+word-shingle similarity to a kept question is at least `threshold`:
+    minhash  estimated Jaccard similarity of the 3-word shingle sets, candidates from LSH bands
+    simhash  1 - hamming distance / 64 of the SimHash fingerprints, candidates from the
+             pigeonhole blocks of the fingerprint
+The first occurrence is kept. The index grows with every call, so one deduplicator can be fed
+a whole file or a stream of chunks.
+"""
+
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+from .similarity import minhash_signatures, simhash_fingerprints
+
+
+_LATEX_NOISE = re.compile(r"\$|\\left|\\right|\\[,;:! ]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Normal form of a question for exact-duplicate detection and shingling."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _LATEX_NOISE.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip().rstrip(".?")
+
+
+class QuestionDeduplicator:
+    """Keeps the first of every group of exact or near-duplicate questions. Thread-safe."""
+
+    def __init__(
+        self,
+        method: str = "minhash",
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        bands: int = 32,
+        ngram: int = 3,
+    ):
+        if method not in ("exact", "minhash", "simhash"):
+            raise ValueError(f"Unknown dedup method {method!r}.")
+
+        self.method = method
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.ngram = ngram
+        # simhash: two fingerprints within `max_distance` bits agree on at least one of
+        # `max_distance + 1` blocks
+        self.max_distance = int(np.floor((1.0 - threshold) * 64 + 1e-9))
+        self.lock = threading.Lock()
+        self.exact: Set[str] = set()
+        self.buckets: "defaultdict[tuple, List[int]]" = defaultdict(list)
+        self.keys: List[np.ndarray] = []  # minhash signature or simhash fingerprint of every kept question
+        self.seen = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def _bucket_keys(self, key) -> List[tuple]:
+        if self.method == "minhash":
+            rows = self.num_perm // self.bands
+            return [(band, key[band * rows : (band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+        blocks = self.max_distance + 1
+        bounds = np.linspace(0, 64, blocks + 1).astype(int)
+        return [(block, (int(key) >> int(bounds[block])) & ((1 << int(bounds[block + 1] - bounds[block])) - 1)) for block in range(blocks)]
+
+    def _similarity(self, key, other) -> float:
+        if self.method == "minhash":
+            return float((key == other).mean())
+
+        return 1.0 - bin(int(key) ^ int(other)).count("1") / 64
+
+    def _keys(self, normalized: Sequence[str]) -> Optional[np.ndarray]:
+        if self.method == "minhash":
+            return minhash_signatures(normalized, num_perm=self.num_perm, ngram=self.ngram)
+        if self.method == "simhash":
+            return simhash_fingerprints(normalized, ngram=self.ngram)
+        return None
+
+    def filter(self, questions: Sequence[str]) -> List[int]:
+        """Indices of `questions` that are not duplicates of each other or of earlier calls."""
+        normalized = [normalize_question(question) for question in questions]
+        keys = self._keys(normalized)
+        kept = []
+        with self.lock:
+            for i, text in enumerate(normalized):
+                self.seen += 1
+                if text in self.exact:
+                    self.exact_duplicates += 1
+                    continue
+
+                if keys is not None and text:
+                    bucket_keys = self._bucket_keys(keys[i])
+                    candidates = {j for bucket_key in bucket_keys for j in self.buckets.get(bucket_key, ())}
+                    if any(self._similarity(keys[i], self.keys[j]) >= self.threshold for j in candidates):
+                        self.near_duplicates += 1
+                        continue
+
+                    for bucket_key in bucket_keys:
+                        self.buckets[bucket_key].append(len(self.keys))
+                    self.keys.append(keys[i])
+
+                self.exact.add(text)
+                kept.append(i)
+
+        return kept
+
+    def metrics(self, seconds_per_question: Optional[float] = None) -> Dict[str, float]:
+        """Duplicate counts, and the GPU-hours saved given the evaluation GPU-seconds per question."""
+        with self.lock:
+            removed = self.exact_duplicates + self.near_duplicates
+            metrics = {
+                "method": self.method,
+                "threshold": self.threshold,
+                "questions": self.seen,
+                "exact_duplicates": self.exact_duplicates,
+                "near_duplicates": self.near_duplicates,
+                "removed_ratio": round(removed / self.seen, 4) if self.seen else 0.0,
+            }
+
+        if seconds_per_question is not None:
+            metrics["gpu_hours_saved"] = round(removed * seconds_per_question / 3600, 3)
+
+        return metrics
@@ -0,0 +1,225 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Cross-run cache of answer-equivalence verdicts.
+
+A bounded in-memory LRU sits in front of an optional SQLite file that is shared by every
+grader process (grading servers, question evaluation, reward workers, benchmark evaluation),
+so verdicts computed in one self-play iteration are reused by all later ones.
+
+Keys are hashes of normalized pairs. For `grade_answer` the normalization is exact: the verdict
+only depends on each side through its mathd normalization and its mathruler `_normalize` form,
+so pairs that agree on those four strings always get the same verdict.
+
+The SQLite path comes from `GRADE_CACHE_PATH`, else it is a node-local file in the temp dir
+(`$TMPDIR` or `/tmp`), shared by every process of the node; `GRADE_CACHE_PATH=none` keeps the
+cache in memory only. `STORAGE_PATH` is not used: it is a shared network filesystem (CephFS),
+where SQLite's WAL mode cannot work, since it relies on a memory-mapped `-shm` file. A file that
+is placed on a network filesystem anyway uses the rollback journal instead of WAL.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+from mathruler.grader import _normalize, grade_answer
+from mathruler.math_normalize import normalize_answer
+
+
+@lru_cache(maxsize=65536)
+def normal_forms(answer: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Returns the (mathd, mathruler) normalizations of an answer, the only inputs `grade_answer` uses."""
+    if answer is None:
+        return None, None
+
+    return normalize_answer(answer), _normalize(answer)
+
+
+def make_key(namespace: str, *parts) -> str:
+    return hashlib.sha1(json.dumps([namespace, *parts]).encode("utf-8")).hexdigest()
+
+
+def grade_answer_key(given: Optional[str], ground_truth: Optional[str]) -> str:
+    try:
+        return make_key("grade_answer", *normal_forms(given), *normal_forms(ground_truth))
+    except Exception:  # normalization itself failed, fall back to the raw strings
+        return make_key("grade_answer:raw", given, ground_truth)
+
+
+_NETWORK_FILESYSTEMS = ("nfs", "nfs4", "ceph", "cifs", "smb3", "smbfs", "lustre", "glusterfs", "gpfs", "beegfs")
+
+
+def on_network_filesystem(path: str) -> bool:
+    """Whether `path` lives on a network (or FUSE) filesystem, from the longest matching mount point."""
+    path = os.path.realpath(path)
+    mount_point, fs_type = "", ""
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+
+                point = fields[1].replace("\\040", " ")
+                if (path == point or path.startswith(point.rstrip("/") + "/")) and len(point) > len(mount_point):
+                    mount_point, fs_type = point, fields[2]
+    except OSError:
+        return False
+
+    return fs_type in _NETWORK_FILESYSTEMS or fs_type.startswith("fuse.")
+
+
+class GradeCache:
+    """
+    Thread-safe LRU cache of boolean verdicts with an optional SQLite backing store.
+
+    Writes are buffered and flushed in batches (and at exit) so that many processes can share
+    one database file without fighting over its write lock. The cache is best effort: database
+    errors are logged and the verdict is simply recomputed next time.
+    """
+
+    def __init__(self, path: Optional[str] = None, capacity: int = 100000, flush_every: int = 256):
+        self.path = path
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self._memory: "OrderedDict[str, bool]" = OrderedDict()
+        self._pending: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path is not None:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                journal_mode = "DELETE" if on_network_filesystem(os.path.dirname(os.path.abspath(path))) else "WAL"
+                self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+                self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+                self._conn.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, verdict INTEGER NOT NULL)")
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"[grade_cache] Cannot open {path} ({e}), using the in-memory cache only.")
+                self._conn = None
+
+            atexit.register(self.flush)
+
+    def _remember(self, key: str, verdict: bool) -> None:
+        self._memory[key] = verdict
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[bool]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute("SELECT verdict FROM verdicts WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error as e:
+                    print(f"[grade_cache] Lookup failed: {e}.")
+                    row = None
+
+                if row is not None:
+                    self.disk_hits += 1
+                    self._remember(key, bool(row[0]))
+                    return bool(row[0])
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, verdict: bool) -> None:
+        with self._lock:
+            self._remember(key, bool(verdict))
+            if self._conn is not None:
+                self._pending[key] = bool(verdict)
+                if len(self._pending) >= self.flush_every:
+                    self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if self._conn is None or not self._pending:
+            return
+
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO verdicts (key, verdict) VALUES (?, ?)",
+                    [(key, int(verdict)) for key, verdict in self._pending.items()],
+                )
+        except sqlite3.Error as e:
+            print(f"[grade_cache] Dropping {len(self._pending)} pending verdicts: {e}.")
+
+        self._pending.clear()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def cached_call(self, key: str, compute: Callable[[], bool]) -> bool:
+        verdict = self.get(key)
+        if verdict is None:
+            verdict = bool(compute())
+            self.put(key, verdict)
+
+        return verdict
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "size": len(self._memory),
+            }
+
+
+_default_cache: Optional[GradeCache] = None
+_default_cache_pid: Optional[int] = None
+
+
+def default_cache_path() -> Optional[str]:
+    path = os.getenv("GRADE_CACHE_PATH")
+    if path is not None:
+        return None if path.lower() in ("", "none") else path
+
+    return os.path.join(tempfile.gettempdir(), f"rzero_cache_{os.getuid()}", "grade_cache.sqlite")
+
+
+def get_grade_cache() -> GradeCache:
+    """Per-process default cache; re-created after a fork so SQLite connections are never shared."""
+    global _default_cache, _default_cache_pid
+    if _default_cache is None or _default_cache_pid != os.getpid():
+        _default_cache = GradeCache(default_cache_path())
+        _default_cache_pid = os.getpid()
+
+    return _default_cache
+
+
+def cached_grade_answer(given: Optional[str], ground_truth: Optional[str]) -> bool:
+    """`grade_answer` through the default cache."""
+    return get_grade_cache().cached_call(
+        grade_answer_key(given, ground_truth), lambda: grade_answer(given, ground_truth)
+    )
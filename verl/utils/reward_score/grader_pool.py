@@ -0,0 +1,294 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Pre-forked, process-isolated pool for answer grading with hard per-task timeouts.
+
+Thread-based timeouts (`stopit`) cannot interrupt sympy while it is stuck in C code, so one
+pathological answer could stall a whole reward batch. Here every slot of the pool is a small
+supervisor process that owns one grader process. The supervisor forwards a task, waits for it
+with a deadline, and on timeout SIGKILLs the grader and forks a fresh one from itself, so
+respawns never fork the parent process.
+
+The supervisors themselves are started with `start_method`. `fork` is only safe while the parent
+has no other threads and no CUDA context, i.e. for pools created at the top of a script (the
+vLLM servers, `question_evaluate`). `get_grader_pool`, which is called lazily inside Ray workers
+and other multi-threaded processes, uses `forkserver`: the supervisors are forked from a fresh
+single-threaded server process, which requires the `__main__` module to be import-safe.
+
+Tasks are plain `(fn, args)` pairs, `fn` must be picklable by reference (a module-level
+function). Callers submit whole batches with `run_batch`; batches from different threads share
+the slots.
+"""
+
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .grade_cache import GradeCache
+
+
+OK, ERROR, TIMEOUT, CRASHED = "ok", "error", "timeout", "crashed"
+
+
+def _grader_main(conn: Connection) -> None:
+    while True:
+        try:
+            fn, args = conn.recv()
+        except (EOFError, OSError):
+            return
+
+        try:
+            conn.send((OK, fn(*args)))
+        except Exception as e:
+            conn.send((ERROR, repr(e)))
+
+
+def _supervisor_main(conn: Connection) -> None:
+    ctx = multiprocessing.get_context("fork")
+
+    def spawn():
+        parent_end, child_end = ctx.Pipe()
+        process = ctx.Process(target=_grader_main, args=(child_end,), daemon=True)
+        process.start()
+        child_end.close()
+        return process, parent_end
+
+    grader, grader_conn = spawn()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        if message is None:
+            break
+
+        fn, args, timeout = message
+        reply: Tuple[str, Any]
+        try:
+            grader_conn.send((fn, args))
+            if grader_conn.poll(timeout):
+                reply = grader_conn.recv()
+            else:
+                reply = (TIMEOUT, None)
+        except (EOFError, OSError):
+            reply = (CRASHED, None)
+
+        if reply[0] in (TIMEOUT, CRASHED):
+            grader.kill()
+            grader.join()
+            grader_conn.close()
+            grader, grader_conn = spawn()
+
+        conn.send(reply)
+
+    grader.kill()
+    grader.join()
+
+
+class GraderPool:
+    """
+    Args:
+        num_workers: number of grader slots, defaults to min(8, cpu count).
+        timeout: default per-task timeout in seconds.
+        start_method: multiprocessing start method of the supervisors, `fork` only before any
+            thread or CUDA context exists in the calling process, `forkserver` or `spawn` otherwise.
+    """
+
+    def __init__(self, num_workers: Optional[int] = None, timeout: float = 10.0, start_method: str = "fork"):
+        self.num_workers = num_workers or min(8, os.cpu_count() or 1)
+        self.timeout = timeout
+        self._ctx = multiprocessing.get_context(start_method)
+        self._idle: "queue.Queue[int]" = queue.Queue()
+        self._slots: List[Tuple[multiprocessing.Process, Connection]] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.counters = {"tasks": 0, "errors": 0, "timeouts": 0, "crashes": 0, "respawns": 0}
+        for slot in range(self.num_workers):
+            self._slots.append(self._spawn_supervisor())
+            self._idle.put(slot)
+
+        atexit.register(self.close)
+
+    def _spawn_supervisor(self) -> Tuple[multiprocessing.Process, Connection]:
+        parent_end, child_end = self._ctx.Pipe()
+        # not a daemon, daemonic processes may not fork; `close` (also run at exit) stops it
+        process = self._ctx.Process(target=_supervisor_main, args=(child_end,))
+        process.start()
+        child_end.close()
+        return process, parent_end
+
+    def _count(self, status: str) -> None:
+        with self._lock:
+            self.counters["tasks"] += 1
+            if status == ERROR:
+                self.counters["errors"] += 1
+            elif status == TIMEOUT:
+                self.counters["timeouts"] += 1
+                self.counters["respawns"] += 1
+            elif status == CRASHED:
+                self.counters["crashes"] += 1
+                self.counters["respawns"] += 1
+
+    def run_batch(
+        self, fn: Callable, args_list: Sequence[Tuple], timeout: Optional[float] = None
+    ) -> List[Tuple[str, Any]]:
+        """Runs `fn(*args)` for every args tuple, returns `(status, value)` pairs in input order."""
+        timeout = self.timeout if timeout is None else timeout
+        outcomes: List[Optional[Tuple[str, Any]]] = [None] * len(args_list)
+        running: Dict[Connection, Tuple[int, int]] = {}  # conn -> (slot, task index)
+        next_task = 0
+        while next_task < len(args_list) or running:
+            # take every idle slot, but block for one if nothing is running yet
+            while next_task < len(args_list):
+                try:
+                    slot = self._idle.get(block=not running)
+                except queue.Empty:
+                    break
+
+                conn = self._slots[slot][1]
+                try:
+                    conn.send((fn, args_list[next_task], timeout))
+                except (BrokenPipeError, OSError):
+                    self._replace_supervisor(slot)
+                    outcomes[next_task] = (CRASHED, None)
+                    self._count(CRASHED)
+                else:
+                    running[conn] = (slot, next_task)
+
+                next_task += 1
+
+            if not running:
+                continue
+
+            # the supervisor enforces the timeout, the parent only guards against a stuck supervisor
+            ready = wait(list(running), timeout=timeout + 30)
+            if not ready:
+                for slot, index in running.values():
+                    self._replace_supervisor(slot)
+                    outcomes[index] = (CRASHED, None)
+                    self._count(CRASHED)
+                    self._idle.put(slot)
+
+                running.clear()
+                continue
+
+            for conn in ready:
+                slot, index = running.pop(conn)
+                try:
+                    outcomes[index] = conn.recv()
+                except (EOFError, OSError):
+                    self._replace_supervisor(slot)
+                    outcomes[index] = (CRASHED, None)
+
+                self._count(outcomes[index][0])
+                self._idle.put(slot)
+
+        return outcomes
+
+    def _replace_supervisor(self, slot: int) -> None:
+        process, conn = self._slots[slot]
+        process.kill()
+        process.join()
+        conn.close()
+        print(f"[grader_pool] Supervisor of slot {slot} died, starting a new one.")
+        self._slots[slot] = self._spawn_supervisor()
+
+    def map(self, fn: Callable, args_list: Sequence[Tuple], timeout: Optional[float] = None, default: Any = None) -> List[Any]:
+        """Like `run_batch`, but returns the values directly with `default` for failed tasks."""
+        return [value if status == OK else default for status, value in self.run_batch(fn, args_list, timeout)]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters, workers=self.num_workers)
+
+    def close(self) -> None:
+        if self._pid != os.getpid():  # forked children must not stop the parent's supervisors
+            return
+
+        for process, conn in self._slots:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+
+        for process, conn in self._slots:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+
+        self._slots.clear()
+
+
+_default_pool: Optional[GraderPool] = None
+_default_pool_pid: Optional[int] = None
+
+
+def get_grader_pool(num_workers: Optional[int] = None) -> GraderPool:
+    """
+    Per-process default pool, created lazily on first use. The caller may already run other
+    threads (Ray workers), so the supervisors are started from a forkserver instead of a fork.
+    """
+    global _default_pool, _default_pool_pid
+    if _default_pool is None or _default_pool_pid != os.getpid():
+        _default_pool = GraderPool(
+            num_workers or int(os.getenv("GRADER_WORKERS", "0")) or None, start_method="forkserver"
+        )
+        _default_pool_pid = os.getpid()
+
+    return _default_pool
+
+
+def grade_pairs(
+    pairs: Sequence[Tuple[Any, Any]],
+    grade_fn: Callable[[Any, Any], bool],
+    key_fn: Callable[[Any, Any], str],
+    pool: Optional[GraderPool] = None,
+    cache: Optional[GradeCache] = None,
+    timeout: Optional[float] = None,
+) -> List[bool]:
+    """
+    Grades `(prediction, ground_truth)` pairs: cache hits first, then one batch on the pool for
+    the misses. Errors and timeouts count as wrong and are not cached.
+    """
+    keys = [key_fn(*pair) for pair in pairs]
+    verdicts = [cache.get(key) if cache is not None else None for key in keys]
+    todo = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    if pool is None:
+        outcomes = []
+        for i in todo:
+            try:
+                outcomes.append((OK, grade_fn(*pairs[i])))
+            except Exception as e:
+                outcomes.append((ERROR, repr(e)))
+    else:
+        outcomes = pool.run_batch(grade_fn, [tuple(pairs[i]) for i in todo], timeout)
+
+    for i, (status, value) in zip(todo, outcomes):
+        if status != OK:
+            if status == TIMEOUT:
+                print(f"[grader_pool] TIMEOUT grading '{str(pairs[i][0])[:30]}...' against '{str(pairs[i][1])[:30]}...'.")
+
+            verdicts[i] = False
+            continue
+
+        verdicts[i] = bool(value)
+        if cache is not None:
+            cache.put(keys[i], verdicts[i])
+
+    return verdicts
@@ -0,0 +1,235 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Batched text similarity for the questioner's repetition penalty and for question deduplication.
+
+`bleu_similarity_matrix` reproduces `nltk.translate.bleu_score.sentence_bleu` (one reference,
+whitespace tokens, uniform 4-gram weights, `SmoothingFunction().method1`) for all ordered
+pairs at once. Every sentence is tokenized once into sparse n-gram count rows. The clipped
+match count `sum_g min(c_i[g], c_j[g])` equals `sum_t [c_i[g] >= t] * [c_j[g] >= t]`, so it is
+a sum of sparse products of thresholded binary matrices. That makes it symmetric and shared by
+both directions. Only the denominators and the brevity penalty depend on which side is the
+hypothesis.
+
+For batches too large for an n x n matrix, `minhash_signatures` + `lsh_candidate_pairs` find
+the pairs that are likely similar, and `bleu_pair_scores` scores just those pairs.
+`simhash_fingerprints` is the 64-bit alternative used by the question deduplication.
+"""
+
+import hashlib
+import zlib
+from collections import Counter, defaultdict
+from typing import List, Sequence, Set
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components as _connected_components
+
+
+def _ngram_counts(token_lists: Sequence[Sequence[str]], n: int) -> sparse.csr_matrix:
+    vocab = {}
+    indptr, indices, data = [0], [], []
+    for tokens in token_lists:
+        counts = Counter(tuple(tokens[k : k + n]) for k in range(len(tokens) - n + 1))
+        for ngram, count in counts.items():
+            indices.append(vocab.setdefault(ngram, len(vocab)))
+            data.append(count)
+
+        indptr.append(len(indices))
+
+    return sparse.csr_matrix(
+        (np.array(data, dtype=np.int64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+        shape=(len(token_lists), max(len(vocab), 1)),
+    )
+
+
+def _thresholds(counts: sparse.csr_matrix):
+    """Yields the binary matrices `[counts >= t]` for t = 1 .. max count."""
+    for t in range(1, int(counts.data.max(initial=0)) + 1):
+        binary = counts.copy()
+        binary.data = (binary.data >= t).astype(np.int64)
+        binary.eliminate_zeros()
+        yield binary
+
+
+def _brevity_penalty(hyp_len: np.ndarray, ref_len: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bp = np.exp(1 - ref_len / hyp_len)
+
+    bp = np.where(hyp_len > ref_len, 1.0, bp)
+    return np.where(hyp_len == 0, 0.0, bp)
+
+
+def bleu_similarity_matrix(sentences: Sequence[str], max_n: int = 4, epsilon: float = 0.1) -> np.ndarray:
+    """`out[i, j] = sentence_bleu([sentences[j].split()], sentences[i].split(), method1 smoothing)`."""
+    token_lists = [sentence.split() for sentence in sentences]
+    lengths = np.array([len(tokens) for tokens in token_lists], dtype=np.float64)
+    log_precision = np.zeros((len(sentences), len(sentences)))
+    no_unigram_match = None
+    for n in range(1, max_n + 1):
+        counts = _ngram_counts(token_lists, n)
+        clipped = sparse.csr_matrix((len(sentences), len(sentences)), dtype=np.int64)
+        for binary in _thresholds(counts):
+            clipped = clipped + binary @ binary.T
+
+        clipped = clipped.toarray().astype(np.float64)
+        denominator = np.maximum(1, lengths - n + 1)[:, None]  # hypothesis side (rows)
+        if n == 1:
+            no_unigram_match = clipped == 0
+
+        precision = np.where(clipped > 0, clipped, epsilon) / denominator
+        log_precision += (1.0 / max_n) * np.log(precision)
+
+    bleu = _brevity_penalty(lengths[:, None], lengths[None, :]) * np.exp(log_precision)
+    bleu[no_unigram_match] = 0.0
+    return bleu
+
+
+def bleu_distance_matrix(sentences: Sequence[str]) -> np.ndarray:
+    """
+    Symmetric `1 - BLEU` matrix with the convention of the original loop: the pair (i, j), i < j,
+    is scored with sentence i as hypothesis and sentence j as reference, then mirrored.
+    """
+    upper = np.triu(1.0 - bleu_similarity_matrix(sentences), k=1)
+    return upper + upper.T
+
+
+def bleu_pair_scores(sentences: Sequence[str], pairs: np.ndarray, max_n: int = 4, epsilon: float = 0.1) -> np.ndarray:
+    """BLEU of `pairs[:, 0]` (hypothesis) against `pairs[:, 1]` (reference), same smoothing as above."""
+    if len(pairs) == 0:
+        return np.zeros(0)
+
+    token_lists = [sentence.split() for sentence in sentences]
+    lengths = np.array([len(tokens) for tokens in token_lists], dtype=np.float64)
+    hyp, ref = pairs[:, 0], pairs[:, 1]
+    log_precision = np.zeros(len(pairs))
+    no_unigram_match = None
+    for n in range(1, max_n + 1):
+        counts = _ngram_counts(token_lists, n)
+        clipped = np.zeros(len(pairs))
+        for binary in _thresholds(counts):
+            clipped += np.asarray(binary[hyp].multiply(binary[ref]).sum(axis=1)).ravel()
+
+        if n == 1:
+            no_unigram_match = clipped == 0
+
+        precision = np.where(clipped > 0, clipped, epsilon) / np.maximum(1, lengths[hyp] - n + 1)
+        log_precision += (1.0 / max_n) * np.log(precision)
+
+    bleu = _brevity_penalty(lengths[hyp], lengths[ref]) * np.exp(log_precision)
+    bleu[no_unigram_match] = 0.0
+    return bleu
+
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _shingles(sentence: str, ngram: int) -> Set[str]:
+    tokens = sentence.split()
+    if not tokens:
+        return set()
+
+    return {" ".join(tokens[k : k + ngram]) for k in range(max(1, len(tokens) - ngram + 1))}
+
+
+def minhash_signatures(sentences: Sequence[str], num_perm: int = 64, ngram: int = 3, seed: int = 1) -> np.ndarray:
+    """
+    MinHash signatures (len(sentences) x num_perm, uint64) of the word `ngram`-shingle sets.
+    Shingles are hashed with crc32, so signatures are stable across processes. Sentences
+    shorter than `ngram` words use the whole sentence as their single shingle; empty
+    sentences get an all-max signature.
+    """
+    generator = np.random.RandomState(seed)
+    a = generator.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = generator.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    signatures = np.full((len(sentences), num_perm), _MAX_HASH, dtype=np.uint64)
+    for row, sentence in enumerate(sentences):
+        shingles = _shingles(sentence, ngram)
+        if not shingles:
+            continue
+
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+        permuted = ((hashes[:, None] * a[None, :] + b[None, :]) % _MERSENNE_PRIME) & _MAX_HASH
+        signatures[row] = permuted.min(axis=0)
+
+    return signatures
+
+
+def lsh_candidate_pairs(signatures: np.ndarray, bands: int = 16) -> np.ndarray:
+    """Pairs (i < j) whose signatures agree on at least one band, as an (m, 2) int64 array."""
+    num_perm = signatures.shape[1]
+    rows = num_perm // bands
+    empty = (signatures == _MAX_HASH).all(axis=1)
+    candidates = set()
+    for band in range(bands):
+        buckets = defaultdict(list)
+        for i, key in enumerate(signatures[:, band * rows : (band + 1) * rows]):
+            if not empty[i]:
+                buckets[key.tobytes()].append(i)
+
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    candidates.add((members[x], members[y]))
+
+    return np.array(sorted(candidates), dtype=np.int64).reshape(-1, 2)
+
+
+def connected_components(num_nodes: int, edges: np.ndarray) -> List[List[int]]:
+    """Connected components (lists of node ids, singletons included) of an undirected edge list."""
+    graph = sparse.coo_matrix(
+        (np.ones(len(edges)), (edges[:, 0], edges[:, 1])) if len(edges) else ([], ([], [])),
+        shape=(num_nodes, num_nodes),
+    )
+    _, labels = _connected_components(graph, directed=False)
+    groups: "defaultdict[int, List[int]]" = defaultdict(list)
+    for node, label in enumerate(labels):
+        groups[label].append(node)
+
+    return list(groups.values())
+
+
+def estimated_jaccard(signatures: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """MinHash estimate of the shingle Jaccard similarity for each pair."""
+    if len(pairs) == 0:
+        return np.zeros(0)
+
+    return (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+
+
+
+_SIMHASH_BITS = np.uint64(1) << np.arange(64, dtype=np.uint64)
+
+
+def simhash_fingerprints(sentences: Sequence[str], ngram: int = 3) -> np.ndarray:
+    """
+    64-bit SimHash fingerprints (uint64) of the word `ngram`-shingle sets, each shingle hashed
+    with blake2b and weighted once. Near-identical sentences differ in few bits; empty sentences
+    get 0.
+    """
+    fingerprints = np.zeros(len(sentences), dtype=np.uint64)
+    for row, sentence in enumerate(sentences):
+        shingles = _shingles(sentence, ngram)
+        if not shingles:
+            continue
+
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little") for shingle in shingles],
+            dtype=np.uint64,
+        )
+        votes = np.where((hashes[:, None] & _SIMHASH_BITS[None, :]) != 0, 1, -1).sum(axis=0)
+        fingerprints[row] = _SIMHASH_BITS[votes > 0].sum(dtype=np.uint64)
+
+    return fingerprints
@@ -0,0 +1,254 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Answer-equivalence clustering for majority voting over sampled answers.
+
+Every answer is canonicalized once into a few hashable keys whose equality already implies
+`grade_answer` equivalence (raw string, mathd normalization, mathruler `_normalize`, exact
+decimal value, and the legacy "both contain 'no '" rule). Answers sharing any key land in the
+same bucket, so the symbolic comparison only runs between bucket representatives, and those
+comparisons can be fanned out to a `GraderPool`, where a hung sympy call is killed after its
+timeout instead of stalling the whole batch.
+
+The final clustering replays the old greedy loop on the representatives: each bucket joins
+the first earlier cluster whose founder it matches (in either direction), so `answer_counts`
+keeps the old insertion order and tie-breaking.
+"""
+
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from mathruler.grader import grade_answer
+
+from .grade_cache import GradeCache, grade_answer_key, normal_forms
+from .grader_pool import OK, TIMEOUT, GraderPool
+
+
+def _decimal_key(normalized: str) -> Optional[str]:
+    try:
+        value = Decimal(normalized)
+    except (InvalidOperation, ValueError):
+        return None
+
+    if not value.is_finite():
+        return None
+
+    return str(value.normalize())
+
+
+def canonical_keys(answer: str) -> List[Hashable]:
+    """Hashable keys of an answer; two answers sharing any key are `grade_answer`-equivalent."""
+    keys: List[Hashable] = [("raw", answer)]
+    if "no " in answer.lower():
+        keys.append(("no",))
+
+    try:
+        mathd, normalized = normal_forms(answer)
+    except Exception:
+        return keys
+
+    keys.append(("mathd", mathd))
+    keys.append(("norm", normalized))
+    decimal = _decimal_key(normalized)
+    if decimal is not None:
+        keys.append(("num", decimal))
+
+    return keys
+
+
+def _equivalent(compare_fn: Callable[[str, str], bool], a: str, b: str) -> Tuple[bool, Optional[bool]]:
+    """Runs the comparison in both directions, the second one (None if skipped) only if the first fails."""
+    if compare_fn(a, b):
+        return True, None
+
+    return False, bool(compare_fn(b, a))
+
+
+class AnswerVoter:
+    """
+    Clusters sampled answers into equivalence classes.
+
+    Args:
+        compare_fn: pairwise grader `(given, ground_truth) -> bool`, must be picklable when a
+            pool is used.
+        pool: optional `GraderPool` for the representative comparisons; when None the
+            comparisons run inline.
+        timeout: seconds allowed per comparison (both directions) on the pool; a comparison
+            that is killed counts as "not equivalent".
+        key_fn: canonicalization function returning the bucket keys of an answer.
+        cache: optional `GradeCache` consulted before (and filled after) every comparison.
+        pair_key_fn: cache key of a directed `(given, ground_truth)` pair for `compare_fn`.
+    """
+
+    def __init__(
+        self,
+        compare_fn: Callable[[str, str], bool] = grade_answer,
+        pool: Optional[GraderPool] = None,
+        timeout: float = 10.0,
+        key_fn: Callable[[str], List[Hashable]] = canonical_keys,
+        cache: Optional[GradeCache] = None,
+        pair_key_fn: Callable[[str, str], str] = grade_answer_key,
+    ):
+        self.compare_fn = compare_fn
+        self.pool = pool
+        self.timeout = timeout
+        self.key_fn = key_fn
+        self.cache = cache
+        self.pair_key_fn = pair_key_fn
+
+    def _bucketize(self, answers: Sequence[str]) -> List[Tuple[str, int]]:
+        """Groups answers by shared canonical keys, returns (representative, count) in first-seen order."""
+        parent: List[int] = []
+        key_owner: Dict[Hashable, int] = {}
+
+        def find(x: int) -> int:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        first_answer: List[str] = []
+        counts: List[int] = []
+        for answer in answers:
+            bucket = len(parent)
+            parent.append(bucket)
+            first_answer.append(answer)
+            counts.append(1)
+            for key in self.key_fn(answer):
+                if key not in key_owner:
+                    key_owner[key] = bucket
+                    continue
+
+                root, other = find(key_owner[key]), find(bucket)
+                if root != other:
+                    # the earlier bucket always stays the root, so representatives are first-seen
+                    root, other = min(root, other), max(root, other)
+                    parent[other] = root
+                    counts[root] += counts[other]
+
+        return [(first_answer[i], counts[i]) for i in range(len(parent)) if find(i) == i]
+
+    def _cached_verdict(self, a: str, b: str) -> Optional[bool]:
+        forward = self.cache.get(self.pair_key_fn(a, b))
+        if forward:
+            return True
+
+        backward = self.cache.get(self.pair_key_fn(b, a))
+        if backward:
+            return True
+
+        if forward is False and backward is False:
+            return False
+
+        return None
+
+    def _run_pairs(self, pairs: List[Tuple[str, str]]) -> List[Optional[Tuple[bool, Optional[bool]]]]:
+        """Runs `_equivalent` on every pair, None for pairs that failed or timed out."""
+        if self.pool is None:
+            outcomes = []
+            for a, b in pairs:
+                try:
+                    outcomes.append(_equivalent(self.compare_fn, a, b))
+                except Exception as e:
+                    print(f"[voting] ERROR comparing '{a[:30]}...' with '{b[:30]}...': {e}. Skipping.")
+                    outcomes.append(None)
+            return outcomes
+
+        outcomes = []
+        results = self.pool.run_batch(_equivalent, [(self.compare_fn, a, b) for a, b in pairs], self.timeout)
+        for (a, b), (status, value) in zip(pairs, results):
+            if status == OK:
+                outcomes.append(value)
+                continue
+
+            if status == TIMEOUT:
+                print(f"[voting] TIMEOUT comparing '{a[:30]}...' with '{b[:30]}...'. Skipping pair.")
+            else:
+                print(f"[voting] {status.upper()} comparing '{a[:30]}...' with '{b[:30]}...': {value}. Skipping.")
+
+            outcomes.append(None)
+
+        return outcomes
+
+    def _compare_pairs(self, pairs: List[Tuple[str, str]]) -> List[bool]:
+        verdicts: List[Optional[bool]] = [None] * len(pairs)
+        if self.cache is not None:
+            verdicts = [self._cached_verdict(a, b) for a, b in pairs]
+
+        todo = [idx for idx, verdict in enumerate(verdicts) if verdict is None]
+        outcomes = self._run_pairs([pairs[idx] for idx in todo])
+        for idx, outcome in zip(todo, outcomes):
+            if outcome is None:  # failures and timeouts are never cached
+                verdicts[idx] = False
+                continue
+
+            forward, backward = outcome
+            if self.cache is not None:
+                a, b = pairs[idx]
+                self.cache.put(self.pair_key_fn(a, b), forward)
+                if backward is not None:
+                    self.cache.put(self.pair_key_fn(b, a), backward)
+
+            verdicts[idx] = forward or bool(backward)
+
+        return verdicts
+
+    def cluster_many(self, answer_lists: Sequence[Sequence[str]]) -> List[Dict[str, int]]:
+        """
+        Returns one `answer_counts` dict (founder answer -> count) per answer list. Empty
+        answers are skipped. The lists are processed in lockstep: round j compares the j-th
+        bucket of every list against that list's current founders, all in one submission.
+        """
+        buckets = [self._bucketize([answer for answer in answers if answer]) for answers in answer_lists]
+        founders: List[List[int]] = [[] for _ in buckets]
+        for j in range(max((len(group) for group in buckets), default=0)):
+            pairs, owners = [], []
+            for q, group in enumerate(buckets):
+                if j >= len(group):
+                    continue
+
+                if not founders[q]:
+                    founders[q].append(j)
+                    continue
+
+                for i in founders[q]:
+                    pairs.append((group[j][0], group[i][0]))
+                    owners.append((q, i))
+
+            matches: Dict[int, int] = {}
+            for (q, i), verdict in zip(owners, self._compare_pairs(pairs)):
+                if verdict and q not in matches:  # owners are in founder order
+                    matches[q] = i
+
+            for q, group in enumerate(buckets):
+                if j < len(group) and j not in founders[q]:
+                    if q in matches:
+                        group[matches[q]] = (group[matches[q]][0], group[matches[q]][1] + group[j][1])
+                        group[j] = (group[j][0], 0)
+                    else:
+                        founders[q].append(j)
+
+        return [{group[i][0]: group[i][1] for i in founders[q]} for q, group in enumerate(buckets)]
+
+    def cluster(self, answers: Sequence[str]) -> Dict[str, int]:
+        return self.cluster_many([answers])[0]
+
+    def vote(self, answers: Sequence[str]) -> Tuple[str, int]:
+        """Returns the majority answer and its count, ("", 0) if there is no non-empty answer."""
+        answer_counts = self.cluster(answers)
+        if not answer_counts:
+            return "", 0
+
+        majority = max(answer_counts, key=answer_counts.get)
+        return majority, answer_counts[majority]
@@ -242,16 +242,7 @@ def rearrange_micro_batches(batch: TensorDict, max_token_len, dp_group=None):
 
     micro_bsz_idx = get_seqlen_balanced_partitions(seq_len_effective, num_micro_batches, equal_size=False)
 
-    micro_batches = []
-
-    for partition in micro_bsz_idx:
-        curr_micro_batch = []
-        for idx in partition:
-            curr_micro_batch.append(batch[idx : idx + 1])
-        curr_micro_batch = torch.cat(curr_micro_batch)
-
-        micro_batches.append(curr_micro_batch)
-
+    micro_batches = [batch[torch.tensor(partition)] for partition in micro_bsz_idx]
     return micro_batches, micro_bsz_idx
 
 
@@ -83,6 +83,141 @@ def entropy_from_logits(logits: torch.Tensor) -> torch.Tensor:
     return entropy
 
 
+def _iter_vocab_blocks(
+    inputs: torch.Tensor, weight: Optional[torch.Tensor], temperature: float, vocab_chunk_size: int
+) -> Tuple[int, torch.Tensor]:
+    """Yields the logits of `inputs` (logits, or hidden states if `weight` is given) block by block of the vocab,
+    upcast to at least fp32."""
+    vocab_size = inputs.size(-1) if weight is None else weight.size(0)
+    for start in range(0, vocab_size, vocab_chunk_size):
+        end = min(start + vocab_chunk_size, vocab_size)
+        logits = inputs[:, start:end] if weight is None else inputs @ weight[start:end].t()
+        yield start, logits.to(torch.promote_types(logits.dtype, torch.float32)) / temperature
+
+
+class _ChunkedLogProbsEntropy(torch.autograd.Function):
+    """
+    Log probs and entropy of a chunk of tokens at a time, with an online logsumexp over blocks of the
+    vocab. Only the logits of one block of one chunk exist at a time, the backward recomputes them.
+    """
+
+    @staticmethod
+    def forward(ctx, inputs, weight, labels, temperature, chunk_size, vocab_chunk_size):
+        num_tokens = inputs.size(0)
+        dtype = torch.promote_types(inputs.dtype, torch.float32)
+        log_probs = torch.empty(num_tokens, dtype=dtype, device=inputs.device)
+        entropy = torch.empty_like(log_probs)
+        logsumexp = torch.empty_like(log_probs)
+        for start in range(0, num_tokens, chunk_size):
+            chunk, chunk_labels = inputs[start : start + chunk_size], labels[start : start + chunk_size]
+            max_logit = torch.full_like(log_probs[start : start + chunk_size], float("-inf"))
+            sum_exp = torch.zeros_like(max_logit)
+            sum_exp_logit = torch.zeros_like(max_logit)  # sum of exp(logit - max_logit) * logit
+            label_logit = torch.zeros_like(max_logit)
+            for vocab_start, logits in _iter_vocab_blocks(chunk, weight, temperature, vocab_chunk_size):
+                new_max_logit = torch.maximum(max_logit, logits.max(dim=-1).values)
+                scale = torch.exp(max_logit - new_max_logit)
+                exp_logits = torch.exp(logits - new_max_logit.unsqueeze(-1))
+                sum_exp = sum_exp * scale + exp_logits.sum(dim=-1)
+                sum_exp_logit = sum_exp_logit * scale + (exp_logits * logits).sum(dim=-1)
+                max_logit = new_max_logit
+                block_labels = chunk_labels - vocab_start
+                in_block = (block_labels >= 0) & (block_labels < logits.size(-1))
+                block_label_logit = logits.gather(-1, block_labels.clamp(0, logits.size(-1) - 1).unsqueeze(-1))
+                label_logit += torch.where(in_block, block_label_logit.squeeze(-1), 0.0)
+
+            chunk_logsumexp = max_logit + torch.log(sum_exp)
+            logsumexp[start : start + chunk_size] = chunk_logsumexp
+            log_probs[start : start + chunk_size] = label_logit - chunk_logsumexp
+            entropy[start : start + chunk_size] = chunk_logsumexp - sum_exp_logit / sum_exp
+
+        ctx.save_for_backward(inputs, weight, labels, logsumexp, entropy)
+        ctx.temperature, ctx.chunk_size, ctx.vocab_chunk_size = temperature, chunk_size, vocab_chunk_size
+        ctx.set_materialize_grads(False)
+        return log_probs, entropy
+
+    @staticmethod
+    def backward(ctx, grad_log_probs, grad_entropy):
+        inputs, weight, labels, logsumexp, entropy = ctx.saved_tensors
+        temperature, chunk_size, vocab_chunk_size = ctx.temperature, ctx.chunk_size, ctx.vocab_chunk_size
+        grad_inputs = torch.zeros_like(inputs) if ctx.needs_input_grad[0] else None
+        grad_weight = None
+        if weight is not None and ctx.needs_input_grad[1]:  # summed over all token chunks, in fp32 for bf16 weights
+            grad_weight = torch.zeros_like(weight, dtype=torch.promote_types(weight.dtype, torch.float32))
+        mean_logit = logsumexp - entropy  # sum of softmax * logits
+        for start in range(0, inputs.size(0), chunk_size):
+            chunk, chunk_labels = inputs[start : start + chunk_size], labels[start : start + chunk_size]
+            chunk_logsumexp = logsumexp[start : start + chunk_size].unsqueeze(-1)
+            grad_chunk = torch.zeros_like(chunk, dtype=logsumexp.dtype) if weight is not None else None
+            for vocab_start, logits in _iter_vocab_blocks(chunk, weight, temperature, vocab_chunk_size):
+                probs = torch.exp(logits - chunk_logsumexp)
+                grad_logits = torch.zeros_like(logits)
+                if grad_log_probs is not None:  # d log_prob / d logits = onehot(label) - softmax
+                    chunk_grad = grad_log_probs[start : start + chunk_size].unsqueeze(-1)
+                    grad_logits -= probs * chunk_grad
+                    block_labels = (chunk_labels - vocab_start).unsqueeze(-1)
+                    in_block = (block_labels >= 0) & (block_labels < logits.size(-1))
+                    grad_logits.scatter_add_(
+                        -1, block_labels.clamp(0, logits.size(-1) - 1), torch.where(in_block, chunk_grad, 0.0)
+                    )
+
+                if grad_entropy is not None:  # d entropy / d logits = -softmax * (logits - sum of softmax * logits)
+                    chunk_grad = grad_entropy[start : start + chunk_size].unsqueeze(-1)
+                    chunk_mean_logit = mean_logit[start : start + chunk_size].unsqueeze(-1)
+                    grad_logits -= probs * (logits - chunk_mean_logit) * chunk_grad
+
+                grad_logits = (grad_logits / temperature).to(inputs.dtype)
+                vocab_end = vocab_start + logits.size(-1)
+                if weight is None:
+                    if grad_inputs is not None:
+                        grad_inputs[start : start + chunk_size, vocab_start:vocab_end] = grad_logits
+                else:
+                    if grad_inputs is not None:
+                        grad_chunk += grad_logits @ weight[vocab_start:vocab_end]
+
+                    if grad_weight is not None:
+                        grad_weight[vocab_start:vocab_end] += (grad_logits.t() @ chunk).to(grad_weight.dtype)
+
+            if weight is not None and grad_inputs is not None:
+                grad_inputs[start : start + chunk_size] = grad_chunk
+
+        if grad_weight is not None:
+            grad_weight = grad_weight.to(weight.dtype)
+
+        return grad_inputs, grad_weight, None, None, None, None
+
+
+def log_probs_and_entropy(
+    inputs: torch.Tensor,
+    labels: torch.Tensor,
+    weight: Optional[torch.Tensor] = None,
+    temperature: float = 1.0,
+    chunk_size: int = 1024,
+    vocab_chunk_size: int = 8192,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Compute log probs on the label ids and entropy, `chunk_size` tokens at a time, without the
+    full-vocab logits, softmax and fp32 copies of `log_probs_from_logits` and `entropy_from_logits`.
+
+    Args:
+        inputs (torch.Tensor): logits, shape (..., vocab_size), or hidden states, shape (..., hidden_size),
+            if the lm_head weight is given, in which case the logits never exist as a whole
+        labels (torch.Tensor): labels of the model, shape (...)
+        weight (torch.Tensor, optional): lm_head weight without bias, shape (vocab_size, hidden_size)
+        temperature (float): the logits are divided by the temperature
+        chunk_size (int): number of tokens whose logits are computed at once
+        vocab_chunk_size (int): number of vocab entries whose logits are computed at once
+
+    Returns:
+        torch.Tensor: log probs of the labels in at least fp32, shape (...)
+        torch.Tensor: entropy in at least fp32, shape (...)
+    """
+    batch_dim = inputs.shape[:-1]
+    log_probs, entropy = _ChunkedLogProbsEntropy.apply(
+        inputs.reshape(-1, inputs.size(-1)), weight, labels.reshape(-1), temperature, chunk_size, vocab_chunk_size
+    )
+    return log_probs.view(*batch_dim), entropy.view(*batch_dim)
+
+
 def masked_mean(values: torch.Tensor, mask: torch.Tensor, dim: int = None, eps: float = 1e-8) -> torch.Tensor:
     """Compute mean of tensor with a masked values."""
     return (values * mask).sum(dim=dim) / (mask.sum(dim=dim) + eps)
@@ -78,6 +78,7 @@ class ActorConfig:
     global_batch_size: int = 256
     micro_batch_size_per_device_for_update: int = 4
     micro_batch_size_per_device_for_experience: int = 16
+    max_token_len_per_gpu: Optional[int] = None  # token budget of dynamic micro-batches, requires padding_free
     max_grad_norm: float = 1.0
     clip_ratio_low: float = 0.2
     clip_ratio_high: float = 0.3
@@ -86,6 +87,8 @@ class ActorConfig:
     padding_free: bool = False
     ulysses_sequence_parallel_size: int = 1
     use_torch_compile: bool = True
+    use_fused_log_probs: bool = False  # chunked log probs and entropy without the full-vocab logits
+    log_prob_chunk_size: int = 1024
     model: ModelConfig = field(default_factory=ModelConfig)
     optim: OptimConfig = field(default_factory=OptimConfig)
     fsdp: FSDPConfig = field(default_factory=FSDPConfig)
@@ -105,6 +108,9 @@ class RefConfig:
     offload: OffloadConfig = field(default_factory=OffloadConfig)
     """auto keys"""
     micro_batch_size_per_device_for_experience: int = field(default=-1, init=False)
+    max_token_len_per_gpu: Optional[int] = field(default=None, init=False)
     padding_free: bool = field(default=False, init=False)
     ulysses_sequence_parallel_size: int = field(default=1, init=False)
     use_torch_compile: bool = field(default=True, init=False)
+    use_fused_log_probs: bool = field(default=False, init=False)
+    log_prob_chunk_size: int = field(default=1024, init=False)
@@ -15,11 +15,14 @@
 Implement Actor
 """
 
+import inspect
 import os
 from collections import defaultdict
-from typing import Any, Dict, Optional, Union, Tuple
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Union, Tuple
 
 import torch
+import torch.nn.functional as F
 from einops import rearrange
 from ray.experimental.tqdm_ray import tqdm
 from torch import nn
@@ -30,6 +33,7 @@ from ...protocol import DataProto
 from ...trainer import core_algos
 from ...utils import torch_functional as VF
 from ...utils.py_functional import append_to_dict
+from ...utils.seqlen_balancing import get_reverse_idx, rearrange_micro_batches
 from ...utils.ulysses import gather_outputs_and_unpad, ulysses_pad_and_slice_inputs
 from .base import BasePPOActor
 from .config import ActorConfig
@@ -57,6 +61,58 @@ class DataParallelPPOActor(BasePPOActor):
         else:
             self.log_probs_from_logits = VF.log_probs_from_logits
 
+        # models taking the positions to compute the logits of only compute those of the response tokens
+        model_forward = getattr(actor_module, "_fsdp_wrapped_module", actor_module).forward
+        self.select_logits = "logits_to_keep" in inspect.signature(model_forward).parameters
+
+        # the fused lm_head computes the log probs and entropy from the hidden states, without the logits
+        lm_head = actor_module.get_output_embeddings()
+        self.fuse_lm_head = (
+            config.use_fused_log_probs
+            and isinstance(lm_head, nn.Linear)
+            and lm_head.bias is None
+            and getattr(actor_module.config, "final_logit_softcapping", None) is None
+        )
+
+    @contextmanager
+    def _log_probs_head(self, labels: torch.Tensor, temperature: float):
+        """
+        With the fused lm_head, the model outputs the stacked log probs of `labels` and entropy instead of
+        the logits. The lm_head weight is used inside the forward of the model, where FSDP has gathered it.
+        """
+        if not self.fuse_lm_head:
+            yield
+            return
+
+        lm_head = self.actor_module.get_output_embeddings()
+
+        def forward(hidden_states: torch.Tensor) -> torch.Tensor:
+            log_probs, entropy = VF.log_probs_and_entropy(
+                hidden_states,
+                labels,
+                weight=lm_head.weight,
+                temperature=temperature,
+                chunk_size=self.config.log_prob_chunk_size,
+            )
+            return torch.stack((log_probs, entropy), dim=-1)
+
+        lm_head.forward = forward
+        try:
+            yield
+        finally:
+            del lm_head.forward
+
+    def _fused_log_probs(
+        self, logits: torch.Tensor, labels: torch.Tensor, temperature: float
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Log probs and entropy from the output of the model, already computed by the fused lm_head."""
+        if self.fuse_lm_head:
+            return logits[..., 0], logits[..., 1]
+
+        return VF.log_probs_and_entropy(
+            logits, labels, temperature=temperature, chunk_size=self.config.log_prob_chunk_size
+        )
+
     def _forward_micro_batch(self, micro_batch: Dict[str, torch.Tensor], temperature: float, return_entropy: bool = False) -> Union[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
         """
         Returns:
@@ -100,6 +156,12 @@ class DataParallelPPOActor(BasePPOActor):
             # for compute the log_prob
             input_ids_rmpad_rolled = torch.roll(input_ids_rmpad, shifts=-1, dims=1)  # (1, total_nnz)
 
+            # only the tokens followed by a response token are returned, the log probs and entropy of
+            # the prompt tokens are not computed
+            token_positions = indices % seqlen
+            response_token_mask = (token_positions >= seqlen - response_length - 1) & (token_positions < seqlen - 1)
+            response_token_mask = response_token_mask.unsqueeze(0).int()  # (1, total_nnz)
+
             # pad and slice the inputs if sp > 1
             if self.config.ulysses_sequence_parallel_size > 1:
                 input_ids_rmpad, position_ids_rmpad, pad_size = ulysses_pad_and_slice_inputs(
@@ -108,25 +170,51 @@ class DataParallelPPOActor(BasePPOActor):
                 input_ids_rmpad_rolled, _, _ = ulysses_pad_and_slice_inputs(
                     input_ids_rmpad_rolled, None, self.config.ulysses_sequence_parallel_size
                 )
+                response_token_mask, _, _ = ulysses_pad_and_slice_inputs(
+                    response_token_mask, None, self.config.ulysses_sequence_parallel_size
+                )
 
             input_ids_rmpad_rolled = input_ids_rmpad_rolled.squeeze(0)  # ((total_nnz / sp) + pad)
+            num_local_tokens = input_ids_rmpad_rolled.size(0)
+            response_token_index = response_token_mask.squeeze(0).nonzero().squeeze(-1)  # (num_response_tokens,)
+            labels = input_ids_rmpad_rolled[response_token_index]
 
             # only pass input_ids and position_ids to enable flash_attn_varlen
-            output = self.actor_module(
-                input_ids=input_ids_rmpad,
-                attention_mask=None,
-                position_ids=position_ids_rmpad,
-                **multi_modal_inputs,
-                use_cache=False,
-            )  # prevent model thinks we are generating
-            logits_rmpad = output.logits.squeeze(0)  # (total_nnz, vocab_size)
-            logits_rmpad.div_(temperature)
-            # ((total_nnz / sp) + pad)
-            log_probs = self.log_probs_from_logits(logits=logits_rmpad, labels=input_ids_rmpad_rolled)
+            model_kwargs = {"logits_to_keep": response_token_index} if self.select_logits else {}
+            with self._log_probs_head(labels if self.select_logits else input_ids_rmpad_rolled, temperature):
+                output = self.actor_module(
+                    input_ids=input_ids_rmpad,
+                    attention_mask=None,
+                    position_ids=position_ids_rmpad,
+                    **multi_modal_inputs,
+                    **model_kwargs,
+                    use_cache=False,
+                )  # prevent model thinks we are generating
+
+            # (num_response_tokens, vocab_size), (num_response_tokens, 2) if fused
+            logits_rmpad = output.logits.squeeze(0)
+            if not self.select_logits:
+                logits_rmpad = logits_rmpad[response_token_index]
+
+            if self.config.use_fused_log_probs:
+                log_probs, entropy = self._fused_log_probs(logits_rmpad, labels, temperature)
+            else:
+                logits_rmpad.div_(temperature)
+                if labels.numel() > 0:
+                    log_probs = self.log_probs_from_logits(logits=logits_rmpad, labels=labels)
+                else:  # no response token on this sp rank, the empty logits keep the backward of the model
+                    log_probs = logits_rmpad.float().sum(-1)
+
+                if return_entropy:
+                    entropy = VF.entropy_from_logits(logits_rmpad)
+
+            # scatter back to ((total_nnz / sp) + pad), the prompt tokens are zero
+            log_probs = log_probs.new_zeros(num_local_tokens).index_copy(0, response_token_index, log_probs)
+            if return_entropy:
+                entropy = entropy.new_zeros(num_local_tokens).index_copy(0, response_token_index, entropy)
 
             # compute entropy if requested
             if return_entropy:
-                entropy = VF.entropy_from_logits(logits_rmpad)  # ((total_nnz / sp) + pad)
                 # gather entropy if sp > 1
                 if self.config.ulysses_sequence_parallel_size > 1:
                     entropy = gather_outputs_and_unpad(entropy, gather_dim=0, unpad_dim=0, padding_size=pad_size)
@@ -147,26 +235,65 @@ class DataParallelPPOActor(BasePPOActor):
             )
             log_probs = full_log_probs.squeeze(-1)[:, -response_length - 1 : -1]  # (bsz, response_length)
         else:
-            output = self.actor_module(
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                position_ids=position_ids,
-                **multi_modal_inputs,
-                use_cache=False,
-            )
+            # the label of each position is the next token, only those of the responses are used
+            if self.select_logits:  # only the logits of the last response_length + 1 positions
+                model_kwargs = {"logits_to_keep": response_length + 1}
+                labels = F.pad(responses, (0, 1))
+            else:
+                model_kwargs = {}
+                labels = F.pad(responses, (seqlen - response_length - 1, 1))
+
+            with self._log_probs_head(labels, temperature):
+                output = self.actor_module(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    **multi_modal_inputs,
+                    **model_kwargs,
+                    use_cache=False,
+                )
+
             logits: torch.Tensor = output.logits
-            logits.div_(temperature)
-            logits = logits[:, -response_length - 1 : -1, :]  # (bsz, response_length, vocab_size)
-            log_probs = self.log_probs_from_logits(logits, responses)  # (bsz, response_length)
-            
-            # compute entropy if requested
-            if return_entropy:
-                entropy = VF.entropy_from_logits(logits)  # (bsz, response_length)
+            logits = logits[:, -response_length - 1 : -1]  # (bsz, response_length, vocab_size)
+            if self.config.use_fused_log_probs:
+                log_probs, entropy = self._fused_log_probs(logits, responses, temperature)
+            else:
+                logits.div_(temperature)
+                log_probs = self.log_probs_from_logits(logits, responses)  # (bsz, response_length)
+
+                # compute entropy if requested
+                if return_entropy:
+                    entropy = VF.entropy_from_logits(logits)  # (bsz, response_length)
 
         if return_entropy:
             return log_probs, entropy
         return log_probs
 
+    def _split_micro_batches(self, data: DataProto, micro_batch_size: int) -> Tuple[List[DataProto], Optional[List[int]]]:
+        """
+        Splits the data into micro-batches of `micro_batch_size` samples, or, with `max_token_len_per_gpu`,
+        into the fewest micro-batches of balanced valid token counts within the budget.
+
+        Returns:
+            micro_batches: the micro-batches
+            order (optional): the indices of the samples in the concatenated micro-batches if they are reordered
+        """
+        if self.config.max_token_len_per_gpu is None:
+            return data.split(micro_batch_size), None
+
+        # every rank of a sequence parallel group holds the whole micro-batch and processes a slice of it
+        max_token_len = self.config.max_token_len_per_gpu * self.config.ulysses_sequence_parallel_size
+        batches, partitions = rearrange_micro_batches(data.batch, max_token_len=max_token_len)
+        micro_batches = [
+            DataProto(
+                batch=batch,
+                non_tensor_batch={key: value[partition] for key, value in data.non_tensor_batch.items()},
+                meta_info=data.meta_info,
+            )
+            for batch, partition in zip(batches, partitions)
+        ]
+        return micro_batches, [idx for partition in partitions for idx in partition]
+
     def _optimizer_step(self) -> torch.Tensor:
         if isinstance(self.actor_module, FSDP):
             grad_norm = self.actor_module.clip_grad_norm_(self.config.max_grad_norm)
@@ -212,8 +339,8 @@ class DataParallelPPOActor(BasePPOActor):
         else:
             non_tensor_select_keys = []
 
-        micro_batches = data.select(select_keys, non_tensor_select_keys).split(
-            self.config.micro_batch_size_per_device_for_experience
+        micro_batches, order = self._split_micro_batches(
+            data.select(select_keys, non_tensor_select_keys), self.config.micro_batch_size_per_device_for_experience
         )
         log_probs_lst = []
         entropy_lst = [] if return_entropy else None
@@ -230,8 +357,15 @@ class DataParallelPPOActor(BasePPOActor):
             log_probs_lst.append(log_probs)
 
         log_probs = torch.concat(log_probs_lst, dim=0)
+        if order is not None:  # restore the order of the samples
+            revert_idx = torch.tensor(get_reverse_idx(order), device=log_probs.device)
+            log_probs = log_probs[revert_idx]
+
         if return_entropy:
             entropy = torch.concat(entropy_lst, dim=0)
+            if order is not None:
+                entropy = entropy[revert_idx]
+
             return log_probs, entropy
         return log_probs
 
@@ -261,7 +395,14 @@ class DataParallelPPOActor(BasePPOActor):
                 gradient_accumulation = (
                     self.config.global_batch_size_per_device // self.config.micro_batch_size_per_device_for_update
                 )
-                micro_batches = mini_batch.split(self.config.micro_batch_size_per_device_for_update)
+                micro_batches, order = self._split_micro_batches(
+                    mini_batch, self.config.micro_batch_size_per_device_for_update
+                )
+                if order is not None:
+                    # micro-batches differ in size, each loss is weighted by its share of the response tokens
+                    response_length = mini_batch.batch["responses"].size(1)
+                    num_response_tokens = max(mini_batch.batch["attention_mask"][:, -response_length:].sum().item(), 1)
+
                 if self.rank == 0:
                     micro_batches = tqdm(micro_batches, desc="Update policy", position=3)
 
@@ -300,7 +441,11 @@ class DataParallelPPOActor(BasePPOActor):
                         metrics["actor/kl_loss"] = kl_loss.detach().item()
                         metrics["actor/kl_coef"] = self.config.kl_coef
 
-                    loss = pg_loss / gradient_accumulation
+                    if order is None:
+                        loss = pg_loss / gradient_accumulation
+                    else:
+                        loss = pg_loss * response_mask.sum().item() / num_response_tokens
+
                     loss.backward()
 
                     batch_metrics = {
@@ -47,6 +47,9 @@ class WorkerConfig:
 
     def post_init(self):
         self.ref.micro_batch_size_per_device_for_experience = self.actor.micro_batch_size_per_device_for_experience
+        self.ref.max_token_len_per_gpu = self.actor.max_token_len_per_gpu
         self.ref.padding_free = self.actor.padding_free
         self.ref.ulysses_sequence_parallel_size = self.actor.ulysses_sequence_parallel_size
         self.ref.use_torch_compile = self.actor.use_torch_compile
+        self.ref.use_fused_log_probs = self.actor.use_fused_log_probs
+        self.ref.log_prob_chunk_size = self.actor.log_prob_chunk_size
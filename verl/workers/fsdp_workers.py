@@ -125,6 +125,9 @@ class FSDPWorker(Worker):
 
         self.ulysses_sharding_manager = FSDPUlyssesShardingManager(self.ulysses_device_mesh)
 
+        if getattr(config, "max_token_len_per_gpu", None) is not None and not config.padding_free:
+            raise ValueError(f"{role} max_token_len_per_gpu requires padding_free, padded tokens cost memory as well.")
+
         if not hasattr(config, "global_batch_size"):  # ref model
             return
 
@@ -324,6 +327,7 @@ class FSDPWorker(Worker):
             module=self.fsdp_module,
             inference_engine=self.rollout.inference_engine,
             device_mesh=rollout_device_mesh,
+            bucket_size_mb=self.config.rollout.sync_bucket_size_mb,
         )
         print_gpu_memory_usage("After vllm init")
 
@@ -421,6 +425,9 @@ class FSDPWorker(Worker):
 
         self.checkpoint_manager.load_checkpoint(path)
         dist.barrier()
+        if self._is_rollout:
+            self.rollout_sharding_manager.weight_version += 1
+
         if self._use_param_offload:
             offload_fsdp_model(self.fsdp_module)
 
@@ -481,6 +488,9 @@ class FSDPWorker(Worker):
             with Timer(name="update_policy", logger=None) as timer:
                 metrics = self.actor.update_policy(data=data)
 
+            if self._is_rollout:
+                self.rollout_sharding_manager.weight_version += 1
+
             delta_time = timer.last
             global_num_tokens = data.meta_info["global_token_num"]
             estimated_flops, promised_flops = self.flops_counter.estimate_flops(global_num_tokens, delta_time)
@@ -519,7 +529,10 @@ class FSDPWorker(Worker):
     def generate_sequences(self, prompts: DataProto):
         assert self._is_rollout
 
-        if self._use_param_offload:
+        # the actor weights are only needed on the gpu if vllm holds an older version of them
+        sharding_manager = self.rollout_sharding_manager
+        sync_weights = sharding_manager.loaded_weight_version != sharding_manager.weight_version
+        if self._use_param_offload and sync_weights:
             load_fsdp_model(self.fsdp_module)
 
         meta_info = {
@@ -533,7 +546,7 @@ class FSDPWorker(Worker):
         prompts.meta_info.update(meta_info)
         with self.rollout_sharding_manager:
             # after parameters sync with rollout, offload actor model to CPU
-            if self._use_param_offload:
+            if self._use_param_offload and sync_weights:
                 offload_fsdp_model(self.fsdp_module)
 
             if self._use_optimizer_offload:
@@ -566,6 +579,7 @@ class FSDPWorker(Worker):
                     )
 
             output = self.rollout_sharding_manager.postprocess_data(output)
+            output.meta_info.update(self.rollout_sharding_manager.sync_metrics)
 
         output = output.to("cpu")
         return output
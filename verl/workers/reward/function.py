@@ -15,6 +15,7 @@
 import importlib.util
 import os
 import sys
+import time
 from abc import ABC, abstractmethod
 from collections import defaultdict
 from functools import partial
@@ -70,6 +71,12 @@ class FunctionRewardManager(ABC):
         """Compute reward for a batch of data."""
         ...
 
+    def compute_reward_with_timing(self, data: DataProto) -> Tuple[torch.Tensor, Dict[str, List[float]], float]:
+        """Compute reward for a batch of data, also returning the seconds spent computing it."""
+        start = time.perf_counter()
+        reward_tensor, reward_metrics = self.compute_reward(data)
+        return reward_tensor, reward_metrics, time.perf_counter() - start
+
 
 class SequentialFunctionRewardManager(FunctionRewardManager):
     reward_fn: SequentialRewardFunction
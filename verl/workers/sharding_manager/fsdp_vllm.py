@@ -13,12 +13,14 @@
 # limitations under the License.
 
 import inspect
+import math
 import re
-from typing import Dict, Iterable, Tuple, Union
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 import torch
 import torch.distributed as dist
-from torch.distributed._tensor import DTensor
+from torch.distributed._tensor import DTensor, Replicate, Shard
 from torch.distributed.checkpoint.state_dict import get_model_state_dict
 from torch.distributed.device_mesh import DeviceMesh
 from torch.distributed.fsdp.fully_sharded_data_parallel import FullyShardedDataParallel as FSDP
@@ -31,16 +33,99 @@ from ...utils.model_utils import print_gpu_memory_usage
 from .base import BaseShardingManager
 
 
+def _shard_group(tensor: Union[torch.Tensor, DTensor]) -> Optional[Tuple[dist.ProcessGroup, int]]:
+    """Process group and size of the mesh dim a DTensor is row-sharded on, if it is only sharded on dim 0."""
+    if not isinstance(tensor, DTensor):
+        return None
+
+    shard_dims = [i for i, placement in enumerate(tensor.placements) if not isinstance(placement, Replicate)]
+    if len(shard_dims) != 1 or tensor.placements[shard_dims[0]] != Shard(0) or tensor.dim() == 0:
+        return None
+
+    return tensor.device_mesh.get_group(shard_dims[0]), tensor.device_mesh.size(shard_dims[0])
+
+
+def _make_buckets(
+    actor_weights: Dict[str, Union[torch.Tensor, DTensor]], bucket_size: int
+) -> Iterable[List[Tuple[str, Union[torch.Tensor, DTensor]]]]:
+    """
+    Consecutive row-sharded weights of the same dtype and process group, up to `bucket_size` bytes
+    of full tensors per bucket. Any other weight is a bucket of its own.
+    """
+    bucket, bucket_key, bucket_bytes = [], None, 0
+    for name, tensor in actor_weights.items():
+        group = _shard_group(tensor)
+        key = (tensor.dtype, group[0]) if group is not None else None
+        nbytes = tensor.numel() * tensor.element_size()
+        if len(bucket) > 0 and (key is None or key != bucket_key or bucket_bytes + nbytes > bucket_size):
+            yield bucket
+            bucket, bucket_bytes = [], 0
+
+        bucket.append((name, tensor))
+        bucket_key, bucket_bytes = key, bucket_bytes + nbytes
+        if key is None:
+            yield bucket
+            bucket, bucket_bytes = [], 0
+
+    if len(bucket) > 0:
+        yield bucket
+
+
+def _all_gather_bucket(bucket: List[Tuple[str, Union[torch.Tensor, DTensor]]]):
+    """
+    Launches one all-gather for the local shards of a bucket, each padded to the chunk size of its
+    weight so that every rank sends the same layout. Returns the arguments of `_unpack_bucket`.
+    """
+    name, tensor = bucket[0]
+    group = _shard_group(tensor)
+    if group is None:  # a single weight that is not row-sharded
+        return [(name, tensor.full_tensor() if isinstance(tensor, DTensor) else tensor)], None, None
+
+    group, world_size = group
+    layout, offset = [], 0
+    for name, tensor in bucket:
+        chunk_rows = -(-tensor.size(0) // world_size)
+        layout.append((name, tensor, offset, chunk_rows))
+        offset += chunk_rows * math.prod(tensor.shape[1:])
+
+    send_buffer = torch.empty(offset, dtype=tensor.dtype, device=torch.cuda.current_device())
+    for _, tensor, start, _ in layout:
+        local_tensor = tensor.to_local()
+        send_buffer[start : start + local_tensor.numel()].copy_(local_tensor.reshape(-1), non_blocking=True)
+
+    recv_buffer = torch.empty(world_size * send_buffer.numel(), dtype=send_buffer.dtype, device=send_buffer.device)
+    work = dist.all_gather_into_tensor(recv_buffer, send_buffer, group=group, async_op=True)
+    return layout, recv_buffer.view(world_size, -1), work
+
+
+def _unpack_bucket(layout, recv_buffer: Optional[torch.Tensor], work) -> Iterable[Tuple[str, torch.Tensor]]:
+    """Waits for the all-gather of a bucket and yields its full weights one after the other."""
+    if work is None:
+        yield from layout
+        return
+
+    work.wait()
+    world_size = recv_buffer.size(0)
+    for name, tensor, offset, chunk_rows in layout:
+        shape = tensor.shape
+        # rank r holds rows [r * chunk_rows, (r + 1) * chunk_rows), the padding sits past the last row
+        full_tensor = recv_buffer[:, offset : offset + chunk_rows * math.prod(shape[1:])]
+        yield name, full_tensor.reshape(world_size * chunk_rows, *shape[1:])[: shape[0]]
+
+
 class FSDPVLLMShardingManager(BaseShardingManager):
     def __init__(
         self,
         module: FSDP,
         inference_engine: LLM,
         device_mesh: DeviceMesh,
+        bucket_size_mb: int = 512,
     ):
         self.module = module
         self.inference_engine = inference_engine
         self.device_mesh = device_mesh
+        # weights are all-gathered in buckets of this size, 0 gathers one tensor after the other
+        self.bucket_size_mb = bucket_size_mb
 
         self.world_size = dist.get_world_size()
         self.tp_size = vllm_ps.get_tensor_model_parallel_world_size()
@@ -50,6 +135,11 @@ class FSDPVLLMShardingManager(BaseShardingManager):
         # Record freed bytes to estimate memory usage correctly
         # https://github.com/vllm-project/vllm/pull/11743#issuecomment-2754338119
         self.freed_bytes = 0
+        # time and peak memory of the last weight sync, reported with the rollout output
+        self.sync_metrics = {}
+        # bumped by the worker whenever the actor weights change, vllm holds `loaded_weight_version`
+        self.weight_version = 0
+        self.loaded_weight_version = None
 
         # Note that torch_random_states may be different on each dp rank
         self.torch_random_states = torch.cuda.get_rng_state()
@@ -82,8 +172,27 @@ class FSDPVLLMShardingManager(BaseShardingManager):
     def _make_weight_iterator(
         self, actor_weights: Dict[str, Union[torch.Tensor, DTensor]]
     ) -> Iterable[Tuple[str, torch.Tensor]]:
-        for name, tensor in actor_weights.items():
-            yield name, tensor.full_tensor() if self.world_size != 1 else tensor
+        if self.world_size == 1:
+            yield from actor_weights.items()
+            return
+
+        if self.bucket_size_mb <= 0:
+            for name, tensor in actor_weights.items():
+                yield name, tensor.full_tensor()
+
+            return
+
+        # the all-gather of the next bucket runs while vllm loads the current one
+        pending = None
+        for bucket in _make_buckets(actor_weights, self.bucket_size_mb * 1024**2):
+            gathering = _all_gather_bucket(bucket)
+            if pending is not None:
+                yield from _unpack_bucket(*pending)
+
+            pending = gathering
+
+        if pending is not None:
+            yield from _unpack_bucket(*pending)
 
     def __enter__(self):
         # NOTE: Basically, we only need `torch.cuda.empty_cache()` before vllm wake_up and
@@ -94,7 +203,23 @@ class FSDPVLLMShardingManager(BaseShardingManager):
         # pytorch: https://pytorch.org/docs/stable/notes/cuda.html#memory-management
         # vllm: https://github.com/vllm-project/vllm/blob/v0.7.3/vllm/device_allocator/cumem.py#L103
         torch.cuda.empty_cache()
+        if self.loaded_weight_version == self.weight_version:
+            # vllm already holds the current weights, sleep level 1 keeps them in cpu memory
+            self.inference_engine.wake_up()
+            self.sync_metrics = {"weight_sync_s": 0.0, "weight_sync_peak_memory_gb": 0.0, "weight_sync_skipped": 1.0}
+            print_gpu_memory_usage("After vllm wake up without weight sync in sharding manager")
+        else:
+            self._sync_weights()
+
+        # important: need to manually set the random states of each tp to be identical.
+        if self.device_mesh is not None:
+            self.torch_random_states = torch.cuda.get_rng_state()
+            torch.cuda.set_rng_state(self.gen_random_states)
+
+    def _sync_weights(self):
         print_gpu_memory_usage("Before state_dict() in sharding manager")
+        torch.cuda.reset_peak_memory_stats()
+        sync_start = time.perf_counter()
         actor_weights = get_model_state_dict(self.module)
         actor_weights = self._rename_weight_keys(actor_weights, self.module._fsdp_wrapped_module)
         print_gpu_memory_usage("After state_dict() in sharding manager")
@@ -106,6 +231,13 @@ class FSDPVLLMShardingManager(BaseShardingManager):
 
         model = self.inference_engine.llm_engine.model_executor.driver_worker.worker.model_runner.model
         model.load_weights(self._make_weight_iterator(actor_weights))
+        torch.cuda.synchronize()
+        self.sync_metrics = {
+            "weight_sync_s": time.perf_counter() - sync_start,
+            "weight_sync_peak_memory_gb": torch.cuda.max_memory_allocated() / (1024**3),
+            "weight_sync_skipped": 0.0,
+        }
+        self.loaded_weight_version = self.weight_version
         print_gpu_memory_usage("After sync model weights in sharding manager")
 
         del actor_weights
@@ -115,10 +247,6 @@ class FSDPVLLMShardingManager(BaseShardingManager):
             self.inference_engine.wake_up(tags=["kv_cache"])
 
         print_gpu_memory_usage("After del state_dict and empty_cache in sharding manager")
-        # important: need to manually set the random states of each tp to be identical.
-        if self.device_mesh is not None:
-            self.torch_random_states = torch.cuda.get_rng_state()
-            torch.cuda.set_rng_state(self.gen_random_states)
 
     def __exit__(self, exc_type, exc_value, traceback):
         print_gpu_memory_usage("Before vllm offload in sharding manager")
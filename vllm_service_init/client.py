@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Client helpers for the solver grading server in `start_vllm_server.py`.
+
+The default path POSTs a {question, answer} batch to `/generate` and reads the per-question
+results back from the NDJSON stream, so nothing touches the shared STORAGE_PATH. The old
+temp-file handoff through `/hello?name=<task file>` is kept as a fallback for servers that
+do not expose the streaming endpoint (or when the stream breaks half-way).
+
+`dispatch_results` spreads a batch over several servers: the batch is cut into small chunks
+that every server pulls from a shared queue as soon as it has a free in-flight slot, so a
+server stuck on long answers simply takes fewer chunks. A failed chunk is put back for another
+server; a server that keeps failing is dropped from the rotation. `dispatch_graded` adds whole
+rounds of re-dispatch for the items that still no server graded, and raises if some remain, so
+callers never turn a server outage into a reward.
+
+Servers come from the `servers` argument, else from `SOLVER_SERVERS`
+(comma-separated `port` or `host:port` entries, e.g. `5000,5001`), else from the defaults
+passed by the caller.
+
+`send_job` talks to the resident generation daemon (`generation_daemon.py`) over its Unix socket.
+'''
+
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+
+import requests
+
+os.environ["NO_PROXY"] = "0.0.0.0,127.0.0.1"
+
+
+def generate_temp_filename(storage_path, prefix="temp", suffix=".json"):
+    timestamp = int(time.time() * 1000)
+    rand_part = random.randint(0, 99999)
+    return f"{storage_path}/temp_results/{prefix}_{timestamp}_{rand_part}{suffix}"
+
+
+def stream_results(port, data, host="0.0.0.0", timeout=None):
+    '''Sends `data` in the request body and collects the NDJSON results in input order.'''
+    results = [None] * len(data)
+    with requests.post(f"http://{host}:{port}/generate", json={"data": data}, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            item = json.loads(line)
+            results[item.pop("index")] = item
+
+    missing = sum(item is None for item in results)
+    if missing:
+        raise RuntimeError(f"Stream from port {port} ended with {missing} of {len(data)} results missing.")
+    return results
+
+
+def file_results(port, data, storage_path, host="0.0.0.0", timeout=None):
+    '''Legacy handoff: write a task file, let the server process it, and read the results file back.'''
+    task_file = generate_temp_filename(storage_path, prefix=f"temp_{port}", suffix=".json")
+    with open(task_file, "w") as f:
+        json.dump(data, f, indent=4)
+
+    response = requests.get(f"http://{host}:{port}/hello", params={"name": task_file}, timeout=timeout)
+    response.raise_for_status()
+
+    result_file = task_file.replace(".json", "_results.json")
+    with open(result_file, "r") as f:
+        results = json.load(f)
+    os.remove(result_file)
+    return results
+
+
+def fetch_results(port, data, storage_path=None, host="0.0.0.0", timeout=None):
+    '''Streams results from one server, falling back to the file-based endpoint on failure.'''
+    if not data:
+        return []
+    try:
+        return stream_results(port, data, host=host, timeout=timeout)
+    except (requests.RequestException, RuntimeError, ValueError) as e:
+        if storage_path is None:
+            raise
+        print(f"[client] Streaming from port {port} failed ({e}), falling back to the file-based endpoint.")
+        return file_results(port, data, storage_path, host=host, timeout=timeout)
+
+
+def get_solver_servers(servers=None, default_ports=(5000,), host="0.0.0.0"):
+    '''Resolves the solver server list into `[(host, port), ...]`.'''
+    if servers is None or servers == "":
+        servers = os.getenv("SOLVER_SERVERS") or list(default_ports)
+    if isinstance(servers, str):
+        servers = [entry.strip() for entry in servers.split(",") if entry.strip()]
+
+    resolved = []
+    for entry in servers:
+        entry = str(entry)
+        if ":" in entry:
+            entry_host, port = entry.rsplit(":", 1)
+            resolved.append((entry_host, int(port)))
+        else:
+            resolved.append((host, int(entry)))
+    return resolved
+
+
+def dispatch_results(data, servers, storage_path=None, chunk_size=16, max_inflight=2,
+                     max_attempts=3, max_server_failures=3, timeout=None):
+    '''
+    Work-stealing dispatch of `data` over `servers` (`[(host, port), ...]`), results in input order.
+
+    Every server gets `max_inflight` puller threads; each pulls the next chunk of `chunk_size`
+    items from the shared queue. A chunk that fails is retried on whichever server pulls it next,
+    up to `max_attempts` times; a server with `max_server_failures` consecutive failures stops
+    pulling. Items that no server could grade come back with `score: -1`, `ungraded: True` and an
+    `error`; callers must not score those as regular results, see `dispatch_graded`. A server-side
+    failure for a single question is an ordinary `score: -1` result without the marker.
+    '''
+    if not data:
+        return []
+
+    chunks = queue.Queue()
+    for start in range(0, len(data), chunk_size):
+        chunks.put((start, 1))
+    num_chunks = chunks.qsize()
+
+    results = [None] * len(data)
+    lock = threading.Lock()
+    state = {"finished": 0}
+    stats = {server: {"items": 0, "failures": 0, "consecutive_failures": 0, "down": False} for server in servers}
+
+    def pull(server):
+        host, port = server
+        stat = stats[server]
+        while True:
+            with lock:
+                if stat["down"] or state["finished"] == num_chunks:
+                    return
+            try:
+                start, attempt = chunks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            chunk = data[start:start + chunk_size]
+            try:
+                chunk_results = fetch_results(port, chunk, storage_path, host=host, timeout=timeout)
+                if len(chunk_results) != len(chunk):
+                    raise RuntimeError(f"expected {len(chunk)} results, got {len(chunk_results)}")
+            except Exception as e:
+                with lock:
+                    stat["failures"] += 1
+                    stat["consecutive_failures"] += 1
+                    if stat["consecutive_failures"] >= max_server_failures and not stat["down"]:
+                        stat["down"] = True
+                        print(f"[client] Server {host}:{port} failed {max_server_failures} times in a row, dropping it.")
+                    if attempt >= max_attempts:
+                        state["finished"] += 1
+                print(f"[client] Chunk at {start} failed on {host}:{port} (attempt {attempt}/{max_attempts}): {e}")
+                if attempt < max_attempts:
+                    chunks.put((start, attempt + 1))
+                continue
+
+            results[start:start + len(chunk)] = chunk_results
+            with lock:
+                stat["items"] += len(chunk)
+                stat["consecutive_failures"] = 0
+                state["finished"] += 1
+
+    threads = [threading.Thread(target=pull, args=(server,), daemon=True)
+               for server in servers for _ in range(max_inflight)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    missing = 0
+    for i, item in enumerate(results):
+        if item is None:
+            missing += 1
+            results[i] = {"question": data[i].get("question", ""), "answer": data[i].get("answer", ""),
+                          "score": -1, "results": [], "ungraded": True,
+                          "error": "no solver server could grade this item"}
+
+    summary = ", ".join(f"{host}:{port} items={stat['items']} failures={stat['failures']}"
+                        + (" (down)" if stat["down"] else "")
+                        for (host, port), stat in stats.items())
+    print(f"[client] Dispatched {len(data)} items in {num_chunks} chunks: {summary}"
+          + (f", {missing} items failed on every attempt" if missing else ""))
+    return results
+
+
+def ungraded_indices(results):
+    '''Indices of the `dispatch_results` items that no server could grade.'''
+    return [i for i, item in enumerate(results) if item.get("ungraded")]
+
+
+def dispatch_graded(data, servers, storage_path=None, max_rounds=3, retry_wait=30, **kwargs):
+    '''
+    `dispatch_results` that re-sends the items no server could grade, after `retry_wait` seconds,
+    for up to `max_rounds` rounds in total, and raises if some are still ungraded.
+    '''
+    results = dispatch_results(data, servers, storage_path=storage_path, **kwargs)
+    for round_idx in range(1, max_rounds):
+        todo = ungraded_indices(results)
+        if not todo:
+            return results
+        print(f"[client] {len(todo)} items were not graded by any solver server, "
+              f"retrying in {retry_wait}s (round {round_idx + 1}/{max_rounds}).")
+        time.sleep(retry_wait)
+        retried = dispatch_results([data[i] for i in todo], servers, storage_path=storage_path, **kwargs)
+        for i, item in zip(todo, retried):
+            results[i] = item
+
+    todo = ungraded_indices(results)
+    if todo:
+        raise RuntimeError(f"{len(todo)} of {len(data)} items were not graded by any solver server "
+                           f"after {max_rounds} rounds: {results[todo[0]]['error']}")
+    return results
+
+
+def send_job(socket_path, job, timeout=None):
+    '''Sends one JSON job to the generation daemon and returns its JSON reply, raising on a failed job.'''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(job) + "\n").encode())
+        with sock.makefile("r") as reader:
+            line = reader.readline()
+
+    if not line:
+        raise RuntimeError(f"Generation daemon at {socket_path} closed the connection without a reply.")
+    reply = json.loads(line)
+    if reply.get("status") != "ok":
+        raise RuntimeError(f"Generation daemon job {job.get('op')} failed: {reply.get('error')}")
+    return reply
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Resident generation daemon shared by the question generation and evaluation stages.
+
+`question_generate.py` and `evaluate.py` used to build a fresh `vllm.LLM` per stage and per GPU
+in every iteration of `scripts/main.sh` (weight loading, memory profiling, CUDA graph capture).
+One daemon per GPU keeps its engines instead and runs the stages as jobs sent over a local Unix
+socket (`--daemon_socket` of both scripts).
+
+Engines:
+    One `vllm.LLM` per role, built with `enable_sleep_mode=True` on first use: `questioner` for
+    generate_questions jobs, `solver` for evaluate jobs. Only the engine of the running job is
+    awake. After every job all engines go to level-1 sleep (weights backed up in CPU memory, KV
+    cache freed), so the training stages in between get the GPU back except for vLLM's CUDA
+    context and graphs. A job for a new checkpoint of the same architecture, which is what every
+    R-Zero iteration produces, reloads the weights in place like `FSDPVLLMShardingManager` does
+    (`model.load_weights`) instead of building a new engine; another architecture rebuilds it.
+    Engine options (gpu_mem_util, prefix caching) are those of the job that built the engine.
+
+Protocol: one JSON line per connection, answered with one JSON line; jobs run one at a time.
+    {"op": "generate_questions", "args": {<question_generate.py args>}, "storage_path": ...}
+    {"op": "evaluate", "args": {<evaluate.py args>}, "storage_path": ...}
+    {"op": "generate_chunk", "args": {"model": ..., "num_samples": ...}, "keep_awake": true}
+    {"op": "evaluate_chunk", "args": {<evaluate.py args>}, "questions": [...], "answers": [...], "keep_awake": true}
+    {"op": "status"} | {"op": "sleep"} | {"op": "shutdown"}
+    -> {"status": "ok", "engine": "build" | "reload" | "wake", "timings": {...}, ...}
+       {"status": "error", "error": "..."}
+The chunk ops return their items in the reply instead of files (`question_evaluate/pipeline.py`);
+with `keep_awake` the engine stays awake after the job.
+`timings.startup_s` is what the job waited for its engine; `startup_saved_s` compares it with
+the time the engine took to build.
+
+Usage (`scripts/main.sh` starts one per GPU 4-7 through `generation_daemons.sh`):
+    CUDA_VISIBLE_DEVICES=4 python vllm_service_init/generation_daemon.py --socket /tmp/rzero_gen/gpu4.sock --seed 0 &
+    python question_generate/question_generate.py --model ... --daemon_socket /tmp/rzero_gen/gpu4.sock
+'''
+
+import argparse
+import gc
+import glob
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+import torch
+import vllm
+from transformers import AutoConfig
+
+# 添加项目根目录到Python路径，以便导入各阶段的脚本和 verl.utils.reward_score
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from question_evaluate import evaluate as evaluate_stage
+from question_generate import question_generate as generate_stage
+from verl.utils.reward_score import AnswerVoter, GraderPool, get_grade_cache
+
+# config.json fields that differ between checkpoints of the same architecture
+VOLATILE_CONFIG_KEYS = ('_name_or_path', 'torch_dtype', 'transformers_version', 'use_cache')
+
+
+def model_architecture(model_path):
+    '''The model config without the fields that do not change the weights' layout.'''
+    config = AutoConfig.from_pretrained(model_path, trust_remote_code=True).to_dict()
+    return {key: value for key, value in config.items() if key not in VOLATILE_CONFIG_KEYS}
+
+
+def iter_checkpoint_weights(model_path):
+    '''Yields `(name, tensor)` from the safetensors (or .bin) files of a Hugging Face checkpoint.'''
+    if not os.path.isdir(model_path):
+        from huggingface_hub import snapshot_download
+
+        model_path = snapshot_download(model_path, allow_patterns=['*.safetensors', '*.bin', '*.json'])
+
+    safetensors_files = sorted(glob.glob(os.path.join(model_path, '*.safetensors')))
+    if safetensors_files:
+        from safetensors import safe_open
+
+        for path in safetensors_files:
+            with safe_open(path, framework='pt', device='cpu') as f:
+                for name in f.keys():
+                    yield name, f.get_tensor(name)
+    else:
+        for path in sorted(glob.glob(os.path.join(model_path, '*.bin'))):
+            yield from torch.load(path, map_location='cpu', weights_only=True).items()
+
+
+class ResidentEngine:
+    '''A sleepable `vllm.LLM` and the checkpoint it currently holds.'''
+
+    def __init__(self, model_path, gpu_mem_util, prefix_caching, seed):
+        start = time.time()
+        self.llm = vllm.LLM(
+            model=model_path,
+            tokenizer=model_path,
+            gpu_memory_utilization=gpu_mem_util,
+            seed=seed,
+            trust_remote_code=True,
+            enable_prefix_caching=prefix_caching,
+            enable_sleep_mode=True,
+        )
+        self.build_s = time.time() - start
+        self.model_path = model_path
+        self.architecture = model_architecture(model_path)
+        self.asleep = False
+
+    def sleep(self):
+        if not self.asleep:
+            self.llm.sleep(level=1)
+            torch.cuda.empty_cache()
+            self.asleep = True
+
+    def wake_up(self):
+        if self.asleep:
+            torch.cuda.empty_cache()
+            self.llm.wake_up()
+            self.asleep = False
+
+    def load_checkpoint(self, model_path):
+        '''Replaces the weights in place, waking the weights before the KV cache as the sharding manager does.'''
+        torch.cuda.empty_cache()
+        if self.asleep:
+            self.llm.wake_up(tags=['weights'])
+
+        try:
+            # only the V0 engine exposes the driver worker's model in this process
+            model = self.llm.llm_engine.model_executor.driver_worker.worker.model_runner.model
+        except AttributeError as e:
+            raise RuntimeError(
+                'In-place weight loading needs the vLLM V0 engine, start the daemon with VLLM_USE_V1=0 '
+                '(generation_daemons.sh does).'
+            ) from e
+        model.load_weights(iter_checkpoint_weights(model_path))
+        torch.cuda.empty_cache()
+        if self.asleep:
+            self.llm.wake_up(tags=['kv_cache'])
+            self.asleep = False
+
+        self.llm.reset_prefix_cache()  # cached prefixes were computed with the old weights
+        self.model_path = model_path
+
+    def close(self):
+        from vllm.distributed.parallel_state import destroy_distributed_environment, destroy_model_parallel
+
+        del self.llm
+        destroy_model_parallel()
+        destroy_distributed_environment()
+        gc.collect()
+        torch.cuda.empty_cache()
+
+
+class EngineManager:
+    '''Keeps one resident engine per role, with at most one of them awake.'''
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.engines = {}
+
+    def acquire(self, role, model_path, gpu_mem_util, prefix_caching):
+        '''Returns the awake `vllm.LLM` of `role` holding `model_path`, and how it got there.'''
+        for other_role, engine in self.engines.items():
+            if other_role != role:
+                engine.sleep()
+
+        engine = self.engines.get(role)
+        if engine is not None and engine.model_path != model_path and model_architecture(model_path) != engine.architecture:
+            print(f'[daemon] {role}: {model_path} has another architecture, rebuilding the engine.')
+            engine.close()
+            del self.engines[role]
+            engine = None
+
+        if engine is None:
+            engine = ResidentEngine(model_path, gpu_mem_util, prefix_caching, self.seed)
+            self.engines[role] = engine
+            action = 'build'
+        elif engine.model_path != model_path:
+            engine.load_checkpoint(model_path)
+            action = 'reload'
+        else:
+            engine.wake_up()
+            action = 'wake'
+        return engine, action
+
+    def sleep_all(self):
+        for engine in self.engines.values():
+            engine.sleep()
+
+    def status(self):
+        return {
+            role: {'model': engine.model_path, 'asleep': engine.asleep, 'build_s': round(engine.build_s, 2)}
+            for role, engine in self.engines.items()
+        }
+
+
+class GenerationDaemon:
+    def __init__(self, args):
+        self.args = args
+        self.started = time.time()
+        self.jobs = 0
+        # The grader pool is forked before vLLM initializes CUDA.
+        self.grader_pool = GraderPool(args.grader_workers, timeout=10)
+        self.voter = AnswerVoter(pool=self.grader_pool, timeout=10, cache=get_grade_cache())
+        self.engines = EngineManager(args.seed)
+        self.tokenizers = {}
+
+    def tokenizer(self, model_path):
+        if model_path not in self.tokenizers:
+            self.tokenizers[model_path] = generate_stage.load_tokenizer(model_path)
+        return self.tokenizers[model_path]
+
+    def run(self, job):
+        op = job.get('op')
+        if op == 'status':
+            return {
+                'status': 'ok',
+                'engines': self.engines.status(),
+                'jobs': self.jobs,
+                'uptime_s': round(time.time() - self.started, 1),
+                'grade_cache': self.voter.cache.metrics(),
+                'grader_pool': self.grader_pool.stats(),
+            }
+        if op == 'sleep':
+            self.engines.sleep_all()
+            return {'status': 'ok'}
+        if op not in ('generate_questions', 'evaluate', 'generate_chunk', 'evaluate_chunk'):
+            raise ValueError(f'Unknown op {op!r}.')
+
+        args = argparse.Namespace(**job['args'])
+        storage_path = job.get('storage_path') or os.getenv('STORAGE_PATH')
+        reply = {'status': 'ok'}
+        start = time.time()
+        try:
+            if op in ('generate_questions', 'generate_chunk'):
+                engine, action = self.engines.acquire('questioner', args.model, self.args.gpu_mem_util, True)
+                startup_s = time.time() - start
+                results = generate_stage.generate_questions(engine.llm, self.tokenizer(args.model), args.num_samples)
+                if op == 'generate_questions':
+                    generate_stage.save_questions(results, args, storage_path)
+                else:
+                    reply['items'] = results
+            else:
+                if op == 'evaluate':
+                    loaded = evaluate_stage.load_questions(args, storage_path)
+                    if loaded is None:
+                        return {'status': 'ok', 'questions': 0}
+                else:
+                    loaded = job['questions'], job['answers']
+
+                engine, action = self.engines.acquire('solver', args.model, args.gpu_mem_util, args.prefix_caching == 'on')
+                startup_s = time.time() - start
+                results = evaluate_stage.evaluate_questions(args, engine.llm, self.tokenizer(args.model), self.voter, *loaded)
+                if op == 'evaluate':
+                    evaluate_stage.save_results(args, results, storage_path)
+                else:
+                    reply['items'] = results
+        finally:
+            # chunk jobs of a pipeline keep the engine awake until the pipeline sends "sleep"
+            if self.args.sleep_when_idle and not job.get('keep_awake'):
+                self.engines.sleep_all()
+
+        self.jobs += 1
+        timings = {
+            'startup_s': round(startup_s, 2),
+            'startup_saved_s': round(max(engine.build_s - startup_s, 0.0), 2) if action != 'build' else 0.0,
+            'run_s': round(time.time() - start - startup_s, 2),
+        }
+        print(f'[daemon] {op} {args.model}: engine {action}, {timings}')
+        reply.update(questions=len(results), engine=action, timings=timings)
+        return reply
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            job = json.loads(line)
+            if job.get('op') == 'shutdown':
+                reply = {'status': 'ok'}
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            else:
+                reply = self.server.daemon.run(job)
+        except Exception as e:
+            traceback.print_exc()
+            reply = {'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+        self.wfile.write((json.dumps(reply) + '\n').encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident vLLM generation daemon for question generation and evaluation.')
+    parser.add_argument('--socket', type=str, required=True, help='Path of the Unix socket to listen on.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--gpu_mem_util', type=float, default=0.85,
+                        help='Memory fraction of the questioner engine; evaluate jobs bring their own.')
+    parser.add_argument('--grader_workers', type=int, default=8)
+    parser.add_argument('--sleep_when_idle', type=lambda value: value.lower() == 'true', default=True,
+                        help='Put the engines to sleep after every job so other stages can use the GPU.')
+    args = parser.parse_args()
+
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    os.makedirs(os.path.dirname(os.path.abspath(args.socket)), exist_ok=True)
+
+    server = socketserver.UnixStreamServer(args.socket, JobHandler)
+    server.daemon = GenerationDaemon(args)
+    print(f'[daemon] Listening on {args.socket}.')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.daemon.engines.sleep_all()
+        server.daemon.grader_pool.close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        print('[daemon] Stopped.')
+
+
+if __name__ == '__main__':
+    main()
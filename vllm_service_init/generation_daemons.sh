@@ -0,0 +1,70 @@
+#!/bin/bash
+#
+# 常驻生成服务（generation_daemon.py）的启动 / 停止脚本
+#
+# 每个物理 GPU 4,5,6,7 上启动一个服务，socket 为 $GEN_DAEMON_DIR/gpu<编号>.sock。
+# question_generate.bash 和 evaluate.sh 在设置了 GEN_DAEMON_DIR 时把任务交给这些服务，
+# 模型只在第一次迭代加载，之后的迭代只是换权重 / 唤醒，不再每次重新构建 vLLM 引擎。
+# 服务在任务之间处于 sleep 状态（权重放在 CPU 内存，KV cache 释放），训练阶段可以使用 GPU，
+# 每个 GPU 只保留 CUDA context 和 CUDA graph 占用的少量显存。
+# questioner 训练期间 start.sh 在 GPU 6,7 上启动 solver 服务，服务常驻不停：start.sh 按启动时
+# 实际空闲的显存（已扣除休眠服务的占用）设置 --gpu_mem_util。
+#
+# 用法：
+#   export GEN_DAEMON_DIR=/tmp/rzero_gen
+#   bash vllm_service_init/generation_daemons.sh start
+#   bash vllm_service_init/generation_daemons.sh stop
+#
+
+action=$1
+gpus="4 5 6 7"
+GEN_DAEMON_DIR=${GEN_DAEMON_DIR:-/tmp/rzero_gen}
+export VLLM_DISABLE_COMPILE_CACHE=1
+export VLLM_USE_V1=0
+mkdir -p $GEN_DAEMON_DIR
+
+if [ "$action" == "start" ]; then
+    for g in $gpus; do
+        # seed 与原来每个 GPU 的 --suffix 一致（0..3）
+        CUDA_VISIBLE_DEVICES=$g nohup python vllm_service_init/generation_daemon.py \
+            --socket $GEN_DAEMON_DIR/gpu$g.sock --seed $((g - 4)) > $GEN_DAEMON_DIR/gpu$g.log 2>&1 &
+        echo $! > $GEN_DAEMON_DIR/gpu$g.pid
+    done
+
+    # 等待所有服务开始监听（引擎在第一个任务到达时才构建，这里只需要几秒）
+    for g in $gpus; do
+        for _ in $(seq 1 120); do
+            [ -S $GEN_DAEMON_DIR/gpu$g.sock ] && break
+            sleep 1
+        done
+        if [ ! -S $GEN_DAEMON_DIR/gpu$g.sock ]; then
+            echo "❌ 错误: GPU $g 的生成服务没有启动，见 $GEN_DAEMON_DIR/gpu$g.log"
+            exit 1
+        fi
+    done
+    echo "✓ 生成服务已启动: GPU $gpus"
+elif [ "$action" == "stop" ]; then
+    for g in $gpus; do
+        [ -S $GEN_DAEMON_DIR/gpu$g.sock ] && python -c "
+import sys
+sys.path.insert(0, '.')
+from vllm_service_init.client import send_job
+send_job('$GEN_DAEMON_DIR/gpu$g.sock', {'op': 'shutdown'}, timeout=60)
+"
+    done
+    # 等进程真正退出、显存释放后再返回
+    for g in $gpus; do
+        [ -f $GEN_DAEMON_DIR/gpu$g.pid ] || continue
+        pid=$(cat $GEN_DAEMON_DIR/gpu$g.pid)
+        for _ in $(seq 1 60); do
+            kill -0 $pid 2>/dev/null || break
+            sleep 1
+        done
+        kill -0 $pid 2>/dev/null && kill -9 $pid
+        rm -f $GEN_DAEMON_DIR/gpu$g.pid
+    done
+    echo "✓ 生成服务已停止: GPU $gpus"
+else
+    echo "用法: bash vllm_service_init/generation_daemons.sh start|stop"
+    exit 1
+fi
@@ -10,9 +10,20 @@ export VLLM_USE_V1=0
 # 临时保存父进程的 CUDA_VISIBLE_DEVICES
 PARENT_CUDA_DEVICES=$CUDA_VISIBLE_DEVICES
 
+# vLLM 按总显存的比例（--gpu_mem_util）划本进程的预算，不扣除其他进程已占用的显存。
+# GPU 6,7 上常驻的生成服务（generation_daemons.sh）休眠时仍占着 CUDA context 和 CUDA graph，
+# 所以按启动时实际空闲的显存计算比例：(空闲 - 1 GiB 余量) / 总量，最多 0.9（没有常驻服务时不变）。
+gpu_mem_util() {
+    nvidia-smi --query-gpu=memory.used,memory.total --format=csv,noheader,nounits -i $1 \
+        | awk -F', *' '{ util = ($2 - $1 - 1024) / $2; if (util > 0.9) util = 0.9; printf "%.3f", util }'
+}
+mem_util_6=$(gpu_mem_util 6)
+mem_util_7=$(gpu_mem_util 7)
+echo "solver 服务显存比例: GPU 6 $mem_util_6, GPU 7 $mem_util_7"
+
 # vLLM 服务直接使用物理 GPU 6,7
-CUDA_VISIBLE_DEVICES=6 python vllm_service_init/start_vllm_server.py --port 5000 --model_path $model_path --gpu_mem_util 0.9 &
-CUDA_VISIBLE_DEVICES=7 python vllm_service_init/start_vllm_server.py --port 5001 --model_path $model_path --gpu_mem_util 0.9 &
+CUDA_VISIBLE_DEVICES=6 python vllm_service_init/start_vllm_server.py --port 5000 --model_path $model_path --gpu_mem_util $mem_util_6 --engine async &
+CUDA_VISIBLE_DEVICES=7 python vllm_service_init/start_vllm_server.py --port 5001 --model_path $model_path --gpu_mem_util $mem_util_7 --engine async &
 
 # 恢复父进程的设置
 export CUDA_VISIBLE_DEVICES=$PARENT_CUDA_DEVICES
\ No newline at end of file
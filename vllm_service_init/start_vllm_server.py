@@ -1,30 +1,67 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 '''
-Refactored Version: This script employs the 'stopit' library to apply fine-grained, thread-safe
-timeout control directly to the `grade_answer` function. This approach is more robust than a
-global timeout and avoids the 'signal only works in main thread' error common in multi-threaded
-Flask applications. The comparison logic is optimized to perform cheap checks first.
+Majority voting over the sampled answers goes through `verl.utils.reward_score.AnswerVoter`:
+each boxed answer is canonicalized once, identical canonical forms are bucketed together, and
+the `grade_answer` comparisons between bucket representatives run in a pre-forked `GraderPool`
+(`--grader_workers`) that hard-kills and respawns a grader stuck for more than 10s, so a
+pathological sympy call neither blocks the Flask threads nor other questions.
+Verdicts are shared across runs through the SQLite-backed grade cache (`GRADE_CACHE_PATH`).
 
 Setup Instructions:
-    # 1. Install the required library (note the change from previous versions)
-    pip install stopit
-
-    # 2. Run the server
+    # Run the server
     python your_server_file_name.py --port 5000 --model_path Qwen/Qwen3-4B-Base
+
+Endpoints:
+    POST /generate   Body `{"data": [{"question": ..., "answer": ...}, ...]}`; results are streamed
+                     back as NDJSON lines `{"index": i, "question", "answer", "score", "results"}`.
+    GET  /hello      Legacy file handoff (`?name=<task file on STORAGE_PATH>`), kept as a fallback.
+
+Engines (`--engine`):
+    sync    One blocking `vllm.LLM.generate` call per request; concurrent requests queue up.
+    async   vLLM's `AsyncLLMEngine` runs on a background event loop. Every question of every
+            in-flight request is its own engine request, so concurrent reward calls are merged
+            into one continuously batched engine and each question is graded as soon as its
+            own samples are done.
+
+Prefix caching (`--prefix_caching on|off`, default on): every prompt starts with the same system
+message and the n samples of a question share their whole prompt, so with vLLM's automatic prefix
+caching most prefill tokens are served from the KV cache. `GET /` reports the prefill tokens
+saved; `scripts/benchmark_prefix_caching.py` compares throughput with it on and off.
+
+Wave sampling (`--sampling waves`, off by default): the 10 samples of a question are drawn in
+waves (`--waves 4,2,2,2`) and the question is answered as soon as its score is confidently
+outside [`--keep_min_score`, `--keep_max_score`], see `verl.utils.reward_score.adaptive_sampling`.
+Scores inside the band are unchanged; scores outside it are those of the samples drawn so far.
+With the async engine each question moves on to its next wave on its own. `GET /` reports the
+skipped samples and the GPU-seconds they would have cost.
+
+Idle policies (`--idle_policy`): none | warm (default) | pretokenize | burn, see the "Idle Policy"
+section. `GET /` reports the first-result latency of requests arriving after an idle period so the
+policies can be compared on the same workload.
 '''
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import vllm
 import argparse
+import asyncio
+import contextlib
 import json
 import os
+import queue
 import threading
 import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+import sys
 import torch
 from transformers import AutoTokenizer
-from mathruler.grader import extract_boxed_content, grade_answer
-import stopit  # 1. Import the thread-safe 'stopit' library
+from mathruler.grader import extract_boxed_content
+
+# 添加项目根目录到Python路径，以便导入 verl.utils.reward_score
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from verl.utils.reward_score import AnswerVoter, GraderPool, WaveSampler, get_grade_cache
 
 # ------------------------- Command-Line Arguments ------------------------- #
 # (This section remains unchanged)
@@ -33,20 +70,43 @@ parser.add_argument('--port', type=str, default='5000')
 parser.add_argument('--model_path', type=str, default='Qwen/Qwen3-4B-Base')
 parser.add_argument('--gpu_mem_util', type=float, default=0.9,
                     help='The maximum GPU memory utilization fraction for vLLM.')
+parser.add_argument('--engine', type=str, default='sync', choices=['sync', 'async'],
+                    help='sync: blocking vllm.LLM per request; async: shared continuous-batching AsyncLLMEngine.')
+parser.add_argument('--idle_policy', type=str, default='warm', choices=['none', 'warm', 'pretokenize', 'burn'],
+                    help='What the server does between requests, see the "Idle Policy" section '
+                         '(pretokenize only helps --engine sync).')
+parser.add_argument('--idle_interval', type=float, default=5.0,
+                    help='Seconds without requests after which the server counts as idle.')
+parser.add_argument('--grader_workers', type=int, default=8,
+                    help='Number of processes for the answer-equivalence comparisons.')
+parser.add_argument('--sampling', type=str, default='full', choices=['full', 'waves'],
+                    help='full: draw all n samples at once; waves: draw them in waves and stop questions '
+                         'whose score is confidently outside [--keep_min_score, --keep_max_score].')
+parser.add_argument('--waves', type=str, default='4,2,2,2',
+                    help='Wave sizes for --sampling waves, must add up to the 10 samples per question.')
+parser.add_argument('--keep_min_score', type=float, default=0.25)
+parser.add_argument('--keep_max_score', type=float, default=0.75)
+parser.add_argument('--stop_confidence', type=float, default=0.95,
+                    help='Stop a question once its final score is outside the band with this probability.')
+parser.add_argument('--prefix_caching', type=str, default='on', choices=['on', 'off'],
+                    help='vLLM automatic prefix caching: all prompts share the system message and '
+                         'the n samples of a question share its whole prompt.')
 args = parser.parse_args()
 
 # ------------------------- vLLM Initialization ------------------------ #
-# ---------------------- GPU Idle Utilization Thread Setup ---------------------- #
+# ---------------------- Idle Worker Thread Setup ---------------------- #
 # 初始化事件对象（必须在模型加载前定义）
 stop_event = threading.Event()    # Event to stop the thread globally
 pause_event = threading.Event()   # Event to pause the thread during requests
-pause_event.set()  # 初始化时暂停，避免干扰vLLM的内存分析
+
+# The grader pool is forked before vLLM/CUDA are initialized and before any thread starts.
+grader_pool = GraderPool(args.grader_workers, timeout=10)
+voter = AnswerVoter(pool=grader_pool, timeout=10, cache=get_grade_cache())
 
 # (This section remains unchanged)
 print('[init] Loading model...')
 
 # 检查是本地路径还是远程 repo
-import os
 is_local_path = os.path.exists(args.model_path) and os.path.isdir(args.model_path)
 
 # 加载 tokenizer，如果是本地路径，添加必要参数
@@ -64,12 +124,31 @@ else:
         trust_remote_code=True
     )
 
-model = vllm.LLM(
-    model=args.model_path,
-    tokenizer=args.model_path,
-    gpu_memory_utilization=args.gpu_mem_util,
-    trust_remote_code=True,
-)
+if args.engine == 'async':
+    # The async engine lives on its own event loop thread; Flask worker threads hand their
+    # prompts over with `asyncio.run_coroutine_threadsafe`, so all requests share one batch.
+    engine_loop = asyncio.new_event_loop()
+    threading.Thread(target=engine_loop.run_forever, name='vllm-engine-loop', daemon=True).start()
+
+    async def _build_async_engine():
+        engine_args = vllm.AsyncEngineArgs(
+            model=args.model_path,
+            tokenizer=args.model_path,
+            gpu_memory_utilization=args.gpu_mem_util,
+            trust_remote_code=True,
+            enable_prefix_caching=args.prefix_caching == 'on',
+        )
+        return vllm.AsyncLLMEngine.from_engine_args(engine_args)
+
+    model = asyncio.run_coroutine_threadsafe(_build_async_engine(), engine_loop).result()
+else:
+    model = vllm.LLM(
+        model=args.model_path,
+        tokenizer=args.model_path,
+        gpu_memory_utilization=args.gpu_mem_util,
+        trust_remote_code=True,
+        enable_prefix_caching=args.prefix_caching == 'on',
+    )
 
 sample_params = vllm.SamplingParams(
     max_tokens=4096,
@@ -80,56 +159,408 @@ sample_params = vllm.SamplingParams(
     n=10, # Generate 10 candidate answers for each question
 )
 
-print('[init] Model loaded successfully. Activating GPU idle worker...')
-pause_event.clear()  # 模型加载完成后，启动idle worker
-time.sleep(1)  # 给worker一点时间开始运行
-print('[init] GPU idle worker activated.')
+warm_params = vllm.SamplingParams(max_tokens=1, temperature=0.0)
+
+if args.sampling == 'waves':
+    # Empty answers count in the score denominator here, see `process_single`.
+    wave_sampler = WaveSampler(args.waves, sample_params.n, args.keep_min_score, args.keep_max_score,
+                               args.stop_confidence, count_empty=True)
+    wave_params = []
+    for wave in wave_sampler.waves:
+        params = sample_params.clone()
+        params.n = wave
+        wave_params.append(params)
+else:
+    wave_sampler = None
+print('[init] Model loaded successfully.')
+if args.idle_policy == 'warm' and args.prefix_caching == 'off':
+    print('[init] WARNING: --idle_policy warm keeps the system prompt in the prefix cache, '
+          'which does nothing with --prefix_caching off.')
+
+# ------------------------- Prompt / Grading Helpers ------------------------ #
+SYSTEM_PROMPT = 'Please reason step by step, and put your final answer within \\boxed{}.'
+
+def build_prompts(questions):
+    '''Applies the chat template (or the plain fallback) to a list of questions.'''
+    chats = [
+        [
+            {'role': 'system', 'content': SYSTEM_PROMPT},
+            {'role': 'user',   'content': q}
+        ]
+        for q in questions
+    ]
+    if tokenizer.chat_template:
+        return [
+            tokenizer.apply_chat_template(chat, tokenize=False,
+                                          add_generation_prompt=True, add_special_tokens=True)
+            for chat in chats
+        ]
+    return [
+        'system: ' + chat[0]['content'] + '\n' + 'user: ' + chat[1]['content']
+        for chat in chats
+    ]
+
+def process_single(question, golden_answer, outputs):
+    '''Consolidates and grades the vLLM outputs of a single question, returning a result dictionary.'''
+    results = [extract_boxed_content(out.text) for out in outputs]
+    # Empty answers are skipped by the voter, but still count in the denominator.
+    majority_ans, max_count = voter.vote(results)
+
+    score = max_count / len(results) if results else 0.0
+
+    return {
+        'question': question,
+        'answer':   majority_ans,
+        'score':    score,
+        'results':  results
+    }
+
+class PrefixCacheStats:
+    '''Counts the prompt tokens of answered requests and how many of them hit the prefix cache.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, response):
+        with self.lock:
+            self.requests += 1
+            self.prompt_tokens += len(response.prompt_token_ids or [])
+            self.cached_tokens += response.num_cached_tokens or 0
+
+    def summary(self):
+        with self.lock:
+            return {
+                'enabled': args.prefix_caching == 'on',
+                'requests': self.requests,
+                'prompt_tokens': self.prompt_tokens,
+                'prefill_tokens_saved': self.cached_tokens,
+                'saved_ratio': round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            }
+
+prefix_cache_stats = PrefixCacheStats()
+
+# Serializes the blocking `vllm.LLM.generate` calls (request threads and the warm-up).
+generate_lock = threading.Lock()
+
+async def _generate_one(prompt, sampling_params):
+    '''Submits one prompt to the async engine and returns its final RequestOutput.'''
+    final_output = None
+    async for output in model.generate(prompt, sampling_params, request_id=uuid.uuid4().hex):
+        final_output = output
+    return final_output
+
+def _submit(prompt, sampling_params):
+    '''Hands one prompt to the async engine loop, returning a concurrent future.'''
+    return asyncio.run_coroutine_threadsafe(_generate_one(prompt, sampling_params), engine_loop)
+
+def iter_generate(questions, sampling_params=sample_params):
+    '''
+    Yields `(position, RequestOutput)` for the prompt of each question. With the async engine the
+    outputs arrive in completion order, otherwise in prompt order after one blocking `generate`
+    call. The sync engine encodes the prompts only once it holds `generate_lock`, so questions the
+    idle thread pre-tokenized while this request waited are cache hits.
+    '''
+    if args.engine == 'async':
+        futures = {_submit(prompt, sampling_params): j for j, prompt in enumerate(encode_prompts(questions))}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # Client went away: drop whatever is still queued in the engine.
+            for future in futures:
+                future.cancel()
+    else:
+        with generate_lock:
+            prompts = encode_prompts(questions)
+            outputs = model.generate(prompts, sampling_params=sampling_params, use_tqdm=len(prompts) > 1)
+        yield from enumerate(outputs)
 
-# ---------------------- GPU Idle Utilization Thread ---------------------- #
-# (This section remains unchanged)
-def gpu_idle_worker():
+def iter_samples(questions):
+    '''
+    Yields `(position, outputs)` with the completion outputs of each question. With `--sampling waves`
+    a prompt is sampled wave by wave until `wave_sampler` stops it; with the async engine every
+    question moves on to its next wave by itself, otherwise each wave is one `generate` call.
     '''
-    This worker occupies the GPU with a continuous matrix multiplication loop when idle,
-    preventing potential performance drops from GPU power state changes.
+    if wave_sampler is None:
+        for j, response in iter_generate(questions):
+            prefix_cache_stats.record(response)
+            yield j, response.outputs
+        return
+
+    outputs = [[] for _ in questions]
+
+    def wave_done(j, wave_index, response):
+        '''Adds a finished wave of prompt `j`, returns whether the question is done.'''
+        prefix_cache_stats.record(response)
+        outputs[j].extend(response.outputs)
+        num_drawn = sum(wave_sampler.waves[:wave_index + 1])
+        answer_counts = voter.cluster([extract_boxed_content(out.text) for out in outputs[j]])
+        if wave_sampler.should_stop(answer_counts, num_drawn):
+            wave_sampler.record(num_drawn)
+            return True
+        return False
+
+    if args.engine == 'async':
+        prompts = encode_prompts(questions)
+        pending = {_submit(prompt, wave_params[0]): (j, 0) for j, prompt in enumerate(prompts)}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    j, wave_index = pending.pop(future)
+                    if wave_done(j, wave_index, future.result()):
+                        yield j, outputs[j]
+                    else:
+                        pending[_submit(prompts[j], wave_params[wave_index + 1])] = (j, wave_index + 1)
+        finally:
+            # Client went away: drop whatever is still queued in the engine.
+            for future in pending:
+                future.cancel()
+    else:
+        active = list(range(len(questions)))
+        for wave_index, params in enumerate(wave_params):
+            still_active = []
+            for k, response in iter_generate([questions[j] for j in active], params):
+                if wave_done(active[k], wave_index, response):
+                    yield active[k], outputs[active[k]]
+                else:
+                    still_active.append(active[k])
+            active = still_active
+
+def iter_results(data):
+    '''
+    Runs vLLM over a batch of {question, answer} items and yields `(index, result)` pairs,
+    one per input item, as soon as each question has been graded.
     '''
-    print('[idle_worker] GPU idle worker started (paused until model loaded).')
-    running = True
+    questions = [item.get('question', '') for item in data]
+    answers   = [item.get('answer',   '') for item in data]
+
+    # Invalid items are answered right away, they never reach vLLM.
+    valid_indices = []
+    for i, (q, a) in enumerate(zip(questions, answers)):
+        if q and a:
+            valid_indices.append(i)
+        else:
+            yield i, {'question': q, 'answer': a, 'score': -1, 'results': []}
+    print('[server] Valid questions have been collected.')
+
+    # ---------- vLLM Generation + Results Post-Processing ----------
+    for j, outputs in iter_samples([questions[i] for i in valid_indices]):
+        i = valid_indices[j]
+        q, a = questions[i], answers[i]
+        try:
+            item = process_single(q, a, outputs)
+        except Exception as e:
+            # Catch any other unexpected exceptions from within process_single.
+            print(f'[server] CRITICAL: An unhandled error occurred while processing question: {q}')
+            print(f'[server] Error details: {e}')
+            item = {
+                'question': q,
+                'answer':   a,
+                'score':    -1,
+                'results':  [],
+                'error':    f'unhandled exception in process_single: {str(e)}'
+            }
+        yield i, item
+    print('[server] Generation completed.')
+
+# ---------------------------- Idle Policy ---------------------------- #
+# What the server does between requests (`--idle_policy`):
+#   none         nothing; the GPU is left alone.
+#   warm         every `--idle_interval` seconds of inactivity, run a 1-token generation of the
+#                fixed system-prompt prefix so its KV blocks stay in the prefix cache and the
+#                GPU clocks stay up, without competing with real requests.
+#   pretokenize  incoming batches are handed to the idle thread as soon as they arrive and are
+#                tokenized there while they wait for `generate_lock`, so requests queued behind
+#                a busy `--engine sync` engine reach vLLM as token ids. The async engine has no
+#                such wait (vLLM queues the requests itself), there it only saves repeats.
+#   burn         the legacy 2000x2000 matmul loop, paused (with a cuda sync) around each request.
+# The measured effect is reported as the first-result latency of requests that arrive after
+# at least `--idle_interval` seconds of idleness, see `IdleStats` and the `/` endpoint.
+pretokenize_queue = queue.Queue()
+_token_cache = OrderedDict()      # question -> prompt token ids (LRU)
+_token_cache_lock = threading.Lock()
+TOKEN_CACHE_SIZE = 8192
+
+def _tokenize_questions(questions):
+    '''Returns the prompt token ids of `questions`, tokenizing the ones missing from the LRU token cache.
+
+    The ids are collected while the cache is read, so a batch larger than `TOKEN_CACHE_SIZE` or a
+    concurrent eviction by the idle thread never loses an entry between two lookups.
+    '''
+    ids_by_question, todo = {}, []
+    with _token_cache_lock:
+        for q in questions:
+            if q in ids_by_question:
+                continue
+            if q in _token_cache:
+                _token_cache.move_to_end(q)
+                ids_by_question[q] = _token_cache[q]
+            else:
+                ids_by_question[q] = None
+                todo.append(q)
+    if todo:
+        # Same encoding vLLM applies to a text prompt (`add_special_tokens=True`).
+        token_ids = tokenizer(build_prompts(todo))['input_ids']
+        with _token_cache_lock:
+            for q, ids in zip(todo, token_ids):
+                ids_by_question[q] = ids
+                _token_cache[q] = ids
+                _token_cache.move_to_end(q)
+            while len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    return [ids_by_question[q] for q in questions]
+
+def encode_prompts(questions):
+    '''Returns the vLLM prompts for `questions`, reusing pre-tokenized ids when available.'''
+    if args.idle_policy != 'pretokenize':
+        return build_prompts(questions)
+    # only tokenizes what the idle thread has not already handled
+    return [{'prompt_token_ids': ids} for ids in _tokenize_questions(questions)]
+
+def warm_prefix_cache():
+    '''Runs a 1-token generation of the system-prompt prefix to keep it resident in the cache.'''
+    for _ in iter_generate([''], sampling_params=warm_params):
+        pass
+
+class IdleStats:
+    '''Keeps the first-result latency of requests, split by whether the server was idle before.'''
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.after_idle = deque(maxlen=window)
+        self.busy = deque(maxlen=window)
+        self.idle_actions = 0
+
+    def record(self, idle_gap, latency):
+        with self.lock:
+            if idle_gap >= args.idle_interval:
+                self.after_idle.append(latency)
+                print(f'[idle_stats] policy={args.idle_policy} idle for {idle_gap:.1f}s, '
+                      f'first result after {latency:.2f}s.')
+            else:
+                self.busy.append(latency)
+
+    def summary(self):
+        def describe(latencies):
+            if not latencies:
+                return {'count': 0}
+            ordered = sorted(latencies)
+            return {
+                'count': len(ordered),
+                'mean_s': round(sum(ordered) / len(ordered), 4),
+                'p50_s': round(ordered[len(ordered) // 2], 4),
+                'max_s': round(ordered[-1], 4),
+            }
+
+        with self.lock:
+            return {
+                'policy': args.idle_policy,
+                'idle_actions': self.idle_actions,
+                'first_result_latency_after_idle': describe(self.after_idle),
+                'first_result_latency_busy': describe(self.busy),
+            }
+
+idle_stats = IdleStats()
+
+def idle_worker():
+    '''Background thread that runs the selected idle policy.'''
+    print(f'[idle_worker] Started with policy "{args.idle_policy}".')
+    last_warm = 0.0
     while not stop_event.is_set():
+        if args.idle_policy == 'pretokenize':
+            # Runs even while requests are in flight: that is exactly when batches queue up.
+            try:
+                questions = pretokenize_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            _tokenize_questions(questions)
+            with idle_stats.lock:
+                idle_stats.idle_actions += 1
+            continue
+
         if pause_event.is_set():
-            if running:
-                print('[idle_worker] Paused.')
-                running = False
-            time.sleep(0.1) # Sleep briefly while paused
+            time.sleep(0.1)  # Sleep briefly while requests are running
             continue
-        else:
-            if not running:
-                print('[idle_worker] Resumed.')
-                running = True
+
         try:
-            # A simple but effective way to keep the GPU busy
-            a = torch.rand((2000, 2000), dtype=torch.float32, device='cuda')
-            b = torch.rand((2000, 2000), dtype=torch.float32, device='cuda')
-            torch.matmul(a, b)
-            torch.cuda.synchronize()
+            if args.idle_policy == 'warm':
+                now = time.time()
+                if now - max(last_request_end, last_warm) >= args.idle_interval:
+                    warm_prefix_cache()
+                    last_warm = time.time()
+                    with idle_stats.lock:
+                        idle_stats.idle_actions += 1
+                time.sleep(0.1)
+            elif args.idle_policy == 'burn':
+                # A simple but effective way to keep the GPU busy
+                a = torch.rand((2000, 2000), dtype=torch.float32, device='cuda')
+                b = torch.rand((2000, 2000), dtype=torch.float32, device='cuda')
+                torch.matmul(a, b)
+                torch.cuda.synchronize()
         except RuntimeError as e:
             print(f'[idle_worker] Caught a RuntimeError: {e}. Sleeping for 1s...')
             time.sleep(1)
-    print('[idle_worker] GPU idle worker stopped.')
-
-idle_thread = threading.Thread(target=gpu_idle_worker, daemon=True)
-idle_thread.start()
-
-# ------------------------ Timeout Utility (Refactored) --------------------------- #
-# 2. Use the 'stopit.threading_timeoutable' decorator for thread-safe timeouts.
-#    It returns a default value on timeout instead of raising an exception.
-@stopit.threading_timeoutable(default='TIMED_OUT')
-def grade_answer_with_timeout(res1, res2):
-    """
-    This wrapper applies a timeout to each individual `grade_answer` call.
-    If the function's execution exceeds the specified timeout, it will return 'TIMED_OUT'.
-    The timeout duration is passed as a keyword argument during the function call.
-    """
-    return grade_answer(res1, res2)
+    print('[idle_worker] Idle worker stopped.')
+
+# With several requests in flight (always the case for `--engine async`), the idle worker must
+# stay paused until the last of them is done, not just the first one.
+_inflight_lock = threading.Lock()
+_inflight_requests = 0
+last_request_end = time.time()
+busy_seconds = 0.0  # time with at least one request in flight, i.e. GPU time spent on requests
+_busy_since = 0.0
+
+@contextlib.contextmanager
+def idle_worker_paused():
+    '''Pauses the idle worker for the duration of a request and yields the preceding idle time.'''
+    global _inflight_requests, last_request_end, busy_seconds, _busy_since
+    with _inflight_lock:
+        _inflight_requests += 1
+        idle_gap = time.time() - last_request_end if _inflight_requests == 1 else 0.0
+        if _inflight_requests == 1:
+            _busy_since = time.time()
+            pause_event.set()
+            if args.idle_policy == 'burn':
+                torch.cuda.synchronize()  # only the matmul loop has GPU work to drain
+    try:
+        yield idle_gap
+    finally:
+        with _inflight_lock:
+            _inflight_requests -= 1
+            if _inflight_requests == 0:
+                busy_seconds += time.time() - _busy_since
+                last_request_end = time.time()
+                pause_event.clear()
+
+def serve_results(data):
+    '''`iter_results` wrapped with idle-worker pausing and first-result latency bookkeeping.'''
+    if args.idle_policy == 'pretokenize':
+        pretokenize_queue.put([item.get('question', '') for item in data if item.get('question')])
+    start = time.time()
+    with idle_worker_paused() as idle_gap:
+        recorded = False
+        for i, item in iter_results(data):
+            if not recorded and item['results']:
+                idle_stats.record(idle_gap, time.time() - start)
+                recorded = True
+            yield i, item
+
+if args.idle_policy != 'none':
+    idle_thread = threading.Thread(target=idle_worker, daemon=True)
+    idle_thread.start()
+else:
+    idle_thread = None
+
+def sampling_summary():
+    '''Wave sampling counters, with the GPU-seconds saved estimated from the busy time per drawn sample.'''
+    if wave_sampler is None:
+        return {'mode': 'full'}
+    seconds_per_sample = busy_seconds / wave_sampler.samples_drawn if wave_sampler.samples_drawn else None
+    return {'mode': 'waves', **wave_sampler.metrics(seconds_per_sample=seconds_per_sample)}
 
 # ---------------------------- Flask Application --------------------------- #
 app = Flask(__name__)
@@ -141,17 +572,35 @@ def index():
         'status': 'ok',
         'message': 'vLLM服务运行中',
         'model': args.model_path,
-        'endpoint': '/hello?name=<任务文件路径>'
+        'engine': args.engine,
+        'idle': idle_stats.summary(),
+        'prefix_cache': prefix_cache_stats.summary(),
+        'sampling': sampling_summary(),
+        'grade_cache': voter.cache.metrics(),
+        'grader_pool': grader_pool.stats(),
+        'endpoint': 'POST /generate (NDJSON), GET /hello?name=<任务文件路径> (fallback)'
     })
 
-@app.route('/hello', methods=['GET'])
-def hello():
-    '''The main processing endpoint: reads a task file, invokes vLLM, consolidates answers, and writes results.'''
+@app.route('/generate', methods=['POST'])
+def generate():
+    '''
+    Streaming endpoint: the batch is posted as `{"data": [{question, answer}, ...]}` and the
+    results are streamed back as NDJSON, one line per question in completion order. Each line
+    carries the `index` of its item in the request so the caller can restore the order.
+    '''
+    data = request.get_json(force=True)['data']
+    print(f'[server] Received streaming request with {len(data)} items.')
+
+    def stream():
+        for i, item in serve_results(data):
+            yield json.dumps({'index': i, **item}) + '\n'
+        print(f'[server] Streamed {len(data)} results.')
 
-    # --- Pause the GPU idle worker to free up resources ---
-    pause_event.set()
-    torch.cuda.synchronize()
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
 
+@app.route('/hello', methods=['GET'])
+def hello():
+    '''File-based fallback: reads a task file, invokes vLLM, consolidates answers, and writes results.'''
     name = request.args.get('name', 'None')
     print(f'[server] Received request for task file: {name}')
 
@@ -160,137 +609,16 @@ def hello():
         data = json.load(f)
     os.remove(name)
 
-    questions = [item.get('question', '') for item in data]
-    answers   = [item.get('answer',   '') for item in data]
-
-    # (Data preparation logic remains unchanged)
-    valid_indices, valid_questions, valid_answers, valid_chats = [], [], [], []
-    for i, (q, a) in enumerate(zip(questions, answers)):
-        if q and a:
-            valid_indices.append(i)
-            valid_questions.append(q)
-            valid_answers.append(a)
-            valid_chats.append([
-                {'role': 'system', 'content': 'Please reason step by step, and put your final answer within \\boxed{}.'},
-                {'role': 'user',   'content': q}
-            ])
-    print('[server] Valid chat prompts have been prepared.')
-
-    # ---------- vLLM Generation ----------
-    # (vLLM generation logic remains unchanged)
-    if valid_chats:
-        if tokenizer.chat_template:
-            prompts = [
-                tokenizer.apply_chat_template(chat, tokenize=False,
-                                              add_generation_prompt=True, add_special_tokens=True)
-                for chat in valid_chats
-            ]
-        else:
-            prompts = [
-                'system: ' + chat[0]['content'] + '\n' + 'user: ' + chat[1]['content']
-                for chat in valid_chats
-            ]
-        responses = model.generate(prompts, sampling_params=sample_params, use_tqdm=True)
-    else:
-        responses = []
-    print('[server] Generation completed.')
-
-    # ---------- Results Post-Processing (Core Refactoring & Optimization Here) ----------
-    def process_single(question, golden_answer, response):
-        '''Consolidates and grades vLLM outputs for a single question, returning a result dictionary.'''
-        results = [extract_boxed_content(out.text) for out in response.outputs]
-        # print(f"[process_single] Processing question: '{question[:70]}...'")
-
-        answer_counts = {}
-        for res in results:
-            if not res: continue # Skip empty results
-            matched = False
-            
-            for exist_ans in list(answer_counts.keys()):
-                # 3. OPTIMIZATION: Perform cheap comparisons first to avoid expensive calls.
-                if res == exist_ans or ('no ' in res.lower() and 'no ' in exist_ans.lower()):
-                    answer_counts[exist_ans] += 1
-                    matched = True
-                    break # Match found, break from the inner loop over exist_ans
-                
-                # 4. If cheap checks fail, proceed to the expensive, timed grade_answer calls.
-                try:
-                    is_match = False
-                    # First direction: res vs exist_ans
-                    match_result_1 = grade_answer_with_timeout(res, exist_ans, timeout=10)
-                    if match_result_1 == 'TIMED_OUT':
-                        print(f"      [grader] TIMEOUT comparing '{res[:30]}...' with '{exist_ans[:30]}...'.")
-                    elif match_result_1:
-                        is_match = True
-
-                    # Second direction (only if first failed): exist_ans vs res
-                    if not is_match:
-                        match_result_2 = grade_answer_with_timeout(exist_ans, res, timeout=10)
-                        if match_result_2 == 'TIMED_OUT':
-                             # Log timeout for the second direction as well
-                            print(f"      [grader] TIMEOUT comparing '{exist_ans[:30]}...' with '{res[:30]}...'. Skipping pair.")
-                        elif match_result_2:
-                            is_match = True
-                    
-                    if is_match:
-                        answer_counts[exist_ans] += 1
-                        matched = True
-                        break # Match found, break from the inner loop
-
-                except Exception as e:
-                    # Catch any other potential errors from the grader function itself.
-                    print(f"      [grader] ERROR comparing '{res[:30]}...' with '{exist_ans[:30]}...': {e}. Skipping.")
-                    continue # Continue to the next comparison in the inner loop
-            
-            if not matched:
-                answer_counts[res] = 1
-
-        if not answer_counts:
-            majority_ans, max_count = '', 0
-        else:
-            majority_ans = max(answer_counts, key=answer_counts.get)
-            max_count = answer_counts[majority_ans]
-
-        score = max_count / len(results) if results else 0.0
-
-        return {
-            'question': question,
-            'answer':   majority_ans,
-            'score':    score,
-            'results':  results
-        }
-
-    results_all = []
-    response_idx = 0
-    for q, a in zip(questions, answers):
-        try:
-            if q and a:
-                response = responses[response_idx]
-                response_idx += 1
-                item = process_single(q, a, response)
-                results_all.append(item)
-            else:
-                results_all.append({'question': q, 'answer': a, 'score': -1, 'results': []})
-        except Exception as e:
-            # Catch any other unexpected exceptions from within process_single.
-            print(f'[server] CRITICAL: An unhandled error occurred while processing question: {q}')
-            print(f'[server] Error details: {e}')
-            results_all.append({
-                'question': q,
-                'answer':   a,
-                'score':    -1,
-                'results':  [],
-                'error':    f'unhandled exception in process_single: {str(e)}'
-            })
+    results_all = [None] * len(data)
+    for i, item in serve_results(data):
+        results_all[i] = item
     print('[server] All results have been processed.')
 
     out_path = name.replace('.json', '_results.json')
     with open(out_path, 'w') as f:
         json.dump(results_all, f, indent=4)
 
-    # --- Resume the GPU idle worker ---
-    pause_event.clear()
-    print(f'[server] Processed {name}, results saved to {out_path}. Resuming idle worker.')
+    print(f'[server] Processed {name}, results saved to {out_path}.')
     return jsonify({'message': f'Processed {name}, results saved to {out_path}.'})
 
 # ------------------------- Main Application Entrypoint --------------------------- #
@@ -301,5 +629,7 @@ if __name__ == '__main__':
     finally:
         # Gracefully shut down the background thread on exit
         stop_event.set()
-        idle_thread.join()
+        if idle_thread is not None:
+            idle_thread.join()
+        grader_pool.close()
         print('[main] Application shutdown complete.')
\ No newline at end of file